@@ -9,4 +9,9 @@ CREATE USER 'monkeymahjong'@'%' IDENTIFIED BY 'monkeymahjong1324~';
 GRANT ALL ON monkeymahjong.* TO 'monkeymahjong'@'%';
 FLUSH PRIVILEGES;
 
-EXIT;
\ No newline at end of file
+EXIT;
+
+-- # 테이블/인덱스
+-- 봇이 시작할 때(setup_hook) service/app.py 의 MIGRATIONS 를 순서대로 적용함. 적용 이력: schema_migrations.
+-- 이전에 이 파일로 직접 만든 테이블/열/인덱스는 "이미 있음"으로 처리되어 그대로 사용됨.
+-- 누적 순위표(player_standings)를 새로 만든 경우 같은 시작 과정에서 한 번 재계산됨.
@@ -1,31 +1,106 @@
 # app.py  (전체 코드)
 
 import os
-from typing import List, Tuple, Dict, Any, Iterable
-from collections import defaultdict
-from datetime import datetime, timezone
+import re
+import json
+import mmap
+import time
+import bisect
+import hashlib
+import asyncio
+import inspect
+import logging
+import functools
+import itertools
+import contextvars
+import multiprocessing
+from array import array
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Tuple, Dict, Any, Iterable, Callable, Awaitable, Hashable, AsyncIterator
+from collections import defaultdict, OrderedDict
+from datetime import datetime, timezone, timedelta
 
 import aiomysql  # pip install aiomysql python-dotenv discord.py
 import discord
+from aiohttp import web  # discord.py 의존성
 from discord import app_commands
 from discord.ui import View, Select, Modal, TextInput, Button
 from dotenv import load_dotenv
 
+try:
+    import numpy as np  # 배치 순위 엔진(선택). 없으면 파이썬 경로 사용
+except ImportError:  # pragma: no cover
+    np = None
+
 # ── ENV ────────────────────────────────────────────────────────────────────────
 load_dotenv()
 BOT_TOKEN = os.getenv("DISCORD_BOT_TOKEN")
+# 길드 설정(guild_config, /마장 설정)이 없는 길드의 기본값
 ROLE_NAME = os.getenv("DISCORD_ROLE_NAME", "게임")
 CHANNEL_ID = int(os.getenv("DISCORD_CHANNEL_ID", "0"))
+# 단일 길드 시절 기록(guild_id=0)을 넘겨받을 길드. 시작 시 한 번 옮김 (0 이면 안 함).
+# 길드 지원 이전 DB 를 올릴 때 필수: 설정하지 않으면 기존 기록이 어느 길드에도 보이지 않음(삭제되지는 않음)
+LEGACY_GUILD_ID = int(os.getenv("LEGACY_GUILD_ID", "0"))
 PAGE_SIZE = int(os.getenv("DISCORD_SELECT_PAGE_SIZE", "25"))
+STREAM_CHUNK = int(os.getenv("DB_STREAM_CHUNK", "2000"))  # 서버측 커서 fetchmany 크기
+RANK_ENGINE = os.getenv("RANK_ENGINE", "numpy")           # numpy | python
+
+# 기간 순위용 누적 스냅샷: SNAPSHOT_PERIOD_SEC 마다, 마지막 스냅샷 이후 SNAPSHOT_MIN_GAMES 판 이상이면 생성.
+# 진행 중인 트랜잭션과 겹치지 않도록 SNAPSHOT_LAG_SEC 이전 게임까지만 포함.
+SNAPSHOT_PERIOD_SEC = int(os.getenv("SNAPSHOT_PERIOD_SEC", "3600"))
+SNAPSHOT_MIN_GAMES = int(os.getenv("SNAPSHOT_MIN_GAMES", "200"))
+SNAPSHOT_LAG_SEC = int(os.getenv("SNAPSHOT_LAG_SEC", "300"))
+# 시즌: "이름=YYYY-MM-DD~YYYY-MM-DD;..." (종료일 미포함)
+SEASONS_SPEC = os.getenv("SEASONS", "")
+
+# 레이팅(다인 Elo): 시작값, K, 체크포인트 간격(game_id 기준)
+RATING_INITIAL = float(os.getenv("RATING_INITIAL", "1500"))
+RATING_K = float(os.getenv("RATING_K", "32"))
+RATING_CHECKPOINT_GAMES = int(os.getenv("RATING_CHECKPOINT_GAMES", "500"))
+RATING_REPLAY_ATTEMPTS = int(os.getenv("RATING_REPLAY_ATTEMPTS", "3"))  # 잠금 없는 재계산 시도 횟수(마지막은 잠금)
+
+# 메트릭 엔드포인트 (포트 0 이면 끔)
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))
+
+GAME_LRU_SIZE = int(os.getenv("GAME_LRU_SIZE", "256"))  # 수정 버튼용 최근 게임 캐시 크기
+
+# CPU 작업(순위 집계/누적표 재계산/레이팅 재생) 프로세스 수. 0 이면 이벤트 루프에서 직접 실행
+STATS_WORKERS = int(os.getenv("STATS_WORKERS", "2"))
+# 이벤트 루프 지연 감시: LOOP_LAG_INTERVAL_SEC 마다 깨어나 늦은 만큼 기록, LOOP_LAG_WARN_SEC 초과 시 경고
+LOOP_LAG_INTERVAL_SEC = float(os.getenv("LOOP_LAG_INTERVAL_SEC", "0.5"))
+LOOP_LAG_WARN_SEC = float(os.getenv("LOOP_LAG_WARN_SEC", "0.25"))
+
+# 공개 메시지 편집/삭제/알림을 메시지 단위로 모아 보내는 대기 시간(초). 창 안의 갱신은 마지막 상태로 합쳐짐
+EDIT_DEBOUNCE_SEC = float(os.getenv("DISCORD_EDIT_DEBOUNCE_SEC", "1.0"))
+
+# 로컬 상태 파일(저널, 컬럼 스냅샷, 명령 해시) 기본 위치. 컨테이너에서는 볼륨으로 마운트 (docker-compose.yml)
+DATA_DIR = os.getenv("DATA_DIR", "data")
+
+# game_detail 컬럼 스냅샷(mmap) 디렉터리. 빈 값이면 끔
+HISTORY_DIR = os.getenv("HISTORY_DIR", os.path.join(DATA_DIR, "history"))
+
+# 점수 입력 저널: 로컬 파일에 fsync 후 즉시 응답, DB 반영은 백그라운드에서 WRITE_BATCH 판씩.
+# 미커밋 항목은 이 파일에만 있으므로 컨테이너를 다시 만들어도 남는 위치여야 함
+JOURNAL_PATH = os.getenv("SCORE_JOURNAL", os.path.join(DATA_DIR, "score_journal.jsonl"))
+WRITE_BATCH = int(os.getenv("WRITE_BATCH", "50"))
+WRITE_RETRY_MAX_SEC = int(os.getenv("WRITE_RETRY_MAX_SEC", "30"))
 
 DB_HOST = os.getenv("DB_HOST", "127.0.0.1")
 DB_PORT = int(os.getenv("DB_PORT", "3306"))
 DB_USER = os.getenv("DB_USER", "monkeymahjong")
 DB_PASSWORD = os.getenv("DB_PASSWORD", "monkeymahjong1324~")
 DB_NAME = os.getenv("DB_NAME", "monkeymahjong")
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "5"))
+DB_POOL_PREWARM = int(os.getenv("DB_POOL_PREWARM", "3"))  # 시작 시 미리 열어 두는 연결 수 (= 풀 최소 크기)
+
+# 슬래시 명령 정의 해시 저장 위치. 해시가 같으면 재시작 시 tree.sync()(전역 API, 레이트 리밋) 생략
+COMMAND_HASH_PATH = os.getenv("COMMAND_HASH_PATH", os.path.join(DATA_DIR, "command_tree.sha256"))
+COMMAND_SYNC_FORCE = os.getenv("COMMAND_SYNC_FORCE", "0") == "1"
 
-if not BOT_TOKEN or CHANNEL_ID == 0:
-    raise RuntimeError("DISCORD_BOT_TOKEN / DISCORD_CHANNEL_ID 필요")
+log = logging.getLogger("monkeymahjong")
 
 # ── 마작 점수 상수 ────────────────────────────────────────────────────────────
 START_POINTS = 25_000                   # 시작 점수
@@ -35,60 +110,2113 @@ POS_LABEL = {0: "동", 1: "서", 2: "남", 3: "북"}
 # 동점 타이브레이크: ESWN(동(0)→남(2)→서(1)→북(3)) 우선
 TIEBREAK_ESWN = {0: 0, 2: 1, 1: 2, 3: 3}
 
-def rank_sort_key(score: int, pos: int) -> Tuple[int, int]:
-    """점수 내림차순, 동점 시 ESWN 우선순위."""
-    return (-score, TIEBREAK_ESWN[pos])
+def rank_sort_key(score: int, pos: int) -> Tuple[int, int]:
+    """점수 내림차순, 동점 시 ESWN 우선순위."""
+    return (-score, TIEBREAK_ESWN[pos])
+
+class ScoreRules:
+    """길드별 점수 규칙: 시작 점수(4인 합계 = 4배)와 순위별 우마. 기본값은 위 상수."""
+    __slots__ = ("start_points", "uma", "_formula")
+
+    def __init__(self, start_points: int = START_POINTS, uma: Dict[int, int] | None = None):
+        self.start_points = int(start_points)
+        self.uma = dict(uma or UMA_BY_RANK)
+        umas = ", ".join(f"{r}위{self.uma[r]:+d}" for r in (1, 2, 3, 4))
+        self._formula = f"((종료점수-{self.start_points:,})/1,000)+우마 [{umas}]"
+
+    @property
+    def target_total(self) -> int:
+        return 4 * self.start_points
+
+    def points(self, end_points: int, rank: int) -> float:
+        return (end_points - self.start_points) / 1000.0 + self.uma[rank]
+
+    def total(self, games: int, score_sum: int, rank_counts: Iterable[int]) -> float:
+        uma = sum(self.uma[r] * n for r, n in zip((1, 2, 3, 4), rank_counts))
+        return (score_sum - self.start_points * games) / 1000.0 + uma
+
+    def formula(self) -> str:
+        return self._formula
+
+DEFAULT_RULES = ScoreRules()
+
+def calc_hanchan_points(end_points: int, rank: int, rules: ScoreRules = DEFAULT_RULES) -> float:
+    """
+    리치 마작 대회 점수(반장 포인트):
+    ((종료점수 - 시작점수) / 1,000) + 우마(rank). 기본 25,000 / 1위 +15, 2위 +5, 3위 -5, 4위 -15.
+    """
+    return rules.points(end_points, rank)
+
+def validate_seats(seats: List[Tuple[int, int]], target_total: int = TARGET_TOTAL) -> None:
+    """
+    좌석 순서(position 0~3)의 (user_id, 원점수) 검증. 위반 시 ValueError(사용자용 메시지).
+    점수 입력/수정 모달과 일괄 입력(history.py)이 같은 규칙 사용.
+    """
+    if len(seats) != 4:
+        raise ValueError(f"좌석 {len(seats)}개. 4명이어야 합니다.")
+    if len({u for u, _ in seats}) != 4:
+        raise ValueError("같은 사용자가 두 좌석에 있습니다.")
+    total = sum(sc for _, sc in seats)
+    if total != target_total:
+        raise ValueError(f"총합 {total}. {target_total}이어야 합니다.")
+
+def mention(uid: int) -> str:
+    return f"<@{uid}>"
+
+# ── 메트릭 ────────────────────────────────────────────────────────────────────
+# 명령/버튼/모달 지연, DB 호출·쿼리 시간, 풀 대기, 읽은 행 수, 오류 수.
+# Prometheus 텍스트 형식으로 METRICS_HOST:METRICS_PORT/metrics 에 노출, 요약은 /마장 상태.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+_db_call: contextvars.ContextVar[str | None] = contextvars.ContextVar("mm_db_call", default=None)
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # 마지막 = +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, v: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, v)] += 1
+        self.sum += v
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """버킷 상한 기준 근사 분위수."""
+        if not self.count:
+            return 0.0
+        need, acc = q * self.count, 0
+        for i, c in enumerate(self.counts):
+            acc += c
+            if acc >= need:
+                return self.buckets[i] if i < len(self.buckets) else float("inf")
+        return float("inf")
+
+LabelKey = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+class Metrics:
+    def __init__(self):
+        self.histograms: Dict[LabelKey, Histogram] = {}
+        self.counters: Dict[LabelKey, float] = defaultdict(float)
+        self._collectors: List[Callable[[], Iterable[Tuple[str, Dict[str, str], float]]]] = []
+
+    @staticmethod
+    def _key(name: str, labels: Dict[str, Any]) -> LabelKey:
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def observe(self, name: str, value: float, **labels: Any) -> None:
+        key = self._key(name, labels)
+        h = self.histograms.get(key)
+        if h is None:
+            h = self.histograms[key] = Histogram()
+        h.observe(value)
+
+    def inc(self, name: str, value: float = 1, **labels: Any) -> None:
+        self.counters[self._key(name, labels)] += value
+
+    def add_collector(self, fn: Callable[[], Iterable[Tuple[str, Dict[str, str], float]]]) -> None:
+        """render 시점에 (이름, 라벨, 값) 게이지를 돌려주는 함수 등록."""
+        self._collectors.append(fn)
+
+    @contextmanager
+    def timer(self, name: str, **labels: Any):
+        """구간 시간을 name 히스토그램에 기록. 예외 시 mm_errors_total{kind=name} 증가."""
+        t0 = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.inc("mm_errors_total", kind=name, **labels)
+            raise
+        finally:
+            self.observe(name, time.perf_counter() - t0, **labels)
+
+    @contextmanager
+    def db_call(self, call: str):
+        """DB 함수 단위 시간 기록 + 그 안의 쿼리에 call 라벨 부여."""
+        token = _db_call.set(call)
+        try:
+            with self.timer("mm_db_call_seconds", call=call):
+                yield
+        finally:
+            _db_call.reset(token)
+
+    def render(self) -> str:
+        """Prometheus 텍스트 노출 형식."""
+        def fmt(labels: Iterable[Tuple[str, str]]) -> str:
+            esc = lambda v: v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+            body = ",".join(f'{k}="{esc(v)}"' for k, v in labels)
+            return "{" + body + "}" if body else ""
+
+        lines: List[str] = []
+        typed: set = set()
+        for (name, labels), h in sorted(self.histograms.items()):
+            if name not in typed:
+                lines.append(f"# TYPE {name} histogram")
+                typed.add(name)
+            acc = 0
+            for le, c in zip([*map(str, h.buckets), "+Inf"], h.counts):
+                acc += c
+                lines.append(f"{name}_bucket{fmt((*labels, ('le', le)))} {acc}")
+            lines.append(f"{name}_sum{fmt(labels)} {h.sum}")
+            lines.append(f"{name}_count{fmt(labels)} {h.count}")
+        for (name, labels), v in sorted(self.counters.items()):
+            if name not in typed:
+                lines.append(f"# TYPE {name} counter")
+                typed.add(name)
+            lines.append(f"{name}{fmt(labels)} {v}")
+        for fn in self._collectors:
+            for name, labels, v in fn():
+                if name not in typed:
+                    lines.append(f"# TYPE {name} gauge")
+                    typed.add(name)
+                lines.append(f"{name}{fmt(sorted(labels.items()))} {v}")
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
+
+def metered(call: str):
+    """DB 함수 데코레이터: metrics.db_call(call) 로 감쌈. 비동기 제너레이터는 전체 소비 시간 기록."""
+    def deco(fn):
+        if inspect.isasyncgenfunction(fn):
+            @functools.wraps(fn)
+            async def agen(*args, **kwargs):
+                with metrics.timer("mm_db_call_seconds", call=call):
+                    async for item in fn(*args, **kwargs):
+                        yield item
+            return agen
+
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            with metrics.db_call(call):
+                return await fn(*args, **kwargs)
+        return wrapper
+    return deco
+
+def _sql_label(sql: str) -> str:
+    """쿼리 라벨 기본값: 'SELECT game_detail' 처럼 동사 + 첫 테이블."""
+    words = sql.split()
+    verb = words[0].upper() if words else "?"
+    for i, w in enumerate(words[:-1]):
+        if w.upper() in ("FROM", "INTO", "UPDATE"):
+            return f"{verb} {words[i + 1]}"
+    return verb
+
+class _MeteredCursor:
+    """aiomysql 커서 프록시: 쿼리 시간과 읽은 행 수 기록."""
+    def __init__(self, cur: Any):
+        self._cur = cur
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._cur, name)
+
+    def _label(self, sql: str) -> str:
+        return _db_call.get() or _sql_label(sql)
+
+    async def execute(self, sql: str, args: Any = None) -> int:
+        with metrics.timer("mm_db_query_seconds", call=self._label(sql)):
+            return await self._cur.execute(sql, args)
+
+    async def executemany(self, sql: str, args: Any) -> int:
+        with metrics.timer("mm_db_query_seconds", call=self._label(sql)):
+            return await self._cur.executemany(sql, args)
+
+    def _rows(self, n: int) -> None:
+        if n:
+            metrics.inc("mm_db_rows_read_total", n, call=_db_call.get() or "other")
+
+    async def fetchone(self) -> Any:
+        row = await self._cur.fetchone()
+        self._rows(row is not None)
+        return row
+
+    async def fetchmany(self, size: int | None = None) -> Any:
+        rows = await self._cur.fetchmany(size)
+        self._rows(len(rows))
+        return rows
+
+    async def fetchall(self) -> Any:
+        rows = await self._cur.fetchall()
+        self._rows(len(rows))
+        return rows
+
+class _MeteredConnection:
+    def __init__(self, conn: Any):
+        self._conn = conn
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._conn, name)
+
+    def cursor(self, *cursors: Any) -> "_MeteredCursorContext":
+        return _MeteredCursorContext(self._conn.cursor(*cursors))
+
+class _MeteredCursorContext:
+    """conn.cursor() 결과처럼 await / async with 둘 다 지원."""
+    def __init__(self, ctx: Any):
+        self._ctx = ctx
+        self._cur: _MeteredCursor | None = None
+
+    def __await__(self):
+        return self._wrap().__await__()
+
+    async def _wrap(self) -> _MeteredCursor:
+        self._cur = _MeteredCursor(await self._ctx)
+        return self._cur
+
+    async def __aenter__(self) -> _MeteredCursor:
+        return await self._wrap()
+
+    async def __aexit__(self, *exc):
+        if self._cur is not None:
+            await self._cur.close()
+
+class MeteredPool:
+    """aiomysql.Pool 래퍼: acquire 대기 시간/대기 중 요청 수 기록. 나머지 속성은 원본 위임."""
+    def __init__(self, pool: aiomysql.Pool):
+        self._pool = pool
+        self.waiting = 0
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._pool, name)
+
+    def acquire(self) -> "_MeteredAcquire":
+        return _MeteredAcquire(self)
+
+class _MeteredAcquire:
+    def __init__(self, owner: MeteredPool):
+        self._owner = owner
+        self._conn: Any = None
+
+    async def __aenter__(self) -> _MeteredConnection:
+        owner = self._owner
+        owner.waiting += 1
+        t0 = time.perf_counter()
+        try:
+            self._conn = await owner._pool.acquire()
+        except Exception:
+            metrics.inc("mm_errors_total", kind="mm_db_pool_acquire")
+            raise
+        finally:
+            owner.waiting -= 1
+            metrics.observe("mm_db_pool_wait_seconds", time.perf_counter() - t0)
+        return _MeteredConnection(self._conn)
+
+    async def __aexit__(self, *exc):
+        await self._owner._pool.release(self._conn)
+        return False
+
+async def start_metrics_server(host: str, port: int):
+    """GET /metrics -> metrics.render(). return: aiohttp AppRunner (종료 시 cleanup)"""
+    async def handle(_request: web.Request) -> web.Response:
+        return web.Response(text=metrics.render(), content_type="text/plain", charset="utf-8")
+
+    web_app = web.Application()
+    web_app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(web_app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+# ── CPU 작업 오프로드 / 이벤트 루프 지연 ──────────────────────────────────────
+class StatsExecutor:
+    """
+    CPU 작업을 프로세스 풀에서 실행: 재계산 중에도 게이트웨이 하트비트와 다른 상호작용이 멈추지 않음.
+      - 인자/결과는 피클로 복사되므로 행은 튜플 목록 대신 array('q') 평면 배열(pack_rows)로 전달
+      - 풀은 봇 setup_hook 에서 start() 로 생성(그 밖의 사용처는 첫 호출 때). 워커가 죽으면(BrokenProcessPool)
+        다음 호출 때 새로 만듦
+      - 워커는 forkserver 로 시작: 이벤트 루프/discord.py/to_thread 스레드가 도는 프로세스를 fork 하지 않음
+        (forkserver 가 없는 플랫폼은 spawn)
+      - workers=0 이면 같은 스레드에서 바로 실행 (디버깅/단일 코어)
+    작업 함수는 모듈 최상위 함수여야 함(워커에서 이름으로 찾음).
+    """
+    def __init__(self, workers: int = STATS_WORKERS):
+        self.workers = workers
+        self._pool: ProcessPoolExecutor | None = None
+
+    def start(self) -> None:
+        if self._pool is None and self.workers > 0:
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context(method))
+
+    def _executor(self) -> ProcessPoolExecutor:
+        self.start()
+        return self._pool
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        with metrics.timer("mm_stats_seconds", op=fn.__name__):
+            if self.workers <= 0:
+                return fn(*args)
+            try:
+                return await asyncio.get_running_loop().run_in_executor(self._executor(), fn, *args)
+            except BrokenProcessPool:
+                self._pool = None
+                raise
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+stats = StatsExecutor()
+
+class LoopLagMonitor:
+    """
+    interval 마다 깨어나 예정보다 늦은 시간을 mm_loop_lag_seconds 에 기록.
+    threshold 초과는 멈춤(stall)으로 mm_loop_stalls_total 증가 + 경고 로그.
+    """
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL_SEC, threshold: float = LOOP_LAG_WARN_SEC):
+        self.interval = interval
+        self.threshold = threshold
+        self.stalls = 0
+        self.max_lag = 0.0
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        if self._task is None and self.interval > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            t0 = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - t0 - self.interval)
+            metrics.observe("mm_loop_lag_seconds", lag)
+            self.max_lag = max(self.max_lag, lag)
+            if lag > self.threshold:
+                self.stalls += 1
+                metrics.inc("mm_loop_stalls_total")
+                log.warning("event loop stalled for %.0f ms", lag * 1000)
+
+    def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+# ── 스키마 마이그레이션 ───────────────────────────────────────────────────────
+# 봇 시작 시(setup_hook) 버전 순서대로 적용, 이력은 schema_migrations.
+# MySQL DDL 은 트랜잭션이 아니라 문장 단위로 재실행 가능해야 함: 테이블/열/키가 이미 있다는 오류는
+# 적용된 것으로 간주(db/db.sql 로 직접 만들었던 DB 포함).
+SCHEMA_MIGRATIONS_DDL = """
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version    INT          NOT NULL,
+    name       VARCHAR(200) NOT NULL,
+    applied_at TIMESTAMP    NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (version)
+) ENGINE=InnoDB
+"""
+
+MIGRATIONS: List[Tuple[int, str, List[str]]] = [
+    (1, "game, game_detail", [
+        """
+        CREATE TABLE IF NOT EXISTS game (
+            id   INT       NOT NULL AUTO_INCREMENT,
+            date TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (id)
+        ) ENGINE=InnoDB
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS game_detail (
+            id       INT      NOT NULL AUTO_INCREMENT,
+            game_id  INT      NOT NULL,
+            user_id  BIGINT   NOT NULL,
+            score    INT      NOT NULL DEFAULT 0,
+            position SMALLINT NOT NULL,
+            PRIMARY KEY (id),
+            CONSTRAINT fk_game_detail_game FOREIGN KEY (game_id) REFERENCES game (id)
+        ) ENGINE=InnoDB
+        """,
+    ]),
+    (2, "player_standings, standings_snapshot", [
+        """
+        CREATE TABLE IF NOT EXISTS player_standings (
+            user_id    BIGINT    NOT NULL,
+            games      INT       NOT NULL DEFAULT 0,
+            score_sum  BIGINT    NOT NULL DEFAULT 0,
+            rank1      INT       NOT NULL DEFAULT 0,
+            rank2      INT       NOT NULL DEFAULT 0,
+            rank3      INT       NOT NULL DEFAULT 0,
+            rank4      INT       NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id)
+        ) ENGINE=InnoDB
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS standings_snapshot (
+            snap_game_id INT       NOT NULL,
+            snap_date    TIMESTAMP NOT NULL,
+            user_id      BIGINT    NOT NULL,
+            games        INT       NOT NULL DEFAULT 0,
+            score_sum    BIGINT    NOT NULL DEFAULT 0,
+            rank1        INT       NOT NULL DEFAULT 0,
+            rank2        INT       NOT NULL DEFAULT 0,
+            rank3        INT       NOT NULL DEFAULT 0,
+            rank4        INT       NOT NULL DEFAULT 0,
+            PRIMARY KEY (snap_game_id, user_id),
+            KEY idx_snapshot_date (snap_date, snap_game_id),
+            KEY idx_snapshot_user (user_id, snap_date)
+        ) ENGINE=InnoDB
+        """,
+    ]),
+    (3, "game.version (edit optimistic lock)", [
+        "ALTER TABLE game ADD COLUMN version INT NOT NULL DEFAULT 0",
+    ]),
+    (4, "game.journal_id (score journal replay)", [
+        "ALTER TABLE game ADD COLUMN journal_id BIGINT NULL, ADD UNIQUE KEY uq_game_journal (journal_id)",
+    ]),
+    (5, "hot query indexes", [
+        # game_detail 클러스터 순서를 (game_id, position)으로: 좌석 유일 제약 겸
+        # fetch_game/수정 잠금(WHERE game_id=)과 전체 스캔(ORDER BY game_id)이 정렬 없이 PK 순서로 읽힘
+        "ALTER TABLE game_detail DROP PRIMARY KEY, ADD PRIMARY KEY (game_id, position), "
+        "ADD UNIQUE KEY uq_game_detail_id (id)",
+        "CREATE INDEX idx_game_detail_user ON game_detail (user_id, game_id)",  # 개인 기록
+        "CREATE INDEX idx_game_date ON game (date)",                            # 기간 조회 (date, id)
+    ]),
+    (6, "player_rating, rating_checkpoint, rating_state", [
+        """
+        CREATE TABLE IF NOT EXISTS player_rating (
+            user_id BIGINT NOT NULL,
+            rating  DOUBLE NOT NULL,
+            games   INT    NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id)
+        ) ENGINE=InnoDB
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS rating_checkpoint (
+            game_id INT    NOT NULL,
+            user_id BIGINT NOT NULL,
+            rating  DOUBLE NOT NULL,
+            games   INT    NOT NULL,
+            PRIMARY KEY (game_id, user_id)
+        ) ENGINE=InnoDB
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS rating_state (
+            id                 TINYINT NOT NULL,
+            last_game_id       INT     NOT NULL DEFAULT 0,
+            checkpoint_game_id INT     NOT NULL DEFAULT 0,
+            dirty_from         INT     NULL,
+            PRIMARY KEY (id)
+        ) ENGINE=InnoDB
+        """,
+        # dirty_from=0: 시작 시 기존 게임 전체로 한 번 계산
+        "INSERT IGNORE INTO rating_state (id, last_game_id, checkpoint_game_id, dirty_from) VALUES (1, 0, 0, 0)",
+    ]),
+    (7, "guild_id on all tables", [
+        # 모든 테이블/인덱스 앞에 guild_id: 길드별 조회가 다른 길드 행을 읽지 않음. 기존 행은 guild_id=0 (LEGACY_GUILD_ID 참고)
+        "ALTER TABLE game ADD COLUMN guild_id BIGINT NOT NULL DEFAULT 0 AFTER id",
+        "CREATE INDEX idx_game_guild_date ON game (guild_id, date)",
+        "DROP INDEX idx_game_date ON game",
+        "ALTER TABLE game_detail ADD COLUMN guild_id BIGINT NOT NULL DEFAULT 0 FIRST",
+        "CREATE INDEX idx_game_detail_game ON game_detail (game_id)",  # 외래 키용 (PK 가 guild_id 로 시작하게 되므로)
+        "ALTER TABLE game_detail DROP PRIMARY KEY, ADD PRIMARY KEY (guild_id, game_id, position)",
+        "CREATE INDEX idx_game_detail_guild_user ON game_detail (guild_id, user_id, game_id)",
+        "DROP INDEX idx_game_detail_user ON game_detail",
+        "ALTER TABLE player_standings ADD COLUMN guild_id BIGINT NOT NULL DEFAULT 0 FIRST, "
+        "DROP PRIMARY KEY, ADD PRIMARY KEY (guild_id, user_id)",
+        "ALTER TABLE standings_snapshot ADD COLUMN guild_id BIGINT NOT NULL DEFAULT 0 FIRST, "
+        "DROP PRIMARY KEY, ADD PRIMARY KEY (guild_id, snap_game_id, user_id), "
+        "DROP INDEX idx_snapshot_date, ADD KEY idx_snapshot_guild_date (guild_id, snap_date, snap_game_id), "
+        "DROP INDEX idx_snapshot_user, ADD KEY idx_snapshot_guild_user (guild_id, user_id, snap_date)",
+        "ALTER TABLE player_rating ADD COLUMN guild_id BIGINT NOT NULL DEFAULT 0 FIRST, "
+        "DROP PRIMARY KEY, ADD PRIMARY KEY (guild_id, user_id)",
+        "ALTER TABLE rating_checkpoint ADD COLUMN guild_id BIGINT NOT NULL DEFAULT 0 FIRST, "
+        "DROP PRIMARY KEY, ADD PRIMARY KEY (guild_id, game_id, user_id)",
+        "ALTER TABLE rating_state CHANGE id guild_id BIGINT NOT NULL",
+        "UPDATE rating_state SET guild_id=0 WHERE guild_id=1",
+    ]),
+    (8, "guild_config", [
+        """
+        CREATE TABLE IF NOT EXISTS guild_config (
+            guild_id     BIGINT        NOT NULL,
+            channel_ids  VARCHAR(1000) NOT NULL DEFAULT '',   -- 쉼표 구분
+            role_name    VARCHAR(100)  NOT NULL,
+            start_points INT           NOT NULL,
+            uma          VARCHAR(50)   NOT NULL,              -- "15,5,-5,-15"
+            updated_at   TIMESTAMP     NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            PRIMARY KEY (guild_id)
+        ) ENGINE=InnoDB
+        """,
+    ]),
+    (9, "player_pair (head-to-head)", [
+        """
+        CREATE TABLE IF NOT EXISTS player_pair (
+            guild_id   BIGINT NOT NULL,
+            user_lo    BIGINT NOT NULL,                -- 두 사용자 중 작은 user_id
+            user_hi    BIGINT NOT NULL,
+            games      INT    NOT NULL DEFAULT 0,
+            lo_above   INT    NOT NULL DEFAULT 0,      -- user_lo 가 더 높은 순위였던 판수
+            score_diff BIGINT NOT NULL DEFAULT 0,      -- Σ(user_lo 원점수 - user_hi 원점수)
+            net1       INT    NOT NULL DEFAULT 0,      -- netN = user_lo N위 횟수 - user_hi N위 횟수
+            net2       INT    NOT NULL DEFAULT 0,
+            net3       INT    NOT NULL DEFAULT 0,
+            net4       INT    NOT NULL DEFAULT 0,
+            PRIMARY KEY (guild_id, user_lo, user_hi)
+        ) ENGINE=InnoDB
+        """,
+    ]),
+    (10, "rating_state version, per-guild checkpoint count", [
+        # version: 레이팅에 영향 주는 커밋(새 게임/수정/삭제)마다 +1. replay_ratings 가 잠금 없이 계산한 뒤 비교
+        # since_checkpoint: 마지막 체크포인트 이후 이 길드의 게임 수 (체크포인트 간격은 길드 게임 수로 셈)
+        "ALTER TABLE rating_state ADD COLUMN version BIGINT NOT NULL DEFAULT 0, "
+        "ADD COLUMN since_checkpoint INT NOT NULL DEFAULT 0",
+    ]),
+    (11, "rating order (date, id)", [
+        # 레이팅은 (date, id) 순서로 반영: 봇 이전 기록을 나중에 입력해도 날짜 자리에서 계산됨
+        # 체크포인트/재계산 시작 위치도 날짜로 찾음. dirty_date NULL + dirty_from 있음 = 처음부터
+        "ALTER TABLE rating_checkpoint ADD COLUMN game_date TIMESTAMP NULL DEFAULT NULL AFTER game_id",
+        "CREATE INDEX idx_rating_checkpoint_date ON rating_checkpoint (guild_id, game_date, game_id)",
+        "ALTER TABLE rating_state ADD COLUMN dirty_date TIMESTAMP NULL DEFAULT NULL AFTER dirty_from",
+        "ALTER TABLE rating_state ADD COLUMN last_date TIMESTAMP NULL DEFAULT NULL AFTER last_game_id",
+        # 기존 체크포인트는 game_id 순서로 계산됨 -> 버리고 시작 시 처음부터 다시 계산
+        "DELETE FROM rating_checkpoint",
+        "UPDATE rating_state SET dirty_from=0, dirty_date=NULL, version=version+1",
+    ]),
+]
+STANDINGS_MIGRATION = 2  # 새로 적용되면 기존 게임으로 누적 테이블 채움
+PAIRS_MIGRATION = 9      # 새로 적용되면 게임이 있는 길드마다 상대전적 채움
+
+# 이미 있음: 1050 테이블, 1060 열, 1061 키 이름, 1068 기본 키, 1826 외래 키 이름
+# 이미 없음(삭제/이름 변경 완료): 1091 키/열
+MIGRATION_ALREADY_APPLIED = {1050, 1060, 1061, 1068, 1826, 1091}
+# 1054(없는 열)는 열을 지우거나 이름을 바꾸는 문장에서만 "이미 적용됨". 다른 문장에서는 진짜 오류(오타 등)
+MIGRATION_COLUMN_GONE = 1054
+MIGRATION_COLUMN_GONE_RE = re.compile(r"\b(DROP\s+COLUMN|RENAME\s+COLUMN|CHANGE)\b", re.IGNORECASE)
+
+def migration_already_applied(sql: str, e: aiomysql.Error) -> bool:
+    """마이그레이션 문장 오류가 재실행/부분 적용 때문인지."""
+    code = e.args[0] if e.args else None
+    if code == MIGRATION_COLUMN_GONE:
+        return bool(MIGRATION_COLUMN_GONE_RE.search(sql))
+    return code in MIGRATION_ALREADY_APPLIED
+
+@metered("run_migrations")
+async def run_migrations(pool: aiomysql.Pool) -> List[int]:
+    """미적용 마이그레이션 적용. 여러 프로세스가 동시에 시작해도 GET_LOCK 으로 한 곳에서만. return: 적용한 버전"""
+    applied: List[int] = []
+    async with pool.acquire() as conn, conn.cursor() as cur:
+        await cur.execute("SELECT GET_LOCK('monkeymahjong.migrate', 60)")
+        if (await cur.fetchone())[0] != 1:
+            raise RuntimeError("마이그레이션 잠금 획득 실패")
+        try:
+            await cur.execute(SCHEMA_MIGRATIONS_DDL)
+            await cur.execute("SELECT version FROM schema_migrations")
+            done = {int(v) for (v,) in await cur.fetchall()}
+            for version, name, statements in MIGRATIONS:
+                if version in done:
+                    continue
+                for sql in statements:
+                    try:
+                        await cur.execute(sql)
+                    except aiomysql.Error as e:
+                        if not migration_already_applied(sql, e):
+                            raise
+                        log.info("migration %d: already present (%s)", version, e.args[1] if len(e.args) > 1 else e)
+                await cur.execute("INSERT INTO schema_migrations (version, name) VALUES (%s,%s)", (version, name))
+                await conn.commit()
+                applied.append(version)
+                log.info("migration %d applied: %s", version, name)
+        finally:
+            await cur.execute("SELECT RELEASE_LOCK('monkeymahjong.migrate')")
+            await cur.fetchall()
+            await conn.commit()
+    return applied
+
+# 단일 길드 시절 행(guild_id=0): 게임 원본만 옮기고 파생 테이블은 옮긴 길드에서 다시 계산.
+# 파생 테이블은 (guild_id, user_id, ...) 키라 그대로 옮기면 그 길드에 이미 생긴 행과 PK 가 겹침
+# (LEGACY_GUILD_ID 없이 먼저 올린 뒤 설정한 경우).
+LEGACY_DERIVED_TABLES = ("player_standings", "standings_snapshot", "player_pair",
+                         "player_rating", "rating_checkpoint", "rating_state")
+
+@metered("adopt_legacy_rows")
+async def adopt_legacy_rows(pool: aiomysql.Pool, guild_id: int) -> int:
+    """
+    단일 길드 시절 게임(guild_id=0)을 guild_id 로 옮기고 guild_id=0 파생 행은 삭제.
+    옮긴 게임이 있으면 그 길드의 누적/상대전적/스냅샷을 다시 만들고 레이팅은 처음부터 재계산 표시
+    (시작 시 fetch_game_guilds -> replay). 옮길 게임이 없으면 아무것도 안 함. return: 옮긴 게임 수
+    """
+    async with pool.acquire() as conn:
+        await conn.begin()
+        try:
+            async with conn.cursor() as cur:
+                n = await cur.execute("UPDATE game SET guild_id=%s WHERE guild_id=0", (guild_id,))
+                if n:
+                    await cur.execute("UPDATE game_detail SET guild_id=%s WHERE guild_id=0", (guild_id,))
+                    for table in LEGACY_DERIVED_TABLES:
+                        await cur.execute(f"DELETE FROM {table} WHERE guild_id=0")
+                    await mark_ratings_dirty(cur, guild_id, 0, None)
+            await conn.commit()
+        except Exception:
+            await conn.rollback()
+            raise
+    if n:
+        await rebuild_standings(pool, guild_id)
+        await rebuild_pairs(pool, guild_id)
+        await rebuild_snapshots(pool, guild_id)
+    return n
+
+async def count_legacy_games(pool: aiomysql.Pool) -> int:
+    """아직 길드로 옮기지 않은 단일 길드 시절 게임 수."""
+    async with pool.acquire() as conn, conn.cursor() as cur:
+        await cur.execute("SELECT COUNT(*) FROM game WHERE guild_id=0")
+        (n,) = await cur.fetchone()
+        await conn.commit()
+    return int(n)
+
+# ── 길드 설정 ─────────────────────────────────────────────────────────────────
+class GuildConfig:
+    """길드 한 곳의 설정: 사용 채널, 선수 역할, 점수 규칙. 설정 행이 없는 길드는 ENV 기본값."""
+    __slots__ = ("guild_id", "channel_ids", "role_name", "rules")
+
+    def __init__(self, guild_id: int, channel_ids: Iterable[int] = (), role_name: str = ROLE_NAME,
+                 rules: ScoreRules = DEFAULT_RULES):
+        self.guild_id = guild_id
+        self.channel_ids = frozenset(int(c) for c in channel_ids)
+        self.role_name = role_name
+        self.rules = rules
+
+    def allows(self, channel_id: int | None) -> bool:
+        return channel_id in self.channel_ids
+
+def parse_uma(text: str) -> Dict[int, int]:
+    """ "15,5,-5,-15" -> {1: 15, 2: 5, 3: -5, 4: -15}. 합이 0이 아니면 ValueError."""
+    try:
+        vals = [int(x) for x in text.replace(" ", "").split(",")]
+    except ValueError:
+        raise ValueError("우마 형식: 1위,2위,3위,4위 (예: 15,5,-5,-15)") from None
+    if len(vals) != 4 or sum(vals) != 0:
+        raise ValueError("우마는 4개, 합계 0이어야 합니다.")
+    return dict(zip((1, 2, 3, 4), vals))
+
+class GuildConfigs:
+    """guild_config 캐시. 시작 시 전체 로드, /마장 설정 으로 저장하면 즉시 갱신."""
+    def __init__(self):
+        self._d: Dict[int, GuildConfig] = {}
+
+    def get(self, guild_id: int | None) -> GuildConfig:
+        cfg = self._d.get(guild_id or 0)
+        if cfg is None:
+            cfg = GuildConfig(guild_id or 0, [CHANNEL_ID] if CHANNEL_ID else ())
+        return cfg
+
+    @metered("load_guild_configs")
+    async def load(self, pool: aiomysql.Pool) -> int:
+        async with pool.acquire() as conn, conn.cursor() as cur:
+            await cur.execute("SELECT guild_id, channel_ids, role_name, start_points, uma FROM guild_config")
+            rows = await cur.fetchall()
+            await conn.commit()
+        self._d = {
+            int(g): GuildConfig(int(g), [int(c) for c in ch.split(",") if c], role, ScoreRules(sp, parse_uma(uma)))
+            for g, ch, role, sp, uma in rows
+        }
+        return len(self._d)
+
+    @metered("save_guild_config")
+    async def save(self, pool: aiomysql.Pool, cfg: GuildConfig) -> None:
+        uma = ",".join(str(cfg.rules.uma[r]) for r in (1, 2, 3, 4))
+        async with pool.acquire() as conn, conn.cursor() as cur:
+            await cur.execute(
+                "INSERT INTO guild_config (guild_id, channel_ids, role_name, start_points, uma) VALUES (%s,%s,%s,%s,%s) "
+                "ON DUPLICATE KEY UPDATE channel_ids=VALUES(channel_ids), role_name=VALUES(role_name), "
+                "start_points=VALUES(start_points), uma=VALUES(uma)",
+                (cfg.guild_id, ",".join(map(str, sorted(cfg.channel_ids))), cfg.role_name, cfg.rules.start_points, uma),
+            )
+            await conn.commit()
+        self._d[cfg.guild_id] = cfg
+
+# ── DB 유틸 ───────────────────────────────────────────────────────────────────
+# 모든 조회/갱신은 guild_id 를 키 앞에 둠: 한 길드의 요청이 다른 길드 행을 스캔하지 않음.
+@metered("fetch_game")
+async def fetch_game(pool: aiomysql.Pool, guild_id: int, game_id: int) -> List[Dict[str, Any]]:
+    async with pool.acquire() as conn, conn.cursor() as cur:
+        await cur.execute(
+            "SELECT user_id, score, position FROM game_detail WHERE guild_id=%s AND game_id=%s",
+            (guild_id, game_id),
+        )
+        rows = await cur.fetchall()
+    return [{"user_id": int(r[0]), "score": int(r[1]), "position": int(r[2])} for r in rows]
+
+@metered("fetch_game_versioned")
+async def fetch_game_versioned(pool: aiomysql.Pool, guild_id: int,
+                               game_id: int) -> Tuple[int, datetime, List[Dict[str, Any]]] | None:
+    """게임 + 낙관적 잠금 버전. 다른 길드 게임이면 None. return: (version, date, rows) 또는 None"""
+    async with pool.acquire() as conn, conn.cursor() as cur:
+        await cur.execute(
+            "SELECT g.version, g.date, d.user_id, d.score, d.position "
+            "FROM game g JOIN game_detail d ON d.guild_id = g.guild_id AND d.game_id = g.id "
+            "WHERE g.id=%s AND g.guild_id=%s ORDER BY d.position",
+            (game_id, guild_id),
+        )
+        rows = await cur.fetchall()
+        await conn.commit()
+    if not rows:
+        return None
+    return (
+        int(rows[0][0]), rows[0][1],
+        [{"user_id": int(u), "score": int(s), "position": int(p)} for (_, _, u, s, p) in rows],
+    )
+
+@metered("fetch_game_id_by_journal")
+async def fetch_game_id_by_journal(pool: aiomysql.Pool, guild_id: int, jid: int) -> int | None:
+    """저장 중에 게시된 버튼(-jid)의 game_id. 재시작/LRU 밀림/메시지 갱신 실패 후에도 찾을 수 있게 DB 조회."""
+    async with pool.acquire() as conn, conn.cursor() as cur:
+        await cur.execute("SELECT id FROM game WHERE guild_id=%s AND journal_id=%s", (guild_id, jid))
+        row = await cur.fetchone()
+        await conn.commit()
+    return int(row[0]) if row else None
+
+# 좌석별 점수를 한 문장으로 갱신
+EDIT_SCORES_SQL = (
+    "UPDATE game_detail SET score = CASE position "
+    "WHEN 0 THEN %s WHEN 1 THEN %s WHEN 2 THEN %s WHEN 3 THEN %s END "
+    "WHERE guild_id=%s AND game_id=%s AND position IN (0, 1, 2, 3)"
+)
+
+class RecentGames:
+    """
+    최근 게시/수정된 게임 LRU: (guild_id, game_id) -> (version, date, rows).
+    mm_edit 버튼이 DB 조회 없이 수정 모달을 열 수 있게 함. 낡은 항목은 저장 시 버전 검사로 걸러짐.
+    """
+    def __init__(self, maxsize: int = GAME_LRU_SIZE):
+        self.maxsize = maxsize
+        self._d: "OrderedDict[Tuple[int, int], Tuple[int, datetime | None, List[Dict[str, Any]]]]" = OrderedDict()
+
+    def get(self, guild_id: int, game_id: int) -> Tuple[int, datetime | None, List[Dict[str, Any]]] | None:
+        item = self._d.get((guild_id, game_id))
+        if item is not None:
+            self._d.move_to_end((guild_id, game_id))
+        return item
+
+    def put(self, guild_id: int, game_id: int, version: int, date: datetime | None,
+            rows: List[Dict[str, Any]]) -> None:
+        self._d[(guild_id, game_id)] = (version, date, rows)
+        self._d.move_to_end((guild_id, game_id))
+        while len(self._d) > self.maxsize:
+            self._d.popitem(last=False)
+
+    def discard(self, guild_id: int, game_id: int) -> None:
+        self._d.pop((guild_id, game_id), None)
+
+@metered("delete_game")
+async def delete_game(pool: aiomysql.Pool, guild_id: int, game_id: int) -> List[Tuple[int, int, int, int]]:
+    """게임 삭제. return: 삭제된 행 (game_id, user_id, score, position). 다른 길드 게임이면 빈 목록"""
+    async with pool.acquire() as conn:
+        await conn.begin()
+        try:
+            async with conn.cursor() as cur:
+                old_rows = await select_game_for_update(cur, guild_id, game_id)
+                if old_rows:
+                    await cur.execute("SELECT date FROM game WHERE id=%s AND guild_id=%s", (game_id, guild_id))
+                    (date,) = await cur.fetchone()
+                    await apply_standings(cur, guild_id, old_rows, sign=-1)
+                    await apply_pairs(cur, guild_id, old_rows, sign=-1)
+                    await apply_snapshots(cur, guild_id, old_rows, sign=-1)
+                    await mark_ratings_dirty(cur, guild_id, game_id, date)
+                    await cur.execute("DELETE FROM game_detail WHERE guild_id=%s AND game_id=%s", (guild_id, game_id))
+                    await cur.execute("DELETE FROM game WHERE id=%s AND guild_id=%s", (game_id, guild_id))
+            await conn.commit()
+        except Exception:
+            await conn.rollback()
+            raise
+    return old_rows
+
+@metered("fetch_all_details")
+async def fetch_all_details(pool: aiomysql.Pool, guild_id: int) -> List[Tuple[int, int, int, int]]:
+    """길드의 모든 game_detail: (game_id, user_id, score, position)"""
+    async with pool.acquire() as conn, conn.cursor() as cur:
+        await cur.execute(
+            "SELECT game_id, user_id, score, position FROM game_detail WHERE guild_id=%s ORDER BY game_id ASC",
+            (guild_id,),
+        )
+        rows = await cur.fetchall()
+    return [(int(g), int(u), int(s), int(p)) for (g, u, s, p) in rows]
+
+async def iter_packed_games(cur: aiomysql.Cursor, chunk_size: int = STREAM_CHUNK) -> AsyncIterator[array]:
+    """
+    game_id 정렬된 (game_id, user_id, score, position) 커서 -> 완성된 게임만 담은 pack_rows 배열 묶음.
+    청크 끝에 걸친 마지막 게임은 다음 묶음으로 넘김. StatsExecutor 작업 입력용.
+    """
+    carry: List[Any] = []
+    while True:
+        chunk = await cur.fetchmany(chunk_size)
+        if not chunk:
+            break
+        rows = carry + list(chunk)
+        last = rows[-1][0]
+        cut = len(rows)
+        while cut and rows[cut - 1][0] == last:
+            cut -= 1
+        carry = rows[cut:]
+        if cut:
+            yield pack_rows(rows[:cut])
+    if carry:
+        yield pack_rows(carry)
+
+def pack_rows(rows: Iterable[Tuple[int, int, int, int]]) -> array:
+    """(game_id, user_id, score, position) 행 -> array('q') 평면 배열 (행당 32바이트)."""
+    return array("q", itertools.chain.from_iterable(rows))
+
+def unpack_rows(packed: array) -> Iterable[Tuple[int, int, int, int]]:
+    it = iter(packed)
+    return zip(it, it, it, it)
+
+@metered("stream_all_details")
+async def stream_all_details(pool: aiomysql.Pool, guild_id: int,
+                             chunk_size: int = STREAM_CHUNK) -> AsyncIterator[Tuple[int, int, int, int]]:
+    """
+    fetch_all_details의 스트리밍 버전(서버측 커서, SSCursor).
+    메모리 사용량은 테이블 크기가 아니라 chunk_size에 비례.
+    """
+    async with pool.acquire() as conn:
+        async with conn.cursor(aiomysql.SSCursor) as cur:
+            await cur.execute(
+                "SELECT game_id, user_id, score, position FROM game_detail WHERE guild_id=%s ORDER BY game_id ASC",
+                (guild_id,),
+            )
+            while True:
+                chunk = await cur.fetchmany(chunk_size)
+                if not chunk:
+                    break
+                for g, u, sc, p in chunk:
+                    yield (int(g), int(u), int(sc), int(p))
+                await asyncio.sleep(0)  # 청크마다 이벤트 루프에 양보
+        await conn.commit()
+
+async def select_game_for_update(cur: aiomysql.Cursor, guild_id: int, game_id: int) -> List[Tuple[int, int, int, int]]:
+    """트랜잭션 안에서 게임 행 잠금 조회: (game_id, user_id, score, position)"""
+    await cur.execute(
+        "SELECT game_id, user_id, score, position FROM game_detail "
+        "WHERE guild_id=%s AND game_id=%s ORDER BY position FOR UPDATE",
+        (guild_id, game_id),
+    )
+    return [(int(g), int(u), int(s), int(p)) for (g, u, s, p) in await cur.fetchall()]
+
+# ── 누적 순위표(player_standings) ─────────────────────────────────────────────
+# (길드, 사용자)별 판수/원점수 합/순위 횟수를 정수로 누적. 계산점은 읽을 때 길드 규칙으로 산출:
+#   total = (score_sum - 시작점수*games)/1000 + Σ 우마(rank)*횟수
+STANDINGS_UPSERT_SQL = (
+    "INSERT INTO player_standings (guild_id, user_id, games, score_sum, rank1, rank2, rank3, rank4) "
+    "VALUES (%s,%s,%s,%s,%s,%s,%s,%s) "
+    "ON DUPLICATE KEY UPDATE games=games+VALUES(games), score_sum=score_sum+VALUES(score_sum), "
+    "rank1=rank1+VALUES(rank1), rank2=rank2+VALUES(rank2), "
+    "rank3=rank3+VALUES(rank3), rank4=rank4+VALUES(rank4)"
+)
+
+def standings_deltas(game_rows: List[Tuple[int, int, int, int]], sign: int = 1) -> List[Tuple[int, ...]]:
+    """한 게임의 증감분 (user_id, games, score_sum, rank1..rank4). 4인 완성 게임만 반영."""
+    if len(game_rows) != 4:
+        return []
+    ranks = assign_ranks_for_game(game_rows)
+    return [
+        (uid, sign, sign * sc, *(sign if ranks[uid] == r else 0 for r in (1, 2, 3, 4)))
+        for _, uid, sc, _ in game_rows
+    ]
+
+def standings_change(old_rows: List[Tuple[int, int, int, int]],
+                     new_rows: List[Tuple[int, int, int, int]]) -> List[Tuple[int, ...]]:
+    """수정 전후 게임의 순 증감분 (변화 없는 사용자 제외)."""
+    acc: Dict[int, List[int]] = {}
+    add_deltas(acc, standings_deltas(old_rows, -1))
+    add_deltas(acc, standings_deltas(new_rows))
+    return [(uid, *v) for uid, v in acc.items() if any(v)]
+
+async def apply_standings(cur: aiomysql.Cursor, guild_id: int, game_rows: List[Tuple[int, int, int, int]],
+                          sign: int = 1) -> None:
+    """게임 저장/수정/삭제와 같은 트랜잭션에서 player_standings 갱신. sign=-1 이면 되돌림."""
+    await apply_standings_deltas(cur, guild_id, standings_deltas(game_rows, sign))
+
+async def apply_standings_deltas(cur: aiomysql.Cursor, guild_id: int, deltas: List[Tuple[int, ...]]) -> None:
+    if deltas:
+        # 다중 행 INSERT 한 문장으로 전송
+        await cur.executemany(STANDINGS_UPSERT_SQL, [(guild_id, *d) for d in deltas])
+
+def standings_total(games: int, score_sum: int, rank_counts: Iterable[int],
+                    rules: ScoreRules = DEFAULT_RULES) -> float:
+    """정수 누적값 -> 총 계산점."""
+    return rules.total(games, score_sum, rank_counts)
+
+def standings_sort_key(t: Tuple[int, float, int]) -> Tuple[float, float, int]:
+    """정렬: 평균 내림차순, 총점 내림차순, user_id 오름차순"""
+    uid, total, games = t
+    return (-(total / games if games else -1e9), -total, uid)
+
+def add_deltas(acc: Dict[int, List[int]], deltas: Iterable[Tuple[int, ...]], sign: int = 1) -> None:
+    """(user_id, games, score_sum, rank1..rank4) 증감분을 acc[user_id]에 누적."""
+    for uid, *delta in deltas:
+        cur_acc = acc.setdefault(int(uid), [0] * 6)
+        for i, v in enumerate(delta):
+            cur_acc[i] += sign * int(v)
+
+def standings_rows(rows: Iterable[Tuple[int, int, int, int]]) -> List[Tuple[int, ...]]:
+    """game_id 정렬된 행의 사용자별 누적 증감분."""
+    acc: Dict[int, List[int]] = {}
+    for _, bucket in iter_groupby_game(rows):
+        add_deltas(acc, standings_deltas(bucket))
+    return [(uid, *v) for uid, v in acc.items()]
+
+def standings_packed(packed: array) -> List[Tuple[int, ...]]:
+    """StatsExecutor 작업: pack_rows 묶음의 사용자별 누적 증감분."""
+    return standings_rows(unpack_rows(packed))
+
+def standings_history(path: str, rows: int) -> List[Tuple[int, ...]]:
+    """StatsExecutor 작업: 컬럼 스냅샷 전체의 사용자별 누적값 (워커가 파일을 직접 매핑)."""
+    return standings_rows(history_rows(path, rows))
+
+def standings_from_stats(acc: Dict[int, List[int]], rules: ScoreRules = DEFAULT_RULES) -> List[Tuple[int, float, int]]:
+    """정수 누적값 -> [(user_id, total_points, games), ...] (판수 0 제외, 정렬됨)"""
+    result = [(uid, standings_total(v[0], v[1], v[2:], rules), v[0]) for uid, v in acc.items() if v[0] > 0]
+    result.sort(key=standings_sort_key)
+    return result
+
+@metered("fetch_standings")
+async def fetch_standings(pool: aiomysql.Pool, guild_id: int,
+                          rules: ScoreRules = DEFAULT_RULES) -> List[Tuple[int, float, int]]:
+    """길드의 player_standings 한 번 읽기. return: [(user_id, total_points, games), ...] (정렬됨)"""
+    async with pool.acquire() as conn, conn.cursor() as cur:
+        await cur.execute(
+            "SELECT user_id, games, score_sum, rank1, rank2, rank3, rank4 FROM player_standings "
+            "WHERE guild_id=%s AND games > 0",
+            (guild_id,),
+        )
+        rows = await cur.fetchall()
+        await conn.commit()  # autocommit=False: 읽기 트랜잭션을 닫아야 풀에서 연결이 재사용됨
+    acc: Dict[int, List[int]] = {}
+    add_deltas(acc, rows)
+    return standings_from_stats(acc, rules)
+
+@metered("rebuild_standings")
+async def rebuild_standings(pool: aiomysql.Pool, guild_id: int, history: "HistorySnapshot | None" = None) -> int:
+    """
+    길드의 game_detail 전체로 player_standings 재작성. 쓰기를 잠근 채 한 트랜잭션으로 처리. return: 사용자 수
+    history(컬럼 스냅샷)가 잠금 시점의 DB 와 같으면 game_detail 을 읽지 않고 워커가 파일로 계산.
+    """
+    async with pool.acquire() as conn:
+        await conn.begin()
+        try:
+            acc: Dict[int, List[int]] = {}
+            rows = await locked_history_rows(conn, history, guild_id)
+            if rows is None or not await history_accumulate(acc, add_deltas, standings_history, history, rows):
+                async with conn.cursor(aiomysql.SSCursor) as ss:
+                    await ss.execute(
+                        "SELECT game_id, user_id, score, position FROM game_detail WHERE guild_id=%s "
+                        "ORDER BY game_id ASC LOCK IN SHARE MODE",
+                        (guild_id,),
+                    )
+                    async for packed in iter_packed_games(ss):
+                        add_deltas(acc, await stats.run(standings_packed, packed))
+            async with conn.cursor() as cur:
+                await cur.execute("DELETE FROM player_standings WHERE guild_id=%s", (guild_id,))
+                if acc:
+                    await cur.executemany(
+                        "INSERT INTO player_standings (guild_id, user_id, games, score_sum, rank1, rank2, rank3, rank4) "
+                        "VALUES (%s,%s,%s,%s,%s,%s,%s,%s)",
+                        [(guild_id, uid, *v) for uid, v in acc.items()],
+                    )
+            await conn.commit()
+        except Exception:
+            await conn.rollback()
+            raise
+    return len(acc)
+
+# ── 상대전적(player_pair) ─────────────────────────────────────────────────────
+# 같은 게임에 앉은 두 사용자 쌍(user_lo < user_hi)마다 정수 누적. 함께 친 쌍만 행이 있음(희소),
+# 조회는 PK 한 행. 4인 게임당 6쌍. 계산점 차이는 읽을 때 길드 규칙으로:
+#   Σ(lo 계산점 - hi 계산점) = score_diff/1000 + Σ 우마(N)*netN   (시작 점수는 상쇄)
+PAIR_UPSERT_SQL = (
+    "INSERT INTO player_pair (guild_id, user_lo, user_hi, games, lo_above, score_diff, net1, net2, net3, net4) "
+    "VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s) "
+    "ON DUPLICATE KEY UPDATE games=games+VALUES(games), lo_above=lo_above+VALUES(lo_above), "
+    "score_diff=score_diff+VALUES(score_diff), net1=net1+VALUES(net1), net2=net2+VALUES(net2), "
+    "net3=net3+VALUES(net3), net4=net4+VALUES(net4)"
+)
+
+def pair_deltas(game_rows: List[Tuple[int, int, int, int]], sign: int = 1) -> List[Tuple[int, ...]]:
+    """한 게임의 쌍별 증감분 (user_lo, user_hi, games, lo_above, score_diff, net1..net4). 4인 완성 게임만 반영."""
+    if len(game_rows) != 4:
+        return []
+    ranks = assign_ranks_for_game(game_rows)
+    seats = sorted((uid, sc) for _, uid, sc, _ in game_rows)
+    out = []
+    for (lo, lo_sc), (hi, hi_sc) in itertools.combinations(seats, 2):
+        rlo, rhi = ranks[lo], ranks[hi]
+        out.append((lo, hi, sign, sign if rlo < rhi else 0, sign * (lo_sc - hi_sc),
+                    *(sign * ((rlo == r) - (rhi == r)) for r in (1, 2, 3, 4))))
+    return out
+
+def add_pair_deltas(acc: Dict[Tuple[int, int], List[int]], deltas: Iterable[Tuple[int, ...]]) -> None:
+    """쌍별 증감분을 acc[(user_lo, user_hi)]에 누적."""
+    for lo, hi, *delta in deltas:
+        cur_acc = acc.setdefault((int(lo), int(hi)), [0] * 7)
+        for i, v in enumerate(delta):
+            cur_acc[i] += int(v)
+
+def pair_change(old_rows: List[Tuple[int, int, int, int]],
+                new_rows: List[Tuple[int, int, int, int]]) -> List[Tuple[int, ...]]:
+    """수정 전후 게임의 쌍별 순 증감분 (변화 없는 쌍 제외)."""
+    acc: Dict[Tuple[int, int], List[int]] = {}
+    add_pair_deltas(acc, pair_deltas(old_rows, -1))
+    add_pair_deltas(acc, pair_deltas(new_rows))
+    return [(*k, *v) for k, v in acc.items() if any(v)]
+
+async def apply_pairs(cur: aiomysql.Cursor, guild_id: int, game_rows: List[Tuple[int, int, int, int]],
+                      sign: int = 1) -> None:
+    """게임 저장/수정/삭제와 같은 트랜잭션에서 player_pair 갱신. sign=-1 이면 되돌림."""
+    await apply_pair_deltas(cur, guild_id, pair_deltas(game_rows, sign))
+
+async def apply_pair_deltas(cur: aiomysql.Cursor, guild_id: int, deltas: List[Tuple[int, ...]]) -> None:
+    if deltas:
+        # 잠금 순서 고정: (user_lo, user_hi) 순
+        await cur.executemany(PAIR_UPSERT_SQL, [(guild_id, *d) for d in sorted(deltas)])
+
+def pairs_rows(rows: Iterable[Tuple[int, int, int, int]]) -> List[Tuple[int, ...]]:
+    """game_id 정렬된 행의 쌍별 누적 증감분."""
+    acc: Dict[Tuple[int, int], List[int]] = {}
+    for _, bucket in iter_groupby_game(rows):
+        add_pair_deltas(acc, pair_deltas(bucket))
+    return [(*k, *v) for k, v in acc.items()]
+
+def pairs_packed(packed: array) -> List[Tuple[int, ...]]:
+    """StatsExecutor 작업: pack_rows 묶음의 쌍별 누적 증감분."""
+    return pairs_rows(unpack_rows(packed))
+
+def pairs_history(path: str, rows: int) -> List[Tuple[int, ...]]:
+    """StatsExecutor 작업: 컬럼 스냅샷 전체의 쌍별 누적값."""
+    return pairs_rows(history_rows(path, rows))
+
+def pairs_from_details(rows: Iterable[Tuple[int, int, int, int]]) -> Dict[Tuple[int, int], List[int]]:
+    """fetch_all_details 결과 -> {(user_lo, user_hi): [games, lo_above, score_diff, net1..net4]} (검증/재계산용)"""
+    acc: Dict[Tuple[int, int], List[int]] = {}
+    for _, bucket in iter_groupby_game(rows):
+        add_pair_deltas(acc, pair_deltas(bucket))
+    return acc
+
+def head_to_head(user_id: int, other_id: int, counters: Iterable[int] | None,
+                 rules: ScoreRules = DEFAULT_RULES) -> Dict[str, Any]:
+    """
+    player_pair 한 행 -> user_id 기준 상대전적.
+    return: {"games", "above", "below", "score_diff", "points_diff"} (차이는 판당 평균, user_id - other_id)
+    """
+    games, lo_above, score_diff, *net = counters or (0,) * 7
+    if not games:
+        return {"games": 0, "above": 0, "below": 0, "score_diff": 0.0, "points_diff": 0.0}
+    sign = 1 if user_id < other_id else -1
+    above = lo_above if sign > 0 else games - lo_above
+    points = score_diff / 1000.0 + sum(rules.uma[r] * n for r, n in zip((1, 2, 3, 4), net))
+    return {
+        "games": games,
+        "above": above,
+        "below": games - above,
+        "score_diff": sign * score_diff / games,
+        "points_diff": sign * points / games,
+    }
+
+@metered("fetch_pair")
+async def fetch_pair(pool: aiomysql.Pool, guild_id: int, user_id: int, other_id: int) -> Tuple[int, ...] | None:
+    """두 사용자의 player_pair 한 행 (games, lo_above, score_diff, net1..net4). 함께 친 적 없으면 None"""
+    lo, hi = sorted((int(user_id), int(other_id)))
+    async with pool.acquire() as conn, conn.cursor() as cur:
+        await cur.execute(
+            "SELECT games, lo_above, score_diff, net1, net2, net3, net4 FROM player_pair "
+            "WHERE guild_id=%s AND user_lo=%s AND user_hi=%s",
+            (guild_id, lo, hi),
+        )
+        row = await cur.fetchone()
+        await conn.commit()
+    return None if row is None else tuple(int(v) for v in row)
+
+@metered("rebuild_pairs")
+async def rebuild_pairs(pool: aiomysql.Pool, guild_id: int, history: "HistorySnapshot | None" = None) -> int:
+    """길드의 game_detail 전체로 player_pair 재작성 (rebuild_standings 와 같은 방식, history 도 같음). return: 쌍 수"""
+    async with pool.acquire() as conn:
+        await conn.begin()
+        try:
+            acc: Dict[Tuple[int, int], List[int]] = {}
+            rows = await locked_history_rows(conn, history, guild_id)
+            if rows is None or not await history_accumulate(acc, add_pair_deltas, pairs_history, history, rows):
+                async with conn.cursor(aiomysql.SSCursor) as ss:
+                    await ss.execute(
+                        "SELECT game_id, user_id, score, position FROM game_detail WHERE guild_id=%s "
+                        "ORDER BY game_id ASC LOCK IN SHARE MODE",
+                        (guild_id,),
+                    )
+                    async for packed in iter_packed_games(ss):
+                        add_pair_deltas(acc, await stats.run(pairs_packed, packed))
+            async with conn.cursor() as cur:
+                await cur.execute("DELETE FROM player_pair WHERE guild_id=%s", (guild_id,))
+                rows = [(guild_id, *k, *v) for k, v in sorted(acc.items()) if v[0]]
+                for lo in range(0, len(rows), STREAM_CHUNK):
+                    await cur.executemany(
+                        "INSERT INTO player_pair (guild_id, user_lo, user_hi, games, lo_above, score_diff, "
+                        "net1, net2, net3, net4) VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)",
+                        rows[lo:lo + STREAM_CHUNK],
+                    )
+            await conn.commit()
+        except Exception:
+            await conn.rollback()
+            raise
+    return len(acc)
+
+# ── 기간 순위: 날짜 기준 누적 스냅샷 ──────────────────────────────────────────
+# standings_snapshot(guild_id, snap_game_id, snap_date, user_id, ...) 한 벌 = 그 길드에서 (date, id) <= (snap_date, snap_game_id)
+# 인 모든 게임의 사용자별 누적값. 기간 [start, end) = prefix(end) - prefix(start),
+# prefix(d) = d 이전 최신 스냅샷 + 그 이후 ~ d 사이 게임(tail)만 스캔.
+GAME_KEY_AFTER_SQL = "(g.date > %s OR (g.date = %s AND g.id > %s))"
+
+async def _latest_snapshot(cur: aiomysql.Cursor, guild_id: int,
+                           before: datetime | None = None) -> Tuple[int, datetime] | None:
+    """before 이전(미만) 최신 스냅샷 키 (snap_game_id, snap_date)."""
+    if before is None:
+        await cur.execute(
+            "SELECT snap_game_id, snap_date FROM standings_snapshot WHERE guild_id=%s "
+            "ORDER BY snap_date DESC, snap_game_id DESC LIMIT 1",
+            (guild_id,),
+        )
+    else:
+        await cur.execute(
+            "SELECT snap_game_id, snap_date FROM standings_snapshot WHERE guild_id=%s AND snap_date < %s "
+            "ORDER BY snap_date DESC, snap_game_id DESC LIMIT 1",
+            (guild_id, before),
+        )
+    row = await cur.fetchone()
+    return (int(row[0]), row[1]) if row else None
+
+async def _snapshot_stats(cur: aiomysql.Cursor, guild_id: int, snap_game_id: int, *,
+                          lock: bool = False) -> Dict[int, List[int]]:
+    await cur.execute(
+        "SELECT user_id, games, score_sum, rank1, rank2, rank3, rank4 FROM standings_snapshot "
+        "WHERE guild_id=%s AND snap_game_id=%s" + (" LOCK IN SHARE MODE" if lock else ""),
+        (guild_id, snap_game_id),
+    )
+    acc: Dict[int, List[int]] = {}
+    add_deltas(acc, await cur.fetchall())
+    return acc
+
+async def _add_tail(cur: aiomysql.Cursor, guild_id: int, acc: Dict[int, List[int]], after: Tuple[int, datetime] | None,
+                    *, before: datetime | None = None, upto: Tuple[int, datetime] | None = None,
+                    lock: bool = False) -> int:
+    """
+    키 after 초과 게임을 acc에 누적. 끝은 date < before 또는 키 <= upto.
+    return: 누적한 게임 수
+    """
+    where, params = ["g.guild_id=%s"], [guild_id]
+    if after is not None:
+        where.append(GAME_KEY_AFTER_SQL)
+        params += [after[1], after[1], after[0]]
+    if before is not None:
+        where.append("g.date < %s")
+        params.append(before)
+    if upto is not None:
+        where.append("NOT " + GAME_KEY_AFTER_SQL)
+        params += [upto[1], upto[1], upto[0]]
+    await cur.execute(
+        "SELECT d.game_id, d.user_id, d.score, d.position "
+        "FROM game g JOIN game_detail d ON d.guild_id = g.guild_id AND d.game_id = g.id "
+        "WHERE " + " AND ".join(where) + " "
+        "ORDER BY d.game_id ASC" + (" LOCK IN SHARE MODE" if lock else ""),
+        params,
+    )
+    rows = [(int(g), int(u), int(s), int(p)) for (g, u, s, p) in await cur.fetchall()]
+    n = 0
+    for _, bucket in iter_groupby_game(rows):
+        deltas = standings_deltas(bucket)
+        add_deltas(acc, deltas)
+        n += bool(deltas)
+    return n
+
+async def _prefix_stats(cur: aiomysql.Cursor, guild_id: int, before: datetime) -> Dict[int, List[int]]:
+    """date < before 인 모든 게임의 사용자별 누적값."""
+    snap = await _latest_snapshot(cur, guild_id, before)
+    acc = await _snapshot_stats(cur, guild_id, snap[0]) if snap else {}
+    await _add_tail(cur, guild_id, acc, snap, before=before)
+    return acc
+
+@metered("fetch_window_standings")
+async def fetch_window_standings(pool: aiomysql.Pool, guild_id: int, start: datetime, end: datetime,
+                                 rules: ScoreRules = DEFAULT_RULES) -> List[Tuple[int, float, int]]:
+    """기간 [start, end) 순위. return: [(user_id, total_points, games), ...] (정렬됨)"""
+    async with pool.acquire() as conn, conn.cursor() as cur:
+        hi = await _prefix_stats(cur, guild_id, end)
+        lo = await _prefix_stats(cur, guild_id, start)
+        await conn.commit()
+    for uid, v in lo.items():
+        add_deltas(hi, [(uid, *v)], sign=-1)
+    return standings_from_stats(hi, rules)
+
+@metered("scan_window_standings")
+async def scan_window_standings(pool: aiomysql.Pool, guild_id: int, start: datetime, end: datetime,
+                                rules: ScoreRules = DEFAULT_RULES) -> List[Tuple[int, float, int]]:
+    """fetch_window_standings의 기준 구현: 기간 내 게임 전체 스캔."""
+    async with pool.acquire() as conn, conn.cursor() as cur:
+        await cur.execute(
+            "SELECT d.game_id, d.user_id, d.score, d.position "
+            "FROM game g JOIN game_detail d ON d.guild_id = g.guild_id AND d.game_id = g.id "
+            "WHERE g.guild_id=%s AND g.date >= %s AND g.date < %s ORDER BY d.game_id ASC",
+            (guild_id, start, end),
+        )
+        rows = [(int(g), int(u), int(s), int(p)) for (g, u, s, p) in await cur.fetchall()]
+        await conn.commit()
+    acc: Dict[int, List[int]] = {}
+    for _, bucket in iter_groupby_game(rows):
+        add_deltas(acc, standings_deltas(bucket))
+    return standings_from_stats(acc, rules)
+
+@metered("take_snapshot")
+async def take_snapshot(pool: aiomysql.Pool, guild_id: int, *, min_games: int = SNAPSHOT_MIN_GAMES,
+                        step: int | None = None) -> int | None:
+    """
+    직전 스냅샷 + tail 로 새 스냅샷 생성. 대상 게임이 min_games 미만이면 생략.
+    step 을 주면 직전 스냅샷 이후 step 번째 게임까지만 포함(재구성용), 아니면 최신 게임까지.
+    return: 새 snap_game_id 또는 None
+    """
+    async with pool.acquire() as conn:
+        await conn.begin()
+        try:
+            async with conn.cursor() as cur:
+                prev = await _latest_snapshot(cur, guild_id)
+                if step is None:
+                    await cur.execute(
+                        "SELECT id, date FROM game WHERE guild_id=%s AND date < NOW() - INTERVAL %s SECOND "
+                        "ORDER BY date DESC, id DESC LIMIT 1",
+                        (guild_id, SNAPSHOT_LAG_SEC),
+                    )
+                else:
+                    after = "AND " + GAME_KEY_AFTER_SQL if prev else ""
+                    await cur.execute(
+                        "SELECT g.id, g.date FROM game g "
+                        f"WHERE g.guild_id=%s AND g.date < NOW() - INTERVAL %s SECOND {after} "
+                        "ORDER BY g.date ASC, g.id ASC LIMIT 1 OFFSET %s",
+                        (guild_id, SNAPSHOT_LAG_SEC, *((prev[1], prev[1], prev[0]) if prev else ()), step - 1),
+                    )
+                row = await cur.fetchone()
+                if row is None or (prev is not None and (row[1], int(row[0])) <= (prev[1], prev[0])):
+                    await conn.rollback()
+                    return None
+                upto = (int(row[0]), row[1])
+                acc = await _snapshot_stats(cur, guild_id, prev[0], lock=True) if prev else {}
+                n = await _add_tail(cur, guild_id, acc, prev, upto=upto, lock=True)
+                if n < min_games:
+                    await conn.rollback()
+                    return None
+                await cur.executemany(
+                    "INSERT INTO standings_snapshot "
+                    "(guild_id, snap_game_id, snap_date, user_id, games, score_sum, rank1, rank2, rank3, rank4) "
+                    "VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)",
+                    [(guild_id, upto[0], upto[1], uid, *v) for uid, v in acc.items()],
+                )
+            await conn.commit()
+        except Exception:
+            await conn.rollback()
+            raise
+    return upto[0]
+
+async def apply_snapshots(cur: aiomysql.Cursor, guild_id: int, game_rows: List[Tuple[int, int, int, int]],
+                          sign: int = 1) -> None:
+    """
+    과거 게임 수정/삭제 시 그 게임을 포함하는 스냅샷(키 >= 게임 키)에 증감분 반영.
+    player_standings와 같은 트랜잭션에서 호출.
+    """
+    if game_rows:
+        await apply_snapshot_deltas(cur, guild_id, game_rows[0][0], standings_deltas(game_rows, sign))
+
+async def fetch_game_date(cur: aiomysql.Cursor, guild_id: int, game_id: int) -> datetime | None:
+    await cur.execute("SELECT date FROM game WHERE id=%s AND guild_id=%s", (game_id, guild_id))
+    row = await cur.fetchone()
+    return row[0] if row else None
+
+async def apply_snapshot_deltas(cur: aiomysql.Cursor, guild_id: int, game_id: int, deltas: List[Tuple[int, ...]],
+                                game_date: datetime | None = None) -> None:
+    if not deltas:
+        return
+    if game_date is None:
+        game_date = await fetch_game_date(cur, guild_id, game_id)
+        if game_date is None:
+            return
+    gid, gdate = game_id, game_date
+    await cur.executemany(
+        "UPDATE standings_snapshot SET games=games+%s, score_sum=score_sum+%s, "
+        "rank1=rank1+%s, rank2=rank2+%s, rank3=rank3+%s, rank4=rank4+%s "
+        "WHERE guild_id=%s AND user_id=%s AND (snap_date > %s OR (snap_date = %s AND snap_game_id >= %s))",
+        [(*d[1:], guild_id, d[0], gdate, gdate, gid) for d in deltas],
+    )
+
+SNAPSHOT_UPSERT_SQL = (
+    "INSERT INTO standings_snapshot "
+    "(guild_id, snap_game_id, snap_date, user_id, games, score_sum, rank1, rank2, rank3, rank4) "
+    "VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s) "
+    "ON DUPLICATE KEY UPDATE games=games+VALUES(games), score_sum=score_sum+VALUES(score_sum), "
+    "rank1=rank1+VALUES(rank1), rank2=rank2+VALUES(rank2), "
+    "rank3=rank3+VALUES(rank3), rank4=rank4+VALUES(rank4)"
+)
+
+async def apply_snapshot_games(cur: aiomysql.Cursor, guild_id: int,
+                               games: List[Tuple[datetime, List[Tuple[int, int, int, int]]]]) -> int:
+    """
+    새로 저장한 (날짜, 게임 행) 묶음을 키가 그 이상인 기존 스냅샷 전부에 반영 (이전 날짜 기록 입력).
+    스냅샷마다 키 이하 게임의 누적 증감분을 upsert: 그 스냅샷에 행이 없던 사용자도 생김.
+    게임 저장과 같은 트랜잭션에서 호출. return: 갱신한 스냅샷 수
+    """
+    if not games:
+        return 0
+    games = sorted(games, key=lambda g: (g[0], g[1][0][0]))
+    first_date, first_rows = games[0]
+    await cur.execute(
+        "SELECT DISTINCT snap_game_id, snap_date FROM standings_snapshot "
+        "WHERE guild_id=%s AND (snap_date > %s OR (snap_date = %s AND snap_game_id >= %s)) "
+        "ORDER BY snap_date ASC, snap_game_id ASC",
+        (guild_id, first_date, first_date, first_rows[0][0]),
+    )
+    snaps = [(d, int(g)) for g, d in await cur.fetchall()]
+    acc: Dict[int, List[int]] = {}
+    params = []
+    i = 0
+    for snap_key in snaps:
+        while i < len(games) and (games[i][0], games[i][1][0][0]) <= snap_key:
+            add_deltas(acc, standings_deltas(games[i][1]))
+            i += 1
+        params.extend((guild_id, snap_key[1], snap_key[0], uid, *v) for uid, v in acc.items())
+    if params:
+        await cur.executemany(SNAPSHOT_UPSERT_SQL, params)
+    return len(snaps)
+
+async def rebuild_snapshots(pool: aiomysql.Pool, guild_id: int) -> int:
+    """길드 스냅샷 전부 삭제 후 SNAPSHOT_MIN_GAMES 판 간격으로 다시 생성. return: 생성 개수"""
+    async with pool.acquire() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute("DELETE FROM standings_snapshot WHERE guild_id=%s", (guild_id,))
+        await conn.commit()
+    n = 0
+    while await take_snapshot(pool, guild_id, min_games=1, step=SNAPSHOT_MIN_GAMES) is not None:
+        n += 1
+    return n
+
+def parse_seasons(spec: str) -> Dict[str, Tuple[datetime, datetime]]:
+    """"이름=YYYY-MM-DD~YYYY-MM-DD;..." -> {이름: (시작, 종료)}"""
+    seasons: Dict[str, Tuple[datetime, datetime]] = {}
+    for part in filter(None, (x.strip() for x in spec.split(";"))):
+        name, _, span = part.partition("=")
+        lo, _, hi = span.partition("~")
+        seasons[name.strip()] = (datetime.strptime(lo.strip(), "%Y-%m-%d"), datetime.strptime(hi.strip(), "%Y-%m-%d"))
+    return seasons
+
+SEASONS = parse_seasons(SEASONS_SPEC)
+
+def parse_rank_window(start: str | None, end: str | None, month: str | None,
+                      season: str | None) -> Tuple[datetime, datetime, str] | None:
+    """순위조회 기간 옵션 -> (시작, 종료(미포함), 표시용 라벨). 옵션 없으면 None(전체)."""
+    if season:
+        if season not in SEASONS:
+            raise ValueError(f"시즌 '{season}' 없음")
+        lo, hi = SEASONS[season]
+        return lo, hi, f"시즌 {season}"
+    if month:
+        try:
+            lo = datetime.strptime(month, "%Y-%m")
+        except ValueError:
+            raise ValueError("월 형식: YYYY-MM") from None
+        hi = lo.replace(year=lo.year + lo.month // 12, month=lo.month % 12 + 1)
+        return lo, hi, f"{month}"
+    if start or end:
+        try:
+            lo = datetime.strptime(start, "%Y-%m-%d") if start else datetime(1970, 1, 2)
+            today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+            hi = (datetime.strptime(end, "%Y-%m-%d") if end else today) + timedelta(days=1)
+        except ValueError:
+            raise ValueError("날짜 형식: YYYY-MM-DD") from None
+        if lo >= hi:
+            raise ValueError("시작일이 종료일보다 늦습니다.")
+        return lo, hi, f"{start or '처음'} ~ {end or '오늘'}"
+    return None
+
+# ── 레이팅: 다인 Elo + 체크포인트 재계산 ──────────────────────────────────────
+# 한 판 = 상대 3명과의 1:1 대결 3번(순위가 높으면 승)의 평균. 게임은 (date, game_id) 순서로 반영
+# (과거 날짜로 입력한 기록도 날짜 자리에서 계산).
+#   - 길드별로 독립: rating_state/player_rating/rating_checkpoint 모두 guild_id 가 키 앞
+#   - 저장: ScoreWriter 커밋 트랜잭션에서 4명 레이팅만 증분 갱신 (길드의 rating_state 행 잠금으로 직렬화)
+#   - 길드 게임 RATING_CHECKPOINT_GAMES 판마다 전체 레이팅을 rating_checkpoint(game_date, game_id)에 보관
+#     (rating_state.since_checkpoint 로 길드별로 셈: 다른 길드 게임은 간격에 들어가지 않음)
+#   - 과거 게임 수정/삭제/입력: rating_state.dirty_from/dirty_date 표시만 하고, 커밋 후 replay_ratings 가
+#     dirty_date 이전 마지막 체크포인트부터 끝까지만 다시 계산. 계산 중에는 rating_state 를 잠그지 않고
+#     쓰기 직전에 rating_state.version 으로 그사이 커밋이 없었는지 확인
+def apply_rating_game(ratings: Dict[int, List[float]], game_rows: List[Tuple[int, int, int, int]]) -> None:
+    """한 판 반영. ratings[user_id] = [rating, games]. 불완전 게임은 스킵. 증분/재계산이 같은 순서로 계산."""
+    if len(game_rows) != 4:
+        return
+    ranks = assign_ranks_for_game(game_rows)
+    before = {uid: ratings[uid][0] if uid in ratings else RATING_INITIAL for _, uid, _, _ in game_rows}
+    k = RATING_K / 3
+    for uid, r in before.items():
+        d = 0.0
+        for opp, ro in before.items():
+            if opp != uid:
+                d += (1.0 if ranks[uid] < ranks[opp] else 0.0) - 1.0 / (1.0 + 10 ** ((ro - r) / 400.0))
+        cur_r = ratings.setdefault(uid, [RATING_INITIAL, 0])
+        cur_r[0] = r + k * d
+        cur_r[1] += 1
+
+def ratings_packed(ratings: Dict[int, List[float]], packed: array) -> Tuple[Dict[int, List[float]], int]:
+    """StatsExecutor 작업: 게임 묶음을 순서대로 반영. return: (갱신된 ratings, 게임 수)"""
+    n = 0
+    for _, bucket in iter_groupby_game(unpack_rows(packed)):
+        apply_rating_game(ratings, bucket)
+        n += 1
+    return ratings, n
+
+RATING_UPSERT_SQL = (
+    "INSERT INTO player_rating (guild_id, user_id, rating, games) VALUES (%s,%s,%s,%s) "
+    "ON DUPLICATE KEY UPDATE rating=VALUES(rating), games=VALUES(games)"
+)
+
+async def _ensure_rating_state(cur: aiomysql.Cursor, guild_id: int) -> None:
+    """처음 게임을 저장하는 길드의 rating_state 행."""
+    await cur.execute(
+        "INSERT IGNORE INTO rating_state (guild_id, last_game_id, checkpoint_game_id, dirty_from) "
+        "VALUES (%s, 0, 0, NULL)",
+        (guild_id,),
+    )
+
+async def apply_ratings(cur: aiomysql.Cursor, guild_id: int, games: List[List[Tuple[int, int, int, int]]]) -> bool:
+    """
+    길드의 새 게임들 반영. 게임 저장과 같은 트랜잭션에서 호출.
+    새 게임이 (date, game_id) 순서로 맨 뒤라고 보고 증분 계산. 마지막 반영 게임보다 이른 날짜가 있으면
+    (밀린 저널 항목 등) 증분 결과는 그대로 두고 그 날짜부터 재계산 표시.
+    return: 재계산 표시 여부 (커밋 후 replay_ratings 필요)
+    """
+    if not games:
+        return False
+    ids = [rows[0][0] for rows in games]
+    await cur.execute("SELECT id, date FROM game WHERE guild_id=%%s AND id IN (%s)" % ",".join(["%s"] * len(ids)),
+                      (guild_id, *ids))
+    dates = {int(g): d for g, d in await cur.fetchall()}
+    games = sorted(games, key=lambda rows: (dates[rows[0][0]], rows[0][0]))
+    await _ensure_rating_state(cur, guild_id)
+    await cur.execute(
+        "SELECT checkpoint_game_id, since_checkpoint, dirty_from, last_date FROM rating_state "
+        "WHERE guild_id=%s FOR UPDATE",
+        (guild_id,),
+    )
+    checkpoint, since, dirty_from, last_date = await cur.fetchone()
+    first_id = games[0][0][0]
+    late = last_date is not None and dates[first_id] < last_date
+    uids = sorted({uid for rows in games for _, uid, _, _ in rows})
+    await cur.execute(
+        "SELECT user_id, rating, games FROM player_rating WHERE guild_id=%%s AND user_id IN (%s) FOR UPDATE"
+        % ",".join(["%s"] * len(uids)),
+        (guild_id, *uids),
+    )
+    ratings = {int(u): [float(r), int(n)] for u, r, n in await cur.fetchall()}
+    for rows in games:
+        apply_rating_game(ratings, rows)
+    await cur.executemany(RATING_UPSERT_SQL, [(guild_id, uid, r, n) for uid, (r, n) in ratings.items()])
+    last = games[-1][0][0]
+    last_at = dates[last]
+    since = int(since) + len(games)
+    # 재계산 대기 중(dirty)이면 체크포인트를 만들지 않음: 곧 replay_ratings 가 다시 씀
+    if dirty_from is None and not late and since >= RATING_CHECKPOINT_GAMES:
+        await cur.execute(
+            "INSERT INTO rating_checkpoint (guild_id, game_id, game_date, user_id, rating, games) "
+            "SELECT guild_id, %s, %s, user_id, rating, games FROM player_rating WHERE guild_id=%s",
+            (last, last_at, guild_id),
+        )
+        checkpoint, since = last, 0
+    await cur.execute(
+        "UPDATE rating_state SET last_game_id=GREATEST(last_game_id, %s), last_date=GREATEST(COALESCE(last_date, %s), %s), "
+        "checkpoint_game_id=%s, since_checkpoint=%s, version=version+1 WHERE guild_id=%s",
+        (last, last_at, last_at, checkpoint, since, guild_id),
+    )
+    if late:
+        await mark_ratings_dirty(cur, guild_id, first_id, dates[first_id])
+    return late
+
+async def mark_ratings_dirty(cur: aiomysql.Cursor, guild_id: int, game_id: int, date: datetime | None) -> None:
+    """
+    date(게임 날짜) 이후 레이팅 재계산 필요 표시. date=None 이면 처음부터.
+    게임 수정/삭제/입력과 같은 트랜잭션에서 호출, 커밋 후 replay_ratings.
+    """
+    await _ensure_rating_state(cur, guild_id)
+    # dirty_date 를 먼저: MySQL 단일 테이블 UPDATE 는 앞 대입 결과를 뒤에서 봄. LEAST(NULL, x) = NULL(처음부터 유지)
+    await cur.execute(
+        "UPDATE rating_state SET dirty_date=CASE WHEN dirty_from IS NULL THEN %s ELSE LEAST(dirty_date, %s) END, "
+        "dirty_from=LEAST(COALESCE(dirty_from, %s), %s), version=version+1 WHERE guild_id=%s",
+        (date, date, game_id, game_id, guild_id),
+    )
+
+@metered("replay_ratings")
+async def replay_ratings(pool: aiomysql.Pool, guild_id: int) -> int:
+    """
+    재계산 표시가 있으면 dirty_date 이전 마지막 체크포인트부터 마지막 게임까지 재계산하고 player_rating 재작성.
+    계산은 잠금 없는 일관 읽기로 하고 쓰기 직전에만 rating_state 를 잠가 version 비교: 그사이 저장/수정이
+    있었으면 버리고 다시 계산. RATING_REPLAY_ATTEMPTS 번째 시도는 처음부터 잠근 채 계산(계속 밀리지 않게).
+    return: 다시 계산한 게임 수
+    """
+    attempt = 1
+    while True:
+        n = await _replay_ratings_once(pool, guild_id, lock=attempt >= RATING_REPLAY_ATTEMPTS)
+        if n is not None:
+            return n
+        metrics.inc("mm_rating_replay_conflicts_total")
+        attempt += 1
+
+async def _replay_ratings_once(pool: aiomysql.Pool, guild_id: int, *, lock: bool) -> int | None:
+    """replay_ratings 한 번. lock=False 이고 계산 중 version 이 바뀌었으면 쓰지 않고 None."""
+    async with pool.acquire() as conn:
+        await conn.begin()
+        try:
+            async with conn.cursor() as cur:
+                await cur.execute(
+                    "SELECT dirty_from, dirty_date, version FROM rating_state WHERE guild_id=%s"
+                    + (" FOR UPDATE" if lock else ""),
+                    (guild_id,),
+                )
+                row = await cur.fetchone()
+                if row is None or row[0] is None:
+                    await conn.commit()
+                    return 0
+                dirty_date, version = row[1], int(row[2])
+                ck = None
+                ratings: Dict[int, List[float]] = {}
+                if dirty_date is not None:
+                    await cur.execute(
+                        "SELECT game_date, game_id FROM rating_checkpoint WHERE guild_id=%s AND game_date < %s "
+                        "ORDER BY game_date DESC, game_id DESC LIMIT 1",
+                        (guild_id, dirty_date),
+                    )
+                    ck = await cur.fetchone()
+                if ck:
+                    await cur.execute(
+                        "SELECT user_id, rating, games FROM rating_checkpoint WHERE guild_id=%s AND game_id=%s",
+                        (guild_id, ck[1]),
+                    )
+                    ratings = {int(u): [float(r), int(n)] for u, r, n in await cur.fetchall()}
+                ratings, checkpoints, since, last, n = await _replay_rating_games(cur, guild_id, ck, ratings)
+
+                if not lock:
+                    await cur.execute("SELECT version FROM rating_state WHERE guild_id=%s FOR UPDATE", (guild_id,))
+                    if int((await cur.fetchone())[0]) != version:
+                        await conn.rollback()
+                        return None
+                where, params = rating_after(ck, "")
+                await cur.execute("DELETE FROM rating_checkpoint WHERE guild_id=%s" + where, (guild_id, *params))
+                ck_id = ck[1] if ck else 0
+                for cp_date, cp_id, snap in checkpoints:
+                    await cur.executemany(
+                        "INSERT INTO rating_checkpoint (guild_id, game_id, game_date, user_id, rating, games) "
+                        "VALUES (%s,%s,%s,%s,%s,%s)",
+                        [(guild_id, cp_id, cp_date, *t) for t in snap],
+                    )
+                    ck_id = cp_id
+                await cur.execute("DELETE FROM player_rating WHERE guild_id=%s", (guild_id,))
+                if ratings:
+                    await cur.executemany(
+                        "INSERT INTO player_rating (guild_id, user_id, rating, games) VALUES (%s,%s,%s,%s)",
+                        [(guild_id, uid, r, g) for uid, (r, g) in ratings.items()],
+                    )
+                await cur.execute(
+                    "UPDATE rating_state SET dirty_from=NULL, dirty_date=NULL, last_game_id=%s, last_date=%s, "
+                    "checkpoint_game_id=%s, since_checkpoint=%s, version=version+1 WHERE guild_id=%s",
+                    (*last, ck_id, since, guild_id),
+                )
+            await conn.commit()
+        except Exception:
+            await conn.rollback()
+            raise
+    return n
+
+def rating_after(key: Tuple[datetime, int] | None, alias: str = "g.") -> Tuple[str, Tuple[Any, ...]]:
+    """(date, game_id) 순서로 key 다음 게임들의 WHERE 조건. alias="" 면 rating_checkpoint(game_date, game_id)."""
+    if key is None:
+        return "", ()
+    date_col, id_col = (f"{alias}date", f"{alias}id") if alias else ("game_date", "game_id")
+    return f" AND ({date_col} > %s OR ({date_col} = %s AND {id_col} > %s))", (key[0], key[0], key[1])
+
+async def _replay_rating_games(cur: aiomysql.Cursor, guild_id: int, ck: Tuple[datetime, int] | None,
+                               ratings: Dict[int, List[float]]):
+    """
+    체크포인트 ck=(date, game_id) 이후 길드 게임을 (date, game_id) 순서로 RATING_CHECKPOINT_GAMES 판씩 읽어 반영.
+    return: (ratings, [(체크포인트 date, game_id, [(user_id, rating, games)])], 마지막 체크포인트 이후 판수,
+             (마지막 game_id, 마지막 날짜), 판수)
+    """
+    await cur.execute("SELECT COALESCE(MAX(id), 0), MAX(date) FROM game WHERE guild_id=%s", (guild_id,))
+    last_id, last_date = await cur.fetchone()
+    checkpoints: List[Tuple[datetime, int, List[Tuple[int, float, int]]]] = []
+    n = since = 0
+    lo = ck
+    while True:
+        after, params = rating_after(lo)
+        # 구간 끝 = lo 이후 RATING_CHECKPOINT_GAMES 번째 게임 (없으면 마지막 게임까지, 체크포인트 없음)
+        await cur.execute(
+            "SELECT g.date, g.id FROM game g WHERE g.guild_id=%s" + after + " ORDER BY g.date, g.id LIMIT 1 OFFSET %s",
+            (guild_id, *params, RATING_CHECKPOINT_GAMES - 1),
+        )
+        end = await cur.fetchone()
+        upto, upto_params = "", ()
+        if end:
+            upto, upto_params = " AND (g.date < %s OR (g.date = %s AND g.id <= %s))", (end[0], end[0], end[1])
+        await cur.execute(
+            "SELECT d.game_id, d.user_id, d.score, d.position FROM game g "
+            "JOIN game_detail d ON d.guild_id = g.guild_id AND d.game_id = g.id "
+            "WHERE g.guild_id=%s" + after + upto + " ORDER BY g.date, g.id, d.position",
+            (guild_id, *params, *upto_params),
+        )
+        # 구간은 게임 단위 경계라 게임이 잘리지 않음
+        ratings, k = await stats.run(ratings_packed, ratings, pack_rows(await cur.fetchall()))
+        n += k
+        if not end:
+            since = k
+            break
+        checkpoints.append((end[0], int(end[1]), [(uid, r, g) for uid, (r, g) in ratings.items()]))
+        lo = (end[0], int(end[1]))
+    return ratings, checkpoints, since, (int(last_id), last_date), n
+
+async def rebuild_ratings(pool: aiomysql.Pool, guild_id: int) -> int:
+    """처음부터 다시 계산. return: 게임 수"""
+    async with pool.acquire() as conn, conn.cursor() as cur:
+        await mark_ratings_dirty(cur, guild_id, 0, None)
+        await conn.commit()
+    return await replay_ratings(pool, guild_id)
+
+@metered("fetch_ratings")
+async def fetch_ratings(pool: aiomysql.Pool, guild_id: int) -> List[Tuple[int, float, int]]:
+    """return: [(user_id, rating, games), ...] 레이팅 내림차순"""
+    async with pool.acquire() as conn, conn.cursor() as cur:
+        await cur.execute(
+            "SELECT user_id, rating, games FROM player_rating WHERE guild_id=%s AND games > 0", (guild_id,)
+        )
+        rows = await cur.fetchall()
+        await conn.commit()
+    result = [(int(u), float(r), int(n)) for u, r, n in rows]
+    result.sort(key=lambda t: (-t[1], t[0]))
+    return result
+
+async def fetch_game_guilds(pool: aiomysql.Pool) -> Dict[int, bool]:
+    """게임 기록이 있는 길드 -> 레이팅 재계산 대기 여부. (게임을 저장한 길드는 모두 rating_state 행이 있음)"""
+    async with pool.acquire() as conn, conn.cursor() as cur:
+        await cur.execute("SELECT guild_id, dirty_from IS NOT NULL FROM rating_state")
+        rows = await cur.fetchall()
+        await conn.commit()
+    return {int(g): bool(d) for g, d in rows}
+
+# ── 점수 저장 파이프라인: 로컬 저널 + 백그라운드 커밋 ─────────────────────────
+# 점수 입력은 저널 파일에 fsync 하는 즉시 응답. DB 커밋은 ScoreWriter 가 묶어서 재시도.
+# 저널 레코드(JSONL):
+#   {"op":"game","jid":..,"ts":..,"guild":..,"rows":[[user_id,score,position],...]}   (guild 없으면 0)
+#   {"op":"msg","jid":..,"message_id":..,"channel_id":..}   공개 메시지 위치
+#   {"op":"done","jid":..,"game_id":..}                      DB 커밋 완료
+# game.journal_id(UNIQUE)로 DB에서도 커밋 여부 확인 -> done 기록 전에 죽어도 재생 시 중복 저장 없음.
+class PendingGame:
+    __slots__ = ("jid", "ts", "rows", "guild_id", "message_id", "channel_id", "game_id", "date")
+
+    def __init__(self, jid: int, ts: float, rows: List[Tuple[int, int, int]], guild_id: int = 0):
+        self.jid = jid
+        self.ts = ts
+        self.rows = rows                      # [(user_id, score, position)] position 순
+        self.guild_id = guild_id
+        self.message_id: int | None = None
+        self.channel_id: int | None = None
+        self.game_id: int | None = None       # DB 커밋 후 배정
+        self.date: datetime | None = None     # DB 커밋 후 배정 (game.date, DB 시간대)
+
+    def detail_rows(self) -> List[Tuple[int, int, int, int]]:
+        return [(self.game_id, u, s, p) for u, s, p in self.rows]
+
+    def row_dicts(self) -> List[Dict[str, Any]]:
+        return [{"user_id": u, "score": s, "position": p} for u, s, p in self.rows]
+
+class ScoreJournal:
+    """
+    추가 전용 JSONL 저널. append 는 fsync 까지 끝나야 반환(파일 I/O 는 스레드에서).
+    커밋할 수 없는 항목은 <path>.failed 로 격리: 저널과 같은 형식(+ error)이라 확인 후 저널에 다시 붙이면 재생됨.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.failed_path = path + ".failed"
+        self._lock = asyncio.Lock()
+        self._f = None
+
+    def load(self) -> Dict[int, PendingGame]:
+        """done/failed 가 없는 항목 복원. 쓰다 만 마지막 줄은 무시."""
+        pending: Dict[int, PendingGame] = {}
+        if not os.path.exists(self.path):
+            return pending
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                    jid, op = int(rec["jid"]), rec["op"]
+                except (ValueError, KeyError, TypeError):
+                    continue
+                if op == "game":
+                    pending[jid] = PendingGame(jid, float(rec["ts"]), [tuple(r) for r in rec["rows"]],
+                                               int(rec.get("guild", 0)))
+                elif op == "msg" and jid in pending:
+                    pending[jid].message_id = int(rec["message_id"])
+                    pending[jid].channel_id = int(rec["channel_id"])
+                elif op in ("done", "failed"):
+                    pending.pop(jid, None)
+        return pending
+
+    @staticmethod
+    def encode(*records: Dict[str, Any]) -> bytes:
+        return "".join(json.dumps(r, separators=(",", ":")) + "\n" for r in records).encode("utf-8")
+
+    def _append_sync(self, data: bytes) -> None:
+        if self._f is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._f = open(self.path, "ab")
+        self._f.write(data)
+        self._f.flush()
+        os.fsync(self._f.fileno())
+
+    def _append_failed_sync(self, data: bytes) -> None:
+        os.makedirs(os.path.dirname(self.failed_path) or ".", exist_ok=True)
+        with open(self.failed_path, "ab") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _rewrite_sync(self, data: bytes) -> None:
+        tmp = self.path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+        os.replace(tmp, self.path)
+
+    async def append(self, *records: Dict[str, Any]) -> None:
+        data = self.encode(*records)
+        async with self._lock:
+            with metrics.timer("mm_journal_seconds", op="append"):
+                await asyncio.to_thread(self._append_sync, data)
+
+    async def quarantine(self, records: List[Dict[str, Any]], error: str) -> None:
+        """항목 레코드를 .failed 에 보존한 뒤 저널에 failed 표시. 그 사이에 멈추면 재시작 때 다시 격리(중복 줄만 생김)."""
+        data = self.encode(*({**r, "error": error} for r in records))
+        async with self._lock:
+            await asyncio.to_thread(self._append_failed_sync, data)
+            await asyncio.to_thread(self._append_sync, self.encode({"op": "failed", "jid": records[0]["jid"]}))
+
+    async def compact(self, snapshot: Callable[[], List[Dict[str, Any]]]) -> None:
+        """남은 레코드로 파일 재작성. snapshot 은 잠금 안에서 호출돼 동시 append 와 어긋나지 않음."""
+        async with self._lock:
+            with metrics.timer("mm_journal_seconds", op="compact"):
+                await asyncio.to_thread(self._rewrite_sync, self.encode(*snapshot()))
+
+    def close(self) -> None:
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+
+def is_entry_error(exc: BaseException) -> bool:
+    """
+    항목 데이터 때문에 다시 해도 실패하는 오류(제약/값 범위/잘못된 저널 행).
+    연결 끊김/잠금 대기/교착(OperationalError)이나 스키마 오류는 모든 항목이 같으니 재시도.
+    """
+    return isinstance(exc, (aiomysql.IntegrityError, aiomysql.DataError, ValueError, TypeError))
+
+@metered("commit_pending_games")
+async def commit_pending_games(pool: aiomysql.Pool, batch: List[PendingGame]) -> List[int]:
+    """
+    저널 항목 묶음을 한 트랜잭션으로 저장하고 각 항목의 game_id/date 설정.
+    이미 커밋된 항목(journal_id 존재)은 game_id 만 채움. 실패 시 롤백 후 game_id 초기화.
+    return: 레이팅 재계산 표시가 된 길드 (apply_ratings 참고)
+    """
+    now = time.time()
+    replay: List[int] = []
+    async with pool.acquire() as conn:
+        await conn.begin()
+        try:
+            async with conn.cursor() as cur:
+                jids = [e.jid for e in batch]
+                await cur.execute(
+                    "SELECT journal_id, id, date FROM game WHERE journal_id IN (%s)" % ",".join(["%s"] * len(jids)),
+                    jids,
+                )
+                committed = {int(j): (int(g), d) for j, g, d in await cur.fetchall()}
+                new: List[PendingGame] = []
+                for e in batch:
+                    if e.jid in committed:
+                        e.game_id, e.date = committed[e.jid]
+                        continue
+                    # 입력 시각 기준 날짜(DB 시간대 그대로): NOW() - 대기 시간
+                    await cur.execute(
+                        "INSERT INTO game (guild_id, date, journal_id) VALUES (%s, NOW() - INTERVAL %s SECOND, %s)",
+                        (e.guild_id, max(0, int(now - e.ts)), e.jid),
+                    )
+                    e.game_id = cur.lastrowid
+                    new.append(e)
+                if new:
+                    # 날짜는 DB 가 정함(NOW()): 수정 모달이 날짜 자리부터 재계산하도록 캐시용으로 읽어 둠
+                    await cur.execute("SELECT id, date FROM game WHERE id IN (%s)" % ",".join(["%s"] * len(new)),
+                                      [e.game_id for e in new])
+                    dates = {int(g): d for g, d in await cur.fetchall()}
+                    for e in new:
+                        e.date = dates[e.game_id]
+                    details = [(e.guild_id, *r) for e in new for r in e.detail_rows()]
+                    await cur.executemany(
+                        "INSERT INTO game_detail (guild_id, game_id, user_id, score, position) VALUES (%s,%s,%s,%s,%s)",
+                        details,
+                    )
+                    by_guild: Dict[int, List[PendingGame]] = defaultdict(list)
+                    for e in new:
+                        by_guild[e.guild_id].append(e)
+                    for guild_id in sorted(by_guild):  # 잠금 순서 고정
+                        games = by_guild[guild_id]
+                        acc: Dict[int, List[int]] = {}
+                        pairs: Dict[Tuple[int, int], List[int]] = {}
+                        for e in games:
+                            add_deltas(acc, standings_deltas(e.detail_rows()))
+                            add_pair_deltas(pairs, pair_deltas(e.detail_rows()))
+                        await apply_standings_deltas(cur, guild_id, [(uid, *v) for uid, v in acc.items()])
+                        await apply_pair_deltas(cur, guild_id, [(*k, *v) for k, v in pairs.items()])
+                        if await apply_ratings(cur, guild_id, [e.detail_rows() for e in games]):
+                            replay.append(guild_id)
+                        for e in games:
+                            # 스냅샷은 SNAPSHOT_LAG_SEC 이전 게임까지만 포함 -> 그보다 오래 밀린 항목만 반영 필요
+                            if now - e.ts >= SNAPSHOT_LAG_SEC:
+                                await apply_snapshots(cur, guild_id, e.detail_rows())
+            await conn.commit()
+        except Exception:
+            for e in batch:
+                e.game_id = e.date = None
+            try: await conn.rollback()
+            except Exception: pass
+            raise
+    return replay
+
+class ScoreWriter:
+    """
+    점수 입력 쓰기 큐. submit 은 저널 fsync 후 반환, 백그라운드 태스크가 WRITE_BATCH 판씩 커밋.
+    DB 오류 시 지수 백오프(최대 WRITE_RETRY_MAX_SEC)로 재시도. 시작 시 미커밋 항목 재생.
+    항목 오류(is_entry_error)면 그 묶음을 한 판씩 다시 커밋해 실패하는 항목만 격리(ScoreJournal.quarantine)하고
+    나머지는 계속 커밋: 한 항목 때문에 뒤의 입력이 모두 막히지 않음.
+    on_commit(entry): 커밋된 항목마다 한 번 호출(캐시 무효화, 이미 게시된 공개 메시지 갱신).
+    on_message(entry): 커밋 뒤에 공개 메시지 위치가 붙은 항목마다 호출(메시지 갱신만).
+    on_ratings_dirty(guild_id): 커밋이 레이팅 재계산 표시를 남긴 길드마다 호출.
+    """
+    def __init__(self, journal: ScoreJournal, pool: aiomysql.Pool,
+                 on_commit: Callable[[PendingGame], Awaitable[None]],
+                 on_message: Callable[[PendingGame], Awaitable[None]],
+                 batch_size: int = WRITE_BATCH,
+                 on_ratings_dirty: Callable[[int], None] | None = None):
+        self.journal = journal
+        self.pool = pool
+        self.on_commit = on_commit
+        self.on_message = on_message
+        self.on_ratings_dirty = on_ratings_dirty
+        self.batch_size = batch_size
+        self.pending: Dict[int, PendingGame] = {}
+        self._resolved: "OrderedDict[int, int]" = OrderedDict()   # 이번 실행에서 커밋된 jid -> game_id
+        self._wake = asyncio.Event()
+        self._last_jid = 0
+        self._done_since_compact = 0
+        self._isolate_until = 0   # 이 jid 까지는 한 판씩 커밋 (항목 오류가 난 묶음)
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> int:
+        """저널 재생 후 커밋 태스크 시작. return: 재생할 항목 수"""
+        self.pending = self.journal.load()
+        self._last_jid = max(self.pending, default=0)
+        self._task = asyncio.create_task(self._run())
+        if self.pending:
+            self._wake.set()
+        return len(self.pending)
+
+    def _next_jid(self) -> int:
+        # 밀리초 시각 기반(재시작 후에도 겹치지 않게), 같은 ms 안에서는 +1
+        self._last_jid = max(self._last_jid + 1, time.time_ns() // 1_000_000)
+        return self._last_jid
+
+    async def submit(self, guild_id: int, rows: List[Tuple[int, int, int]]) -> PendingGame:
+        """(user_id, score, position) 4행을 저널에 기록. 반환 시점에 로컬 디스크에 보존됨."""
+        entry = PendingGame(self._next_jid(), time.time(), rows, guild_id)
+        self.pending[entry.jid] = entry
+        try:
+            await self.journal.append({"op": "game", "jid": entry.jid, "ts": entry.ts, "guild": guild_id, "rows": rows})
+        except Exception:
+            self.pending.pop(entry.jid, None)
+            raise
+        self._wake.set()
+        return entry
+
+    async def attach_message(self, entry: PendingGame, message_id: int, channel_id: int) -> None:
+        """공개 메시지 위치 기록. 이미 커밋됐으면 on_message 로 메시지만 갱신 (on_commit 은 커밋 때 한 번)."""
+        entry.message_id, entry.channel_id = message_id, channel_id
+        if entry.jid in self._resolved:
+            await self._notify(self.on_message, entry)
+        elif entry.jid in self.pending:
+            await self.journal.append({"op": "msg", "jid": entry.jid,
+                                       "message_id": message_id, "channel_id": channel_id})
+
+    def resolve(self, jid: int) -> int | None:
+        """저장 중 버튼(음수 game_id)용: jid -> game_id. 아직 커밋 전이면 None."""
+        return self._resolved.get(jid)
+
+    def backlog(self) -> int:
+        return len(self.pending)
+
+    async def _notify(self, callback: Callable[[PendingGame], Awaitable[None]], entry: PendingGame) -> None:
+        try:
+            await callback(entry)
+        except Exception:
+            log.exception("score writer: %s failed for game_id=%s", callback.__name__, entry.game_id)
+
+    async def _run(self) -> None:
+        delay = 1.0
+        while True:
+            await self._wake.wait()
+            self._wake.clear()
+            while self.pending:
+                jids = sorted(self.pending)
+                size = 1 if jids[0] <= self._isolate_until else self.batch_size
+                batch = [self.pending[j] for j in jids[:size]]
+                try:
+                    replay = await commit_pending_games(self.pool, batch)
+                except Exception as exc:
+                    if is_entry_error(exc):
+                        if len(batch) > 1:
+                            log.warning("score writer: batch of %d failed (%r), committing one by one", len(batch), exc)
+                            self._isolate_until = batch[-1].jid
+                        else:
+                            await self._quarantine(batch[0], exc)
+                        continue
+                    metrics.inc("mm_errors_total", kind="score_writer")
+                    log.exception("score writer: commit failed (%d pending), retry in %.0fs", len(self.pending), delay)
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, WRITE_RETRY_MAX_SEC)
+                    continue
+                delay = 1.0
+                metrics.observe("mm_write_lag_seconds", time.time() - batch[0].ts)
+                if self.on_ratings_dirty is not None:
+                    for guild_id in replay:
+                        self.on_ratings_dirty(guild_id)
+                for e in batch:
+                    self.pending.pop(e.jid, None)
+                    self._resolved[e.jid] = e.game_id
+                while len(self._resolved) > GAME_LRU_SIZE:
+                    self._resolved.popitem(last=False)
+                try:
+                    await self.journal.append(*({"op": "done", "jid": e.jid, "game_id": e.game_id} for e in batch))
+                    self._done_since_compact += len(batch)
+                    if not self.pending or self._done_since_compact >= 1000:
+                        await self.journal.compact(self._snapshot_records)
+                        self._done_since_compact = 0
+                except Exception:
+                    log.exception("score writer: journal update failed (replay is deduplicated by journal_id)")
+                for e in batch:
+                    await self._notify(self.on_commit, e)
+
+    async def _quarantine(self, entry: PendingGame, exc: BaseException) -> None:
+        """커밋할 수 없는 항목을 대기열에서 빼고 저널에서 격리. 사용자에게는 이미 저장 완료로 보였으므로 오류 로그/지표로 알림."""
+        self.pending.pop(entry.jid, None)
+        metrics.inc("mm_errors_total", kind="score_quarantine")
+        log.error("score writer: quarantined jid=%d guild=%d message=%s (%r) -> %s",
+                  entry.jid, entry.guild_id, entry.message_id, exc, self.journal.failed_path)
+        try:
+            await self.journal.quarantine(self._entry_records(entry), repr(exc))
+        except Exception:
+            log.exception("score writer: quarantine write failed for jid=%d (retried after restart)", entry.jid)
+
+    @staticmethod
+    def _entry_records(e: PendingGame) -> List[Dict[str, Any]]:
+        out: List[Dict[str, Any]] = [{"op": "game", "jid": e.jid, "ts": e.ts, "guild": e.guild_id, "rows": e.rows}]
+        if e.message_id is not None:
+            out.append({"op": "msg", "jid": e.jid, "message_id": e.message_id, "channel_id": e.channel_id})
+        return out
 
-def calc_hanchan_points(end_points: int, rank: int) -> float:
-    """
-    리치 마작 대회 점수(반장 포인트):
-    ((종료점수 - 25,000) / 1,000) + 우마(rank). 1위 +15, 2위 +5, 3위 -5, 4위 -15.
-    """
-    base = (end_points - START_POINTS) / 1000.0
-    return base + UMA_BY_RANK[rank]
+    def _snapshot_records(self) -> List[Dict[str, Any]]:
+        out: List[Dict[str, Any]] = []
+        for e in sorted(self.pending.values(), key=lambda e: e.jid):
+            out.extend(self._entry_records(e))
+        return out
 
-def mention(uid: int) -> str:
-    return f"<@{uid}>"
+    async def close(self) -> None:
+        """커밋 태스크 중지. 남은 항목은 저널에 있으므로 다음 시작 때 재생."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self.journal.close()
 
-# ── DB 유틸 ───────────────────────────────────────────────────────────────────
-async def fetch_game(pool: aiomysql.Pool, game_id: int) -> List[Dict[str, Any]]:
+# ── 개인 기록 ─────────────────────────────────────────────────────────────────
+RECENT_MAX = 10  # 개인 기록 캐시에 보관하는 최근 게임 수
+
+@metered("fetch_player_games")
+async def fetch_player_games(pool: aiomysql.Pool, guild_id: int,
+                             user_id: int) -> List[Tuple[int, datetime, List[Tuple[int,int,int,int]]]]:
+    """
+    길드에서 사용자가 참가한 게임 전체(동석자 포함). game_detail(guild_id, user_id) 인덱스 -> game_id 조인.
+    return: [(game_id, date, [(game_id, user_id, score, position) x4]), ...] game_id 오름차순
+    """
     async with pool.acquire() as conn, conn.cursor() as cur:
         await cur.execute(
-            "SELECT user_id, score, position FROM game_detail WHERE game_id=%s",
-            (game_id,),
+            "SELECT d.game_id, g.date, d.user_id, d.score, d.position "
+            "FROM game_detail me "
+            "JOIN game g ON g.id = me.game_id "
+            "JOIN game_detail d ON d.guild_id = me.guild_id AND d.game_id = me.game_id "
+            "WHERE me.guild_id=%s AND me.user_id=%s ORDER BY d.game_id ASC",
+            (guild_id, user_id),
         )
         rows = await cur.fetchall()
-    return [{"user_id": int(r[0]), "score": int(r[1]), "position": int(r[2])} for r in rows]
+        await conn.commit()
+    dates = {int(r[0]): r[1] for r in rows}
+    details = [(int(g), int(u), int(s), int(p)) for (g, _, u, s, p) in rows]
+    return [(gid, dates[gid], bucket) for gid, bucket in iter_groupby_game(details)]
 
-async def delete_game(pool: aiomysql.Pool, game_id: int) -> None:
-    async with pool.acquire() as conn:
-        await conn.begin()
-        try:
-            async with conn.cursor() as cur:
-                await cur.execute("DELETE FROM game_detail WHERE game_id=%s", (game_id,))
-                await cur.execute("DELETE FROM game WHERE id=%s", (game_id,))
-            await conn.commit()
-        except Exception:
-            await conn.rollback()
-            raise
+def summarize_player(user_id: int, games: List[Tuple[int, datetime, List[Tuple[int,int,int,int]]]],
+                     rules: ScoreRules = DEFAULT_RULES) -> Dict[str, Any]:
+    """
+    개인 기록 요약.
+      games/total/avg: 판수, 총 계산점, 평균
+      ranks: [1위, 2위, 3위, 4위] 횟수, avg_score: 평균 원점수
+      best/worst/recent: (game_id, date, score, rank, 계산점)
+    """
+    total = 0.0
+    score_sum = 0
+    ranks = [0, 0, 0, 0]
+    records: List[Tuple[int, datetime, int, int, float]] = []
+    for gid, date, bucket in games:
+        if len(bucket) != 4:
+            continue
+        rk = assign_ranks_for_game(bucket)[user_id]
+        sc = next(sc for _, uid, sc, _ in bucket if uid == user_id)
+        hp = rules.points(sc, rk)
+        total += hp
+        score_sum += sc
+        ranks[rk - 1] += 1
+        records.append((gid, date, sc, rk, hp))
+    n = len(records)
+    return {
+        "games": n,
+        "total": total,
+        "avg": total / n if n else 0.0,
+        "ranks": ranks,
+        "avg_score": score_sum / n if n else 0.0,
+        "best": max(records, key=lambda r: (r[4], -r[0])) if records else None,
+        "worst": min(records, key=lambda r: (r[4], r[0])) if records else None,
+        "recent": records[-RECENT_MAX:][::-1],
+    }
 
-async def fetch_all_details(pool: aiomysql.Pool) -> List[Tuple[int, int, int, int]]:
-    """모든 game_detail: (game_id, user_id, score, position)"""
-    async with pool.acquire() as conn, conn.cursor() as cur:
-        await cur.execute("SELECT game_id, user_id, score, position FROM game_detail ORDER BY game_id ASC")
-        rows = await cur.fetchall()
-    return [(int(g), int(u), int(s), int(p)) for (g, u, s, p) in rows]
+async def fetch_player_summary(pool: aiomysql.Pool, guild_id: int, user_id: int,
+                               rules: ScoreRules = DEFAULT_RULES) -> Dict[str, Any]:
+    return summarize_player(user_id, await fetch_player_games(pool, guild_id, user_id), rules)
 
 # ── 임베드 ────────────────────────────────────────────────────────────────────
-def build_game_embed(game_id: int, rows: List[Dict[str, Any]], *, title_prefix: str = "게임 결과") -> discord.Embed:
+def build_game_embed(game_id: int | None, rows: List[Dict[str, Any]], *, title_prefix: str = "게임 결과",
+                     rules: ScoreRules = DEFAULT_RULES) -> discord.Embed:
     """
     공개용 임베드:
       - 좌석별: 멘션, 원점수, 계산점(+/-) 표시
       - 하단: 원점수 기준 순위(동점 ESWN)
+    game_id=None: DB 반영 전(저널에만 저장됨)
     """
     embed = discord.Embed(
-        title=f"{title_prefix} #{game_id}",
-        description="계산식: ((종료점수-25,000)/1,000)+우마 [1위+15, 2위+5, 3위-5, 4위-15] • 동점 ESWN(동→남→서→북)",
+        title=f"{title_prefix} #{game_id}" if game_id is not None else f"{title_prefix} (저장 중)",
+        description=f"계산식: {rules.formula()} • 동점 ESWN(동→남→서→북)",
         colour=discord.Colour.blue(),
         timestamp=datetime.now(timezone.utc),
     )
@@ -107,7 +2235,7 @@ def build_game_embed(game_id: int, rows: List[Dict[str, Any]], *, title_prefix:
             continue
         uid = int(r["user_id"]); raw = int(r["score"])
         rk = rank_by_uid[uid]
-        hp = calc_hanchan_points(raw, rk)
+        hp = rules.points(raw, rk)
         total_raw += raw
         embed.add_field(
             name=f"{POS_LABEL[p]}",
@@ -157,9 +2285,104 @@ class ConfirmDeleteView(View):
             custom_id=f"mm_del_cancel:{game_id}:{message_id}:{channel_id}",
         ))
 
+# ── 공개 메시지 갱신 스케줄러 ─────────────────────────────────────────────────
+class MessageUpdater:
+    """
+    공개 메시지 편집/삭제/알림 스케줄러.
+      - edit: 같은 메시지에 대기 중인 편집이 있으면 필드를 덮어써 합침 -> 창(debounce)이 끝날 때 최신 상태만 전송
+      - delete: 대기 중인 편집을 버리고 삭제만 전송
+      - notice: 같은 키의 알림은 마지막 내용 하나만 채널에 전송
+      - 채널 객체 캐시(get_channel, 없으면 partial messageable -> 조회 요청 없음)
+      - 전송은 채널별로 직렬화: 메시지 편집/삭제/전송의 레이트리밋 버킷이 channel_id 단위라
+        동시에 보내 429 대기열을 만들지 않음. 429 재시도 자체는 discord.py HTTP 클라이언트가 처리.
+    반환 Future 는 전송 성공 여부(bool). 합쳐진 호출은 같은 Future 를 받음.
+    """
+    def __init__(self, client: discord.Client, debounce: float = EDIT_DEBOUNCE_SEC):
+        self.client = client
+        self.debounce = debounce
+        self._pending: Dict[Tuple[str, int, Hashable], Dict[str, Any]] = {}
+        self._futures: Dict[Tuple[str, int, Hashable], asyncio.Future] = {}
+        self._channels: Dict[int, Any] = {}
+        self._locks: Dict[int, asyncio.Lock] = defaultdict(asyncio.Lock)
+        self._tasks: set = set()
+
+    def channel(self, channel_id: int) -> Any:
+        ch = self._channels.get(channel_id)
+        if ch is None:
+            ch = self.client.get_channel(channel_id) or self.client.get_partial_messageable(channel_id)
+            self._channels[channel_id] = ch
+        return ch
+
+    def forget_channel(self, channel_id: int) -> None:
+        self._channels.pop(channel_id, None)
+
+    def edit(self, channel_id: int, message_id: int, **fields: Any) -> asyncio.Future:
+        return self._schedule(("edit", channel_id, message_id), fields)
+
+    def delete(self, channel_id: int, message_id: int) -> asyncio.Future:
+        key = ("edit", channel_id, message_id)
+        if key in self._pending:
+            del self._pending[key]
+            metrics.inc("mm_message_coalesced_total", op="edit")
+        return self._schedule(("delete", channel_id, message_id), {})
+
+    def notice(self, channel_id: int, key: Hashable, content: str) -> asyncio.Future:
+        return self._schedule(("notice", channel_id, key), {"content": content})
+
+    def backlog(self) -> int:
+        return len(self._pending)
+
+    def _schedule(self, key: Tuple[str, int, Hashable], fields: Dict[str, Any]) -> asyncio.Future:
+        if key in self._pending:
+            self._pending[key].update(fields)
+            metrics.inc("mm_message_coalesced_total", op=key[0])
+            return self._futures[key]
+        fut = self._futures.get(key)
+        if fut is None or fut.done():
+            fut = self._futures[key] = asyncio.get_running_loop().create_future()
+        self._pending[key] = dict(fields)
+        task = asyncio.create_task(self._flush_later(key, fut))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return fut
+
+    async def _flush_later(self, key: Tuple[str, int, Hashable], fut: asyncio.Future) -> None:
+        await asyncio.sleep(self.debounce)
+        op, channel_id, target = key
+        async with self._locks[channel_id]:
+            fields = self._pending.pop(key, None)
+            if self._futures.get(key) is fut:
+                del self._futures[key]
+            ok = False
+            if fields is not None:  # None: delete 가 대기 중인 edit 를 버림
+                try:
+                    with metrics.timer("mm_discord_seconds", op="message_" + op):
+                        ch = self.channel(channel_id)
+                        if op == "edit":
+                            await ch.get_partial_message(target).edit(**fields)
+                        elif op == "delete":
+                            await ch.get_partial_message(target).delete()
+                        else:
+                            await ch.send(**fields)
+                    metrics.inc("mm_message_sent_total", op=op)
+                    ok = True
+                except discord.NotFound:
+                    log.info("message %s: %s/%s not found", op, channel_id, target)
+                except Exception:
+                    log.exception("message %s failed: %s/%s", op, channel_id, target)
+        if not fut.done():
+            fut.set_result(ok)
+
+    async def close(self) -> None:
+        for t in list(self._tasks):
+            t.cancel()
+        for fut in self._futures.values():
+            if not fut.done():
+                fut.set_result(False)
+
 # ── 모달 ──────────────────────────────────────────────────────────────────────
 class ScoreModal(Modal):
-    def __init__(self, ordered_members: List[discord.Member], pool: aiomysql.Pool):
+    def __init__(self, ordered_members: List[discord.Member], pool: aiomysql.Pool, config: GuildConfig):
         super().__init__(title="점수 입력")
         if len(ordered_members) != 4:
             raise ValueError("ScoreModal requires exactly 4 members")
@@ -170,6 +2393,7 @@ class ScoreModal(Modal):
             3: ordered_members[3],
         }
         self.pool = pool
+        self.config = config
         for p in [0, 1, 2, 3]:
             m = self.members_by_pos[p]
             self.add_item(TextInput(
@@ -182,8 +2406,11 @@ class ScoreModal(Modal):
             ))
 
     async def on_submit(self, interaction: discord.Interaction):
+        with metrics.timer("mm_modal_seconds", modal="score"):
+            await self._submit(interaction)
+
+    async def _submit(self, interaction: discord.Interaction):
         scores_by_pos: Dict[int, int] = {}
-        total = 0
         for p in [0, 1, 2, 3]:
             raw = self.children[p].value
             try:
@@ -194,49 +2421,43 @@ class ScoreModal(Modal):
                 )
                 return
             scores_by_pos[p] = v
-            total += v
 
-        if total != TARGET_TOTAL:
-            await interaction.response.send_message(
-                f"총합 {total}. {TARGET_TOTAL}이어야 합니다.", ephemeral=True
-            )
+        try:
+            validate_seats([(int(self.members_by_pos[p].id), scores_by_pos[p]) for p in [0, 1, 2, 3]],
+                           self.config.rules.target_total)
+        except ValueError as e:
+            await interaction.response.send_message(str(e), ephemeral=True)
             return
 
-        # DB 저장
+        # 로컬 저널에 기록(fsync)하면 응답. DB 반영은 ScoreWriter 가 백그라운드에서.
+        writer: ScoreWriter = interaction.client.score_writer  # type: ignore[attr-defined]
         try:
-            async with self.pool.acquire() as conn:
-                await conn.begin()
-                async with conn.cursor() as cur:
-                    await cur.execute("INSERT INTO game () VALUES ()")
-                    game_id = cur.lastrowid
-                    inserts = []
-                    for p in [0, 1, 2, 3]:
-                        uid = int(self.members_by_pos[p].id)
-                        inserts.append((game_id, uid, scores_by_pos[p], p))
-                    await cur.executemany(
-                        "INSERT INTO game_detail (game_id, user_id, score, position) VALUES (%s,%s,%s,%s)",
-                        inserts
-                    )
-                await conn.commit()
+            entry = await writer.submit(
+                self.config.guild_id, [(int(self.members_by_pos[p].id), scores_by_pos[p], p) for p in [0, 1, 2, 3]]
+            )
         except Exception as e:
-            try: await conn.rollback()
-            except Exception: pass
-            await interaction.response.send_message(f"DB 오류: {e}", ephemeral=True)
+            await interaction.response.send_message(f"저장 실패: {e}", ephemeral=True)
             return
 
-        await interaction.response.send_message(f"저장 완료. game_id={game_id}", ephemeral=True)
+        await interaction.response.send_message(f"저장 완료. 기록 #{entry.jid}", ephemeral=True)
 
-        # 공개 메시지 + 관리 버튼
-        rows = [{"user_id": int(self.members_by_pos[p].id), "score": scores_by_pos[p], "position": p} for p in [0,1,2,3]]
-        embed = build_game_embed(game_id, rows, title_prefix="게임 결과")
-        msg = await interaction.followup.send(embed=embed, wait=True)  # 공개
-        await msg.edit(view=ManageGameView(game_id, msg.id, msg.channel.id))
+        # 공개 메시지 + 관리 버튼. 커밋 전에는 음수 ID(-jid) 버튼, 커밋되면 on_commit/on_message 가 game_id 로 교체
+        embed = build_game_embed(entry.game_id, entry.row_dicts(), title_prefix="게임 결과", rules=self.config.rules)
+        with metrics.timer("mm_discord_seconds", op="post_result"):
+            msg = await interaction.followup.send(embed=embed, wait=True)  # 공개
+            await msg.edit(view=ManageGameView(-entry.jid, msg.id, msg.channel.id))
+        await writer.attach_message(entry, msg.id, msg.channel.id)
 
 class EditScoreModal(Modal):
-    def __init__(self, game_id: int, rows: List[Dict[str, Any]], guild: discord.Guild,
-                 pool: aiomysql.Pool, message_id: int, channel_id: int):
+    def __init__(self, game_id: int, rows: List[Dict[str, Any]], guild: discord.Guild, config: GuildConfig,
+                 pool: aiomysql.Pool, message_id: int, channel_id: int,
+                 version: int = 0, game_date: datetime | None = None):
         super().__init__(title=f"게임 #{game_id} 점수 수정")
         self.game_id = game_id
+        self.config = config
+        self.guild_id = config.guild_id
+        self.version = version      # 모달을 연 시점의 game.version (낙관적 잠금)
+        self.game_date = game_date
         self.pool = pool
         self.message_id = message_id
         self.channel_id = channel_id
@@ -262,8 +2483,11 @@ class EditScoreModal(Modal):
             ))
 
     async def on_submit(self, interaction: discord.Interaction):
+        with metrics.timer("mm_modal_seconds", modal="edit"):
+            await self._submit(interaction)
+
+    async def _submit(self, interaction: discord.Interaction):
         new_scores: Dict[int, int] = {}
-        total = 0
         for p in [0, 1, 2, 3]:
             raw = self.children[p].value
             try:
@@ -272,178 +2496,1191 @@ class EditScoreModal(Modal):
                 await interaction.response.send_message(f"{POS_LABEL[p]}: 정수만 입력", ephemeral=True)
                 return
             new_scores[p] = v
-            total += v
-        if total != TARGET_TOTAL:
-            await interaction.response.send_message(f"총합 {total}. {TARGET_TOTAL}이어야 합니다.", ephemeral=True)
+        try:
+            validate_seats([(self.members_by_pos[p][0], new_scores[p]) for p in [0, 1, 2, 3]],
+                           self.config.rules.target_total)
+        except ValueError as e:
+            await interaction.response.send_message(str(e), ephemeral=True)
             return
 
-        # DB 업데이트
+        # DB 업데이트: 버전 검사 + 좌석 점수 일괄 갱신 (모달을 연 뒤 다른 수정이 있었으면 충돌)
+        old_rows = [(self.game_id, int(r["user_id"]), int(r["score"]), int(r["position"])) for r in self.rows]
+        new_rows = [(g, u, new_scores.get(pos, sc), pos) for (g, u, sc, pos) in old_rows]
+        deltas = standings_change(old_rows, new_rows)
+        pair_diff = pair_change(old_rows, new_rows)
+        conflict = False
         try:
             async with self.pool.acquire() as conn:
                 await conn.begin()
                 async with conn.cursor() as cur:
-                    for p in [0, 1, 2, 3]:
+                    n = await cur.execute(
+                        "UPDATE game SET version=version+1 WHERE id=%s AND guild_id=%s AND version=%s",
+                        (self.game_id, self.guild_id, self.version),
+                    )
+                    conflict = n != 1
+                    if not conflict:
+                        # 날짜를 모르는 캐시 항목이어도 mark_ratings_dirty(None) = 처음부터 재계산이 되지 않게
+                        if self.game_date is None:
+                            self.game_date = await fetch_game_date(cur, self.guild_id, self.game_id)
                         await cur.execute(
-                            "UPDATE game_detail SET score=%s WHERE game_id=%s AND position=%s",
-                            (new_scores[p], self.game_id, p),
+                            EDIT_SCORES_SQL, (*(new_scores[p] for p in [0, 1, 2, 3]), self.guild_id, self.game_id)
                         )
-                await conn.commit()
+                        await apply_standings_deltas(cur, self.guild_id, deltas)
+                        await apply_pair_deltas(cur, self.guild_id, pair_diff)
+                        await apply_snapshot_deltas(cur, self.guild_id, self.game_id, deltas, self.game_date)
+                        await mark_ratings_dirty(cur, self.guild_id, self.game_id, self.game_date)
+                if conflict:
+                    await conn.rollback()
+                else:
+                    await conn.commit()
         except Exception as e:
             try: await conn.rollback()
             except Exception: pass
             await interaction.response.send_message(f"DB 오류: {e}", ephemeral=True)
             return
 
-        # 공개 메시지 편집
-        try:
-            channel = interaction.client.get_channel(self.channel_id) or await interaction.client.fetch_channel(self.channel_id)  # type: ignore
-            msg = await channel.fetch_message(self.message_id)  # type: ignore
-            rows = await fetch_game(self.pool, self.game_id)
-            new_embed = build_game_embed(self.game_id, rows, title_prefix="게임 수정 결과")
-            await msg.edit(embed=new_embed, view=ManageGameView(self.game_id, self.message_id, self.channel_id))
-            await interaction.response.send_message("수정 완료", ephemeral=True)
-            await interaction.followup.send(f"🛠️ 게임 #{self.game_id} 점수 수정됨.", ephemeral=False)
-        except Exception as e:
-            await interaction.response.send_message(f"메시지 편집 실패: {e}", ephemeral=True)
+        client = interaction.client
+        if conflict:
+            client.recent_games.discard(self.guild_id, self.game_id)  # type: ignore[attr-defined]
+            await interaction.response.send_message(
+                f"게임 #{self.game_id}이(가) 다른 곳에서 먼저 수정/삭제되었습니다. 다시 시도하세요.", ephemeral=True
+            )
+            return
+        client.invalidate_game(self.guild_id, [r[1] for r in old_rows])  # type: ignore[attr-defined]
+        await client.history.on_edit(self.guild_id, self.game_id, new_rows)  # type: ignore[attr-defined]
+        client.schedule_rating_replay(self.guild_id)  # type: ignore[attr-defined]
+        rows = [{"user_id": u, "score": sc, "position": pos} for (_, u, sc, pos) in new_rows]
+        client.recent_games.put(  # type: ignore[attr-defined]
+            self.guild_id, self.game_id, self.version + 1, self.game_date, rows
+        )
+
+        # 공개 메시지 편집 + 알림: 제출 값으로 임베드 구성, 연속 수정은 스케줄러에서 최신 상태 하나로 합쳐짐
+        updater: MessageUpdater = client.updater  # type: ignore[attr-defined]
+        updater.edit(
+            self.channel_id, self.message_id,
+            embed=build_game_embed(self.game_id, rows, title_prefix="게임 수정 결과", rules=self.config.rules),
+            view=ManageGameView(self.game_id, self.message_id, self.channel_id),
+        )
+        updater.notice(self.channel_id, ("edited", self.game_id), f"🛠️ 게임 #{self.game_id} 점수 수정됨.")
+        await interaction.response.send_message("수정 완료", ephemeral=True)
+
+# ── 역할 멤버 인덱스 ──────────────────────────────────────────────────────────
+def build_option_pages(members: List[discord.Member], per_page: int) -> List[List[discord.SelectOption]]:
+    return [
+        [discord.SelectOption(label=m.display_name[:100], value=str(m.id)) for m in members[i:i + per_page]]
+        for i in range(0, len(members), per_page)
+    ]
+
+class NameIndex:
+    """
+    표시 이름/닉네임/사용자명 검색 인덱스 (한 길드).
+      - 접두어: 정렬된 (이름, user_id) 목록에서 bisect
+      - 부분 문자열(3글자 이상): 트라이그램 -> user_id 집합 교집합 후 확인
+    """
+    def __init__(self):
+        self._keys: List[Tuple[str, int]] = []
+        self._names: Dict[int, List[str]] = {}
+        self._trigrams: Dict[str, set] = defaultdict(set)
+
+    @staticmethod
+    def names_of(m: discord.Member) -> List[str]:
+        raw = (m.display_name, getattr(m, "nick", None), getattr(m, "global_name", None), getattr(m, "name", None))
+        return sorted({n.casefold() for n in raw if n})
+
+    @staticmethod
+    def _grams(name: str) -> set:
+        return {name[i:i + 3] for i in range(len(name) - 2)}
+
+    def _index(self, m: discord.Member) -> List[str]:
+        names = self._names[m.id] = self.names_of(m)
+        for n in names:
+            for g in self._grams(n):
+                self._trigrams[g].add(m.id)
+        return names
+
+    def rebuild(self, members: Iterable[discord.Member]) -> None:
+        """전체 구축: 키를 모아 한 번만 정렬."""
+        self._keys, self._names, self._trigrams = [], {}, defaultdict(set)
+        for m in members:
+            self._keys.extend((n, m.id) for n in self._index(m))
+        self._keys.sort()
+
+    def add(self, m: discord.Member) -> None:
+        """증분 추가/이름 변경 (입장, 역할 부여, 닉네임 변경)."""
+        self.remove(m.id)
+        for n in self._index(m):
+            bisect.insort(self._keys, (n, m.id))
+
+    def remove(self, user_id: int) -> None:
+        for n in self._names.pop(user_id, ()):
+            i = bisect.bisect_left(self._keys, (n, user_id))
+            if i < len(self._keys) and self._keys[i] == (n, user_id):
+                del self._keys[i]
+            for g in self._grams(n):
+                ids = self._trigrams.get(g)
+                if ids is not None:
+                    ids.discard(user_id)
+                    if not ids:
+                        del self._trigrams[g]
+
+    def search(self, query: str, limit: int = 25) -> List[int]:
+        """접두어 일치 우선, 이어서 부분 문자열 일치. return: user_id 목록(중복 없음)"""
+        q = query.casefold().strip()
+        out: List[int] = []
+        seen: set = set()
+        i = bisect.bisect_left(self._keys, (q, -1))
+        while i < len(self._keys) and len(out) < limit and self._keys[i][0].startswith(q):
+            uid = self._keys[i][1]
+            if uid not in seen:
+                seen.add(uid)
+                out.append(uid)
+            i += 1
+        if len(out) >= limit or len(q) < 3:
+            return out
+        sets = sorted((self._trigrams.get(g, set()) for g in self._grams(q)), key=len)
+        cands = set.intersection(*sets) if sets else set()
+        for uid in sorted(cands - seen, key=lambda u: self._names[u][0]):
+            if any(q in n for n in self._names[uid]):
+                out.append(uid)
+                if len(out) >= limit:
+                    break
+        return out
+
+class RoleRoster:
+    """
+    길드별 선수 역할 보유 멤버(봇 제외) 인덱스. 역할 이름은 role_of(guild_id) (길드 설정).
+      - on_ready 에 길드 단위로 구축, 멤버/역할 이벤트로 증분 갱신
+      - 표시 이름 정렬 목록과 페이지별 SelectOption 은 변경이 있을 때만 다시 만듦
+      - 이름 검색(NameIndex)도 같은 이벤트로 갱신
+    """
+    def __init__(self, role_of: Callable[[int], str]):
+        self.role_of = role_of
+        self._members: Dict[int, Dict[int, discord.Member]] = {}
+        self._sorted: Dict[int, List[discord.Member]] = {}
+        self._pages: Dict[Tuple[int, int], List[List[discord.SelectOption]]] = {}
+        self._names: Dict[int, NameIndex] = {}
+
+    def _eligible(self, m: discord.Member) -> bool:
+        role_name = self.role_of(m.guild.id)
+        return not m.bot and any(r.name == role_name for r in m.roles)
+
+    def _dirty(self, guild_id: int) -> None:
+        self._sorted.pop(guild_id, None)
+        for k in [k for k in self._pages if k[0] == guild_id]:
+            del self._pages[k]
+
+    def build(self, guild: discord.Guild) -> None:
+        self._members[guild.id] = {m.id: m for m in guild.members if self._eligible(m)}
+        self._names[guild.id] = NameIndex()
+        self._names[guild.id].rebuild(self._members[guild.id].values())
+        self._dirty(guild.id)
+
+    def drop(self, guild_id: int) -> None:
+        self._members.pop(guild_id, None)
+        self._names.pop(guild_id, None)
+        self._dirty(guild_id)
+
+    def update(self, member: discord.Member, *, name_changed: bool = False) -> None:
+        """입장/역할·닉네임 변경 반영."""
+        idx = self._members.get(member.guild.id)
+        if idx is None:
+            return
+        if self._eligible(member):
+            if member.id in idx and not name_changed:
+                idx[member.id] = member
+                return
+            idx[member.id] = member
+            self._names[member.guild.id].add(member)
+        elif idx.pop(member.id, None) is None:
+            return
+        else:
+            self._names[member.guild.id].remove(member.id)
+        self._dirty(member.guild.id)
+
+    def remove(self, member: discord.Member) -> None:
+        idx = self._members.get(member.guild.id)
+        if idx is not None and idx.pop(member.id, None) is not None:
+            self._names[member.guild.id].remove(member.id)
+            self._dirty(member.guild.id)
+
+    def user_renamed(self, user_id: int) -> None:
+        """전역 이름 변경: 해당 사용자가 있는 길드의 정렬/검색 항목만 갱신."""
+        for gid, idx in self._members.items():
+            if user_id in idx:
+                self._names[gid].add(idx[user_id])
+                self._dirty(gid)
+
+    def search(self, guild: discord.Guild, query: str, limit: int = 25) -> List[discord.Member]:
+        """이름 접두어/부분 문자열 검색. 빈 검색어면 정렬 목록 앞부분."""
+        if guild.id not in self._members:
+            self.build(guild)
+        if not query.strip():
+            return self.members(guild)[:limit]
+        idx = self._members[guild.id]
+        return [idx[uid] for uid in self._names[guild.id].search(query, limit)]
+
+    def members(self, guild: discord.Guild) -> List[discord.Member]:
+        """표시 이름 정렬된 역할 보유 멤버. 인덱스가 없으면 이 시점에 구축."""
+        if guild.id not in self._members:
+            self.build(guild)
+        cached = self._sorted.get(guild.id)
+        if cached is None:
+            cached = sorted(self._members[guild.id].values(), key=lambda m: (m.display_name.casefold(), m.id))
+            self._sorted[guild.id] = cached
+        return cached
+
+    def pages(self, guild: discord.Guild, per_page: int = PAGE_SIZE) -> List[List[discord.SelectOption]]:
+        per_page = max(4, min(25, per_page))
+        key = (guild.id, per_page)
+        cached = self._pages.get(key)
+        if cached is None:
+            cached = self._pages[key] = build_option_pages(self.members(guild), per_page)
+        return cached
+
+# ── 선택 뷰 ────────────────────────────────────────────────────────────────────
+class PagedPlayerSelectView(View):
+    """역할 보유 사용자 선택지를 페이지로 나눠 Select 제공. 정확히 4명 선택. 페이지는 RoleRoster가 미리 만든 것 사용."""
+    def __init__(self, pages: List[List[discord.SelectOption]], pool: aiomysql.Pool, config: GuildConfig):
+        super().__init__(timeout=120)
+        self.pages = pages
+        self.pool = pool
+        self.config = config
+        self.page = 0
+        self._rebuild()
+
+    @property
+    def total_pages(self) -> int:
+        return len(self.pages)
+
+    def _rebuild(self):
+        self.clear_items()
+        options = self.pages[self.page] if self.pages else []
+        if len(options) < 4:
+            self.add_item(Button(label="이 페이지 인원이 4명 미만입니다.", disabled=True))
+            self._add_pager()
+            return
+
+        select = Select(
+            placeholder=f"이 페이지에서 정확히 4명 선택 ({self.page+1}/{self.total_pages})",
+            min_values=4, max_values=4, options=list(options), custom_id=f"player_select_p{self.page}"
+        )
+
+        async def on_select(interaction: discord.Interaction):
+            selected_ids = [int(v) for v in select.values]
+            ordered = [interaction.guild.get_member(uid) for uid in selected_ids]
+            ordered = [m for m in ordered if m is not None]
+            if len(ordered) != 4:
+                await interaction.response.send_message("정확히 4명을 선택해야 합니다.", ephemeral=True)
+                return
+            await interaction.response.send_modal(ScoreModal(ordered, self.pool, self.config))
+
+        select.callback = on_select
+        self.add_item(select)
+        self._add_pager()
+
+    def _add_pager(self):
+        if self.total_pages <= 1:
+            return
+        prev_btn = Button(emoji="◀", style=discord.ButtonStyle.secondary, disabled=self.page == 0)
+        next_btn = Button(emoji="▶", style=discord.ButtonStyle.secondary, disabled=self.page >= self.total_pages - 1)
+
+        async def on_prev(itx: discord.Interaction):
+            self.page = max(0, self.page - 1)
+            self._rebuild()
+            await itx.response.edit_message(view=self)
+
+        async def on_next(itx: discord.Interaction):
+            self.page = min(self.total_pages - 1, self.page + 1)
+            self._rebuild()
+            await itx.response.edit_message(view=self)
+
+        prev_btn.callback = on_prev
+        next_btn.callback = on_next
+        self.add_item(prev_btn); self.add_item(next_btn)
+
+# ── 랭킹 계산 ──────────────────────────────────────────────────────────────────
+def iter_groupby_game(rows: Iterable[Tuple[int, int, int, int]]) -> Iterable[Tuple[int, List[Tuple[int,int,int,int]]]]:
+    """game_id 기준으로 묶기."""
+    cur_gid = None
+    bucket: List[Tuple[int,int,int,int]] = []
+    for gid, uid, sc, pos in rows:
+        if cur_gid is None:
+            cur_gid = gid
+        if gid != cur_gid:
+            yield cur_gid, bucket
+            bucket = []
+            cur_gid = gid
+        bucket.append((gid, uid, sc, pos))
+    if cur_gid is not None and bucket:
+        yield cur_gid, bucket
+
+def assign_ranks_for_game(game_rows: List[Tuple[int,int,int,int]]) -> Dict[int, int]:
+    """해당 게임의 user_id -> rank(1~4). 원점수 내림차순, 동점 ESWN."""
+    # 튜플: (uid, score, pos)
+    triples = [(uid, sc, pos) for (_, uid, sc, pos) in game_rows]
+    triples.sort(key=lambda t: rank_sort_key(t[1], t[2]))
+    return {uid: i+1 for i, (uid, _, _) in enumerate(triples)}
+
+def accumulate_game_points(bucket: List[Tuple[int,int,int,int]],
+                           totals: Dict[int, float], counts: Dict[int, int]) -> None:
+    """한 게임의 계산점을 totals/counts에 누적. 불완전 게임은 스킵."""
+    if len(bucket) != 4:
+        return
+    ranks = assign_ranks_for_game(bucket)
+    for _, uid, sc, _ in bucket:
+        rk = ranks[uid]
+        hp = calc_hanchan_points(sc, rk)
+        totals[uid] += hp
+        counts[uid] += 1
+
+def aggregate_points_py(rows: Iterable[Tuple[int, int, int, int]]) -> List[Tuple[int, float, int]]:
+    """게임별 파이썬 루프 집계(기준 구현). return: [(user_id, total_points, games), ...] (정렬됨)"""
+    totals: Dict[int, float] = defaultdict(float)
+    counts: Dict[int, int] = defaultdict(int)
+    for _, bucket in iter_groupby_game(rows):
+        accumulate_game_points(bucket, totals, counts)
+    result = [(uid, totals[uid], counts[uid]) for uid in totals.keys()]
+    result.sort(key=standings_sort_key)
+    return result
+
+# ── 배치 순위 엔진(NumPy) ─────────────────────────────────────────────────────
+# 게임 N개를 (N, 4) 배열로 묶어 한 번에 순위/계산점/사용자별 합계 산출.
+# 사용자별 합계는 bincount(게임 순서대로 순차 누적)라 파이썬 경로와 비트 단위로 같음.
+def pack_games(rows: Iterable[Tuple[int, int, int, int]]):
+    """
+    game_id 정렬된 행 -> (game_ids (N,), users (N,4), scores (N,4), positions (N,4)).
+    4인 완성 게임만 포함, 게임 내 행 순서 유지.
+    """
+    gids: List[int] = []
+    flat: List[Tuple[int, int, int]] = []
+    for gid, bucket in iter_groupby_game(rows):
+        if len(bucket) != 4:
+            continue
+        gids.append(gid)
+        flat.extend((uid, sc, pos) for _, uid, sc, pos in bucket)
+    arr = np.array(flat, dtype=np.int64).reshape(-1, 4, 3)
+    return np.array(gids, dtype=np.int64), arr[:, :, 0], arr[:, :, 1], arr[:, :, 2]
+
+_TIEBREAK_ARR = None if np is None else np.array([TIEBREAK_ESWN[p] for p in range(4)], dtype=np.int64)
+_UMA_ARR = None if np is None else np.array([0] + [UMA_BY_RANK[r] for r in (1, 2, 3, 4)], dtype=np.int64)
+
+def rank_games_np(scores, positions):
+    """(N,4) 원점수/좌석 -> (N,4) 순위(1~4). 원점수 내림차순, 동점 ESWN."""
+    order = np.lexsort((_TIEBREAK_ARR[positions], -scores), axis=1)
+    ranks = np.empty_like(order)
+    np.put_along_axis(ranks, order, np.arange(1, 5, dtype=order.dtype)[None, :], axis=1)
+    return ranks
+
+def aggregate_points_np(users, scores, positions) -> List[Tuple[int, float, int]]:
+    """
+    aggregate_points_py의 배열 버전. 결과는 비트 단위로 동일.
+    (한 게임에 같은 user_id가 두 번 나오는 비정상 데이터는 전제하지 않음)
+    """
+    if users.size == 0:
+        return []
+    ranks = rank_games_np(scores, positions)
+    hp = (scores - START_POINTS) / 1000.0 + _UMA_ARR[ranks]
+    uids, inv = np.unique(users.ravel(), return_inverse=True)
+    totals = np.bincount(inv, weights=hp.ravel(), minlength=uids.size)
+    counts = np.bincount(inv, minlength=uids.size)
+    result = [(int(u), float(t), int(c)) for u, t, c in zip(uids, totals, counts)]
+    result.sort(key=standings_sort_key)
+    return result
+
+def aggregate_packed(packed: array, engine: str = RANK_ENGINE) -> List[Tuple[int, float, int]]:
+    """StatsExecutor 작업: pack_rows 배열을 engine(numpy/python)으로 집계."""
+    if np is not None and engine == "numpy":
+        _, users, scores, positions = pack_games(unpack_rows(packed))
+        return aggregate_points_np(users, scores, positions)
+    return aggregate_points_py(unpack_rows(packed))
+
+@metered("fetch_packed_details")
+async def fetch_packed_details(pool: aiomysql.Pool, guild_id: int, *,
+                               chunk_size: int = STREAM_CHUNK) -> AsyncIterator[array]:
+    """길드의 game_detail 을 완성된 게임 단위 pack_rows 묶음으로 스트리밍."""
+    async with pool.acquire() as conn:
+        async with conn.cursor(aiomysql.SSCursor) as cur:
+            await cur.execute(
+                "SELECT game_id, user_id, score, position FROM game_detail WHERE guild_id=%s ORDER BY game_id ASC",
+                (guild_id,),
+            )
+            async for packed in iter_packed_games(cur, chunk_size):
+                yield packed
+        await conn.commit()
+
+async def compute_aggregate_points(pool: aiomysql.Pool, guild_id: int, *, stream: bool = False,
+                                   history: "HistorySnapshot | None" = None) -> List[Tuple[int, float, int]]:
+    """
+    길드의 사용자별 총 계산점 합계와 판수 (기본 규칙, player_standings 검증/벤치마크용).
+    집계는 StatsExecutor 에서: 이벤트 루프는 행을 읽어 배열로 묶기만 함.
+    history(DB 와 맞춰진 컬럼 스냅샷)가 있으면 DB 를 읽지 않고 워커가 파일을 직접 매핑.
+    stream=True 이면 청크 단위로 보내 합침(메모리 O(chunk), 합산 순서가 달라 마지막 자리는 다를 수 있음),
+    아니면 전체를 한 배열로 모아 RANK_ENGINE(numpy/python)으로 한 번에 집계.
+    return: [(user_id, total_points, games), ...]
+    """
+    if history is not None:
+        return await stats.run(aggregate_history, history.path, history.rows, RANK_ENGINE)
+    if not stream:
+        packed = array("q")
+        async for part in fetch_packed_details(pool, guild_id):
+            packed.extend(part)
+        return await stats.run(aggregate_packed, packed, RANK_ENGINE)
+
+    totals: Dict[int, float] = defaultdict(float)
+    counts: Dict[int, int] = defaultdict(int)
+    async for part in fetch_packed_details(pool, guild_id):
+        for uid, total, games in await stats.run(aggregate_packed, part, "python"):
+            totals[uid] += total
+            counts[uid] += games
+    result = [(uid, totals[uid], counts[uid]) for uid in totals.keys()]
+    result.sort(key=standings_sort_key)
+    return result
+
+# ── 게임 기록 컬럼 스냅샷(mmap) ───────────────────────────────────────────────
+# 길드별 game_detail 을 고정 폭 컬럼 파일로 보관 (game_id 오름차순, 4인 완성 게임만):
+#   {HISTORY_DIR}/{guild_id}/game_id.q  user_id.q  score.i  position.b  + meta.json
+# meta 의 (games, max_game_id, version_sum) 을 DB 의 (COUNT(*), MAX(id), SUM(version)) 과 비교(high-water mark):
+#   같으면 그대로, 새 게임만 늘었으면 그 뒤만 이어 받기, 그 밖(삭제/다른 프로세스의 수정)은 다시 만듦.
+# 전체 기록 집계는 DB 재조회 없이 워커 프로세스가 파일을 직접 mmap (행 복사/파이썬 int 박싱 없음):
+#   rebuild_standings/rebuild_pairs(/마장 순위재계산)가 잠금 시점의 DB 와 같은 스냅샷을 씀.
+# 워커가 매핑 중일 수 있으므로 파일을 자르거나 제자리에 덮어쓰지 않음: 새 파일을 써서 os.replace 로 교체
+# (기존 매핑은 이전 inode 를 계속 봄). 끝에 덧붙이기는 기존 매핑 범위를 건드리지 않음.
+# 파일 쓰기는 to_thread 로 이벤트 루프 밖에서, 스냅샷별 lock 으로 순서대로.
+HISTORY_COLUMNS = (("game_id", "q"), ("user_id", "q"), ("score", "i"), ("position", "b"))
+_HISTORY_NP_DTYPES = {"q": "i8", "i": "i4", "b": "i1"}
+
+def map_history_columns(path: str, rows: int) -> Dict[str, memoryview]:
+    """컬럼 파일 -> 앞 rows 행의 읽기 전용 memoryview (typecode 로 cast). 파일이 짧으면 ValueError."""
+    cols: Dict[str, memoryview] = {}
+    for name, code in HISTORY_COLUMNS:
+        size = rows * array(code).itemsize
+        if not size:
+            cols[name] = memoryview(array(code))
+            continue
+        with open(os.path.join(path, f"{name}.{code}"), "rb") as f:
+            if os.fstat(f.fileno()).st_size < size:
+                raise ValueError(f"{name}: 컬럼 파일이 meta 보다 짧음")
+            mm = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+        cols[name] = memoryview(mm).cast(code)
+    return cols
+
+def history_rows(path: str, rows: int) -> Iterable[Tuple[int, int, int, int]]:
+    """컬럼 스냅샷 앞 rows 행 -> (game_id, user_id, score, position) (game_id 오름차순)."""
+    cols = map_history_columns(path, rows)
+    return zip(*(cols[name] for name, _ in HISTORY_COLUMNS))
+
+def aggregate_history(path: str, rows: int, engine: str = RANK_ENGINE) -> List[Tuple[int, float, int]]:
+    """StatsExecutor 작업: 컬럼 스냅샷을 워커에서 직접 매핑해 집계 (aggregate_packed 와 같은 결과)."""
+    cols = map_history_columns(path, rows)
+    if np is not None and engine == "numpy":
+        users, scores, positions = (
+            np.frombuffer(cols[name], dtype=_HISTORY_NP_DTYPES[code]).reshape(-1, 4)
+            for name, code in HISTORY_COLUMNS[1:]
+        )
+        return aggregate_points_np(users, scores.astype(np.int64), positions.astype(np.int64))
+    return aggregate_points_py(history_rows(path, rows))
+
+class HistorySnapshot:
+    """
+    길드 하나의 컬럼 스냅샷. columns() 는 mmap 읽기 전용 memoryview.
+    추가는 컬럼 파일 끝에 쓰고 meta.json 을 마지막에 교체: meta 가 가리키는 행까지만 유효(그 뒤 꼬리는 로드 시 잘라냄,
+    로드는 워커가 매핑하기 전이고 잘리는 부분은 어떤 매핑 범위에도 없음).
+    점수 수정/초기화는 새 파일로 교체(game_id 컬럼 이진 탐색으로 위치 찾음).
+    DB 동기화(sync_history) 중에는 append/update 대신 stale 표시 -> 동기화가 끝나고 한 번 더 맞춤.
+    파일을 쓰는 메서드는 블로킹: 이벤트 루프에서는 lock 을 잡고 asyncio.to_thread 로 호출.
+    """
+    def __init__(self, root: str, guild_id: int):
+        self.guild_id = guild_id
+        self.path = os.path.join(root, str(guild_id))
+        self.meta = {"rows": 0, "games": 0, "max_game_id": 0, "version_sum": 0}
+        self.stale = True       # DB 와 맞춰 본 적 없음 / 맞출 수 없는 변경이 있었음
+        self.syncing = False
+        self.lock = asyncio.Lock()
+        self._cols: Dict[str, memoryview] = {}
+
+    def _file(self, name: str, code: str) -> str:
+        return os.path.join(self.path, f"{name}.{code}")
+
+    @property
+    def rows(self) -> int:
+        return self.meta["rows"]
+
+    def load(self) -> None:
+        """meta.json 과 컬럼 파일을 읽어 매핑. 없거나 손상됐으면 빈 스냅샷."""
+        os.makedirs(self.path, exist_ok=True)
+        try:
+            with open(os.path.join(self.path, "meta.json"), encoding="utf-8") as f:
+                meta = json.load(f)
+            for name, code in HISTORY_COLUMNS:
+                with open(self._file(name, code), "r+b") as col:
+                    col.truncate(meta["rows"] * array(code).itemsize)  # 마지막 meta 이후 꼬리 버림
+            self.meta = {k: int(meta[k]) for k in self.meta}
+            self._cols = map_history_columns(self.path, self.rows)
+        except (OSError, ValueError, KeyError):
+            self.reset()
+
+    def reset(self) -> None:
+        for name, code in HISTORY_COLUMNS:
+            self._replace_column(name, code, array(code))
+        self.meta = {"rows": 0, "games": 0, "max_game_id": 0, "version_sum": 0}
+        self._write_meta()
+        self._cols = map_history_columns(self.path, 0)
+
+    def _replace_column(self, name: str, code: str, col: array) -> None:
+        """컬럼 파일을 새 내용으로 교체. 워커가 매핑 중인 이전 파일은 자르지 않음(잘린 매핑 접근은 SIGBUS)."""
+        path = self._file(name, code)
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            col.tofile(f)
+        os.replace(tmp, path)
+
+    def columns(self) -> Dict[str, memoryview]:
+        return self._cols
+
+    def _write_meta(self) -> None:
+        tmp = os.path.join(self.path, "meta.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.meta, f)
+        os.replace(tmp, os.path.join(self.path, "meta.json"))
+
+    def append(self, packed: array) -> int:
+        """game_id 오름차순 pack_rows 묶음 추가 (4인 완성 게임만). max_game_id 이하 게임이 있으면 ValueError. return: 게임 수"""
+        cols = [array(code) for _, code in HISTORY_COLUMNS]
+        games, last = 0, self.meta["max_game_id"]
+        for gid, bucket in iter_groupby_game(unpack_rows(packed)):
+            if gid <= last:
+                raise ValueError(f"game_id {gid} <= {last}: 순서대로 추가해야 함")
+            if len(bucket) != 4:
+                continue
+            for row in bucket:
+                for col, v in zip(cols, row):
+                    col.append(v)
+            games, last = games + 1, gid
+        if not games:
+            return 0
+        for (name, code), col in zip(HISTORY_COLUMNS, cols):
+            with open(self._file(name, code), "ab") as f:
+                col.tofile(f)
+        self.meta.update(rows=self.rows + 4 * games, games=self.meta["games"] + games, max_game_id=last)
+        self._write_meta()
+        self._cols = map_history_columns(self.path, self.rows)  # 이전 매핑은 참조가 끝나면 해제
+        return games
+
+    def update_scores(self, game_id: int, rows: List[Tuple[int, int, int, int]]) -> bool:
+        """수정된 게임의 점수를 반영(score 컬럼 교체, game.version +1 반영). 스냅샷에 없는 게임이면 False"""
+        gids = self._cols["game_id"]
+        i = bisect.bisect_left(gids, game_id)
+        if i + 4 > len(gids) or gids[i] != game_id or gids[i + 3] != game_id:
+            return False
+        by_pos = {pos: (uid, sc) for _, uid, sc, pos in rows}
+        users, positions = self._cols["user_id"], self._cols["position"]
+        scores = array("i", self._cols["score"])
+        for k in range(i, i + 4):
+            uid, sc = by_pos.get(positions[k], (None, None))
+            if uid != users[k]:
+                return False
+            scores[k] = sc
+        # 제자리 덮어쓰기 대신 교체: 집계 중인 워커는 이전 파일을 끝까지 일관되게 읽음
+        self._replace_column("score", "i", scores)
+        self.meta["version_sum"] += 1
+        self._write_meta()
+        self._cols = map_history_columns(self.path, self.rows)
+        return True
+
+async def history_high_water(cur: aiomysql.Cursor, guild_id: int, *, lock: bool = False) -> Tuple[int, int, int]:
+    """DB 쪽 (게임 수, MAX(id), SUM(version)). lock=True 면 길드 game 행/범위를 공유 잠금(추가/수정/삭제 대기)."""
+    await cur.execute(
+        "SELECT COUNT(*), COALESCE(MAX(id), 0), COALESCE(SUM(version), 0) FROM game WHERE guild_id=%s"
+        + (" LOCK IN SHARE MODE" if lock else ""),
+        (guild_id,),
+    )
+    return tuple(int(v) for v in await cur.fetchone())
+
+def history_matches(snap: HistorySnapshot, mark: Tuple[int, int, int]) -> bool:
+    m = snap.meta
+    return not snap.stale and not snap.syncing and (m["games"], m["max_game_id"], m["version_sum"]) == mark
+
+async def locked_history_rows(conn: aiomysql.Connection, snap: HistorySnapshot | None, guild_id: int) -> int | None:
+    """
+    재계산 트랜잭션 안에서 game 을 공유 잠금으로 읽어 스냅샷과 비교. 같으면 스냅샷 행 수, 아니면(또는 snap 없음) None.
+    잠금은 트랜잭션 끝까지 유지: 그동안 DB 가 스냅샷과 달라지지 않음.
+    """
+    if snap is None or snap.stale or snap.syncing:
+        return None
+    async with conn.cursor() as cur:
+        mark = await history_high_water(cur, guild_id, lock=True)
+    return snap.rows if history_matches(snap, mark) else None
+
+async def history_accumulate(acc: Dict, add: Callable[[Dict, Iterable], None],
+                             fn: Callable[[str, int], List[Tuple[int, ...]]], snap: HistorySnapshot, rows: int) -> bool:
+    """워커에서 fn(스냅샷 경로, 행 수) 실행 후 acc 에 합침. 그사이 파일이 바뀌어 못 읽으면 False(DB 에서 다시 읽음)."""
+    try:
+        add(acc, await stats.run(fn, snap.path, rows))
+    except (OSError, ValueError):
+        log.warning("history snapshot unreadable (guild %d), reading game_detail", snap.guild_id)
+        return False
+    return True
+
+@metered("sync_history")
+async def sync_history(pool: aiomysql.Pool, snap: HistorySnapshot) -> str:
+    """
+    스냅샷을 DB 와 맞춤. 한 트랜잭션(일관된 읽기 시점)에서 high-water mark 와 행을 함께 읽음.
+    return: "fresh" | "appended" | "rebuilt"
+    """
+    async with snap.lock:
+        snap.syncing = True
+        try:
+            while True:
+                snap.stale = False
+                result = await _sync_history_once(pool, snap)
+                if not snap.stale:  # 동기화 중 들어온 변경이 있으면 한 번 더
+                    return result
+        except Exception:
+            snap.stale = True
+            raise
+        finally:
+            snap.syncing = False
+
+async def _sync_history_once(pool: aiomysql.Pool, snap: HistorySnapshot) -> str:
+    guild_id = snap.guild_id
+    async with pool.acquire() as conn:
+        await conn.begin()
+        try:
+            async with conn.cursor() as cur:
+                mark = await history_high_water(cur, guild_id)
+            m = snap.meta
+            if (m["games"], m["max_game_id"], m["version_sum"]) == mark:
+                await conn.commit()
+                return "fresh"
+            # 새 게임만 늘어난 경우(수정/삭제 없음): 마지막 game_id 뒤만 읽음.
+            # 전체 수만 비교하면 "삭제 1 + 새 게임 2" 도 추가로 보임 -> 스냅샷 범위 안의 게임 수가 그대로인지 확인
+            appended = m["version_sum"] == mark[2] and m["max_game_id"] < mark[1] and m["games"] < mark[0]
+            if appended:
+                async with conn.cursor() as cur:
+                    await cur.execute("SELECT COUNT(*) FROM game WHERE guild_id=%s AND id <= %s",
+                                      (guild_id, m["max_game_id"]))
+                    (kept,) = await cur.fetchone()
+                appended = int(kept) == m["games"]
+            if not appended:
+                await asyncio.to_thread(snap.reset)
+            async with conn.cursor(aiomysql.SSCursor) as ss:
+                await ss.execute(
+                    "SELECT game_id, user_id, score, position FROM game_detail "
+                    "WHERE guild_id=%s AND game_id > %s ORDER BY game_id ASC",
+                    (guild_id, snap.meta["max_game_id"]),
+                )
+                async for packed in iter_packed_games(ss):
+                    await asyncio.to_thread(snap.append, packed)
+            await conn.commit()
+        except Exception:
+            await conn.rollback()
+            raise
+    # 같은 읽기 시점의 high-water mark 로 확정 (4인 미만 게임은 행 없이 수에만 포함)
+    snap.meta.update(games=mark[0], max_game_id=mark[1], version_sum=mark[2])
+    await asyncio.to_thread(snap._write_meta)
+    return "appended" if appended else "rebuilt"
+
+class HistoryStore:
+    """
+    길드별 HistorySnapshot. 쓰기 경로는 커밋 후 on_commit/on_edit/on_delete 로 알림:
+    순서대로 이어 붙일 수 있는 변경은 바로 반영(파일 쓰기는 스레드에서), 나머지는 stale 표시 후 sync() 에서 DB 와 맞춤.
+    스냅샷은 sync() 로 처음 로드됨 (시작 시 게임 기록이 있는 길드마다).
+    """
+    def __init__(self, root: str = HISTORY_DIR):
+        self.root = root
+        self._snaps: Dict[int, HistorySnapshot] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.root)
+
+    def get(self, guild_id: int) -> HistorySnapshot | None:
+        return self._snaps.get(guild_id)
+
+    def fresh(self, guild_id: int) -> HistorySnapshot | None:
+        """DB 와 맞춰진 스냅샷 (없거나 stale 이면 None)."""
+        snap = self._snaps.get(guild_id)
+        return snap if snap is not None and not snap.stale and not snap.syncing else None
+
+    async def sync(self, pool: aiomysql.Pool, guild_id: int) -> str:
+        snap = self._snaps.get(guild_id)
+        if snap is None:
+            snap = HistorySnapshot(self.root, guild_id)
+            await asyncio.to_thread(snap.load)
+            snap = self._snaps.setdefault(guild_id, snap)
+        return await sync_history(pool, snap)
+
+    @staticmethod
+    def _skip(snap: HistorySnapshot) -> bool:
+        """동기화 중(이미 DB 에서 읽는 중)이거나 stale 이면 반영하지 않고 stale 표시 -> 동기화가 한 번 더 맞춤."""
+        if snap.stale or snap.syncing:
+            snap.stale = True
+            return True
+        return False
+
+    async def on_commit(self, guild_id: int, game_rows: List[Tuple[int, int, int, int]]) -> None:
+        snap = self._snaps.get(guild_id)
+        if snap is None or self._skip(snap):
+            return
+        async with snap.lock:
+            if self._skip(snap):
+                return
+            try:
+                await asyncio.to_thread(snap.append, pack_rows(game_rows))
+            except ValueError:
+                snap.stale = True
+
+    async def on_edit(self, guild_id: int, game_id: int, game_rows: List[Tuple[int, int, int, int]]) -> None:
+        snap = self._snaps.get(guild_id)
+        if snap is None or self._skip(snap):
+            return
+        async with snap.lock:
+            if self._skip(snap) or not await asyncio.to_thread(snap.update_scores, game_id, game_rows):
+                snap.stale = True
 
-# ── 선택 뷰 ────────────────────────────────────────────────────────────────────
-class PagedPlayerSelectView(View):
-    """역할 보유 사용자 목록을 페이지로 나눠 Select 제공. 정확히 4명 선택."""
-    def __init__(self, members: List[discord.Member], pool: aiomysql.Pool, per_page: int = PAGE_SIZE):
-        super().__init__(timeout=120)
-        self.members = members
-        self.pool = pool
-        self.per_page = max(4, min(25, per_page))
-        self.page = 0
-        self._rebuild()
+    def on_delete(self, guild_id: int) -> None:
+        snap = self._snaps.get(guild_id)
+        if snap is not None:
+            snap.stale = True
 
-    def _slice(self) -> List[discord.Member]:
-        s, e = self.page * self.per_page, (self.page + 1) * self.per_page
-        return self.members[s:e]
+    def stats(self) -> Dict[str, int]:
+        snaps = list(self._snaps.values())
+        return {
+            "guilds": len(snaps),
+            "stale": sum(s.stale for s in snaps),
+            "games": sum(s.meta["games"] for s in snaps),
+            "bytes": sum(s.rows for s in snaps) * sum(array(code).itemsize for _, code in HISTORY_COLUMNS),
+        }
 
-    @property
-    def total_pages(self) -> int:
-        n = len(self.members)
-        return (n + self.per_page - 1) // self.per_page
+# ── 순위 캐시 ─────────────────────────────────────────────────────────────────
+class StandingsCache:
+    """
+    순위 결과 프로세스 캐시.
+      - version: 데이터 버전. 쓰기 경로가 invalidate()로 올리면 이전 결과는 미스 처리
+      - 같은 키/버전의 동시 요청은 진행 중인 재계산 하나를 공유
+      - 키 단위 무효화는 항목과 진행 중 재계산을 함께 떼어냄: 떼어낸 재계산의 결과는 저장하지 않으므로
+        키별 버전을 따로 들고 있지 않음 (캐시에 없는 키는 상태가 남지 않음)
+      - hits / misses / recomputes / shared 카운터로 동작 확인
+    """
+    def __init__(self):
+        self.version = 0
+        self._entries: Dict[Hashable, Tuple[int, Any]] = {}
+        self._inflight: Dict[Hashable, Tuple[int, asyncio.Future]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.recomputes = 0
+        self.shared = 0
 
-    def _rebuild(self):
-        self.clear_items()
-        page_members = self._slice()
-        if len(page_members) < 4:
-            self.add_item(Button(label="이 페이지 인원이 4명 미만입니다.", disabled=True))
-            self._add_pager()
+    def invalidate(self, *keys: Hashable) -> None:
+        """키 없이 호출하면 전체 버전 증가, 키를 주면 해당 항목만 무효화."""
+        if not keys:
+            self.version += 1
+            self._entries.clear()
+            self._inflight.clear()
             return
+        for k in keys:
+            self._entries.pop(k, None)
+            self._inflight.pop(k, None)
 
-        options = [discord.SelectOption(label=m.display_name[:100], value=str(m.id)) for m in page_members]
-        select = Select(
-            placeholder=f"이 페이지에서 정확히 4명 선택 ({self.page+1}/{self.total_pages})",
-            min_values=4, max_values=4, options=options, custom_id=f"player_select_p{self.page}"
-        )
+    async def get(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        stamp = self.version
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == stamp:
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
 
-        async def on_select(interaction: discord.Interaction):
-            selected_ids = [int(v) for v in select.values]
-            ordered = [interaction.guild.get_member(uid) for uid in selected_ids]
-            ordered = [m for m in ordered if m is not None]
-            if len(ordered) != 4:
-                await interaction.response.send_message("정확히 4명을 선택해야 합니다.", ephemeral=True)
+        inflight = self._inflight.get(key)
+        if inflight is not None and inflight[0] == stamp:
+            self.shared += 1
+            return await asyncio.shield(inflight[1])
+
+        self.recomputes += 1
+        task = asyncio.ensure_future(loader())
+        self._inflight[key] = (stamp, task)
+
+        def _done(t: asyncio.Future) -> None:
+            cur = self._inflight.get(key)
+            if cur is None or cur[1] is not t:
+                return  # 계산 도중 무효화됐거나 새 재계산으로 교체됨 -> 결과를 버림
+            del self._inflight[key]
+            if t.cancelled() or t.exception() is not None or stamp != self.version:
                 return
-            await interaction.response.send_modal(ScoreModal(ordered, self.pool))
+            self._entries[key] = (stamp, t.result())
 
-        select.callback = on_select
-        self.add_item(select)
-        self._add_pager()
+        task.add_done_callback(_done)
+        log.info("standings cache recompute key=%r version=%d %s", key, self.version, self.stats())
+        # 호출자가 취소돼도 공유 중인 재계산은 계속 진행
+        return await asyncio.shield(task)
 
-    def _add_pager(self):
-        if self.total_pages <= 1:
-            return
-        prev_btn = Button(emoji="◀", style=discord.ButtonStyle.secondary, disabled=self.page == 0)
-        next_btn = Button(emoji="▶", style=discord.ButtonStyle.secondary, disabled=self.page >= self.total_pages - 1)
+    def stats(self) -> Dict[str, int]:
+        return {
+            "version": self.version, "hits": self.hits, "misses": self.misses,
+            "recomputes": self.recomputes, "shared": self.shared,
+        }
 
-        async def on_prev(itx: discord.Interaction):
-            self.page = max(0, self.page - 1)
-            self._rebuild()
-            await itx.response.edit_message(view=self)
+def cache_stats(caches: Dict[int, StandingsCache]) -> Dict[str, int]:
+    """길드별 캐시 카운터 합계 (version 은 최댓값)."""
+    total = {"guilds": len(caches), "version": 0, "hits": 0, "misses": 0, "recomputes": 0, "shared": 0}
+    for c in caches.values():
+        for k, v in c.stats().items():
+            total[k] = max(total[k], v) if k == "version" else total[k] + v
+    return total
 
-        async def on_next(itx: discord.Interaction):
-            self.page = min(self.total_pages - 1, self.page + 1)
-            self._rebuild()
-            await itx.response.edit_message(view=self)
+# ── 순위표 페이지 ─────────────────────────────────────────────────────────────
+def rating_sort_key(t: Tuple[int, float, int]) -> Tuple[float, int]:
+    """정렬: 레이팅 내림차순, user_id 오름차순"""
+    return (-t[1], t[0])
 
-        prev_btn.callback = on_prev
-        next_btn.callback = on_next
-        self.add_item(prev_btn); self.add_item(next_btn)
+class Leaderboard:
+    """
+    정렬된 순위 목록 + keyset 페이지 조회. 캐시에 이 객체째 보관해 색인은 데이터 버전당 한 번만 만듦.
+      - keys[i] = rows[i] 의 정렬 키(오름차순). 페이지 위치는 인덱스가 아니라 첫 항목의 키로 표현:
+        페이지를 넘기는 사이 목록이 갱신돼도 bisect 로 같은 자리를 찾음
+      - 페이지 조회 O(log n + 페이지 크기), 사용자 순위는 user_id -> 인덱스 dict 로 O(1)
+    """
+    __slots__ = ("rows", "keys", "_index")
 
-# ── 랭킹 계산 ──────────────────────────────────────────────────────────────────
-def iter_groupby_game(rows: Iterable[Tuple[int, int, int, int]]) -> Iterable[Tuple[int, List[Tuple[int,int,int,int]]]]:
-    """game_id 기준으로 묶기."""
-    cur_gid = None
-    bucket: List[Tuple[int,int,int,int]] = []
-    for gid, uid, sc, pos in rows:
-        if cur_gid is None:
-            cur_gid = gid
-        if gid != cur_gid:
-            yield cur_gid, bucket
-            bucket = []
-            cur_gid = gid
-        bucket.append((gid, uid, sc, pos))
-    if cur_gid is not None and bucket:
-        yield cur_gid, bucket
+    def __init__(self, rows: List[Tuple[int, float, int]], key: Callable[[Tuple[int, float, int]], Any]):
+        self.rows = rows
+        self.keys = [key(r) for r in rows]
+        self._index = {r[0]: i for i, r in enumerate(rows)}
 
-def assign_ranks_for_game(game_rows: List[Tuple[int,int,int,int]]) -> Dict[int, int]:
-    """해당 게임의 user_id -> rank(1~4). 원점수 내림차순, 동점 ESWN."""
-    # 튜플: (uid, score, pos)
-    triples = [(uid, sc, pos) for (_, uid, sc, pos) in game_rows]
-    triples.sort(key=lambda t: rank_sort_key(t[1], t[2]))
-    return {uid: i+1 for i, (uid, _, _) in enumerate(triples)}
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def seek(self, first_key: Any | None) -> int:
+        """first_key 이상인 첫 인덱스 (None 이면 0)."""
+        return 0 if first_key is None else bisect.bisect_left(self.keys, first_key)
+
+    def key_at(self, index: int) -> Any | None:
+        return self.keys[index] if 0 < index < len(self.keys) else None
+
+    def index_of(self, user_id: int) -> int | None:
+        return self._index.get(user_id)
 
-async def compute_aggregate_points(pool: aiomysql.Pool) -> List[Tuple[int, float, int]]:
+    def page(self, start: int, size: int) -> List[Tuple[int, float, int]]:
+        return self.rows[start:start + size]
+
+class LeaderboardView(View):
     """
-    사용자별 총 계산점 합계와 판수.
-    return: [(user_id, total_points, games), ...]
+    순위 페이지 넘기기(◀ ▶)와 '내 순위'. 누를 때마다 load() 로 최신 Leaderboard(캐시)를 받아
+    현재 페이지 첫 항목의 키(first_key)에서 다시 찾음.
+    render(board, start, rows) -> 페이지 임베드.
     """
-    rows = await fetch_all_details(pool)
-    if not rows:
-        return []
-    totals: Dict[int, float] = defaultdict(float)
-    counts: Dict[int, int] = defaultdict(int)
+    def __init__(self, load: Callable[[], Awaitable[Leaderboard]],
+                 render: Callable[[Leaderboard, int, List[Tuple[int, float, int]]], discord.Embed],
+                 user_id: int, page_size: int):
+        super().__init__(timeout=300)
+        self.load = load
+        self.render = render
+        self.user_id = user_id
+        self.page_size = page_size
+        self.first_key: Any | None = None
 
-    for gid, bucket in iter_groupby_game(rows):
-        if len(bucket) != 4:
-            # 불완전 게임은 스킵
-            continue
-        ranks = assign_ranks_for_game(bucket)
-        for _, uid, sc, _ in bucket:
-            rk = ranks[uid]
-            hp = calc_hanchan_points(sc, rk)
-            totals[uid] += hp
-            counts[uid] += 1
+        self.prev_btn = Button(emoji="◀", style=discord.ButtonStyle.secondary)
+        self.next_btn = Button(emoji="▶", style=discord.ButtonStyle.secondary)
+        self.me_btn = Button(label="내 순위", style=discord.ButtonStyle.primary)
+        self.prev_btn.callback = self._on_prev
+        self.next_btn.callback = self._on_next
+        self.me_btn.callback = self._on_me
+        for b in (self.prev_btn, self.next_btn, self.me_btn):
+            self.add_item(b)
 
-    result = [(uid, totals[uid], counts[uid]) for uid in totals.keys()]
-    # 정렬: 평균 내림차순, 총점 내림차순, user_id 오름차순
-    result.sort(key=lambda t: (-(t[1] / t[2] if t[2] else -1e9), -t[1], t[0]))
-    return result
+    def build(self, board: Leaderboard, start: int) -> discord.Embed:
+        """start 페이지로 이동해 버튼 상태 갱신 후 임베드 반환."""
+        start = max(0, min(start, len(board) - 1))
+        self.first_key = board.key_at(start)
+        self.prev_btn.disabled = start == 0
+        self.next_btn.disabled = start + self.page_size >= len(board)
+        self.me_btn.disabled = board.index_of(self.user_id) is None
+        return self.render(board, start, board.page(start, self.page_size))
+
+    async def _show(self, itx: discord.Interaction, move: Callable[[Leaderboard, int], int]) -> None:
+        board = await self.load()
+        if not len(board):
+            await itx.response.edit_message(content="데이터가 없습니다.", embed=None, view=None)
+            return
+        await itx.response.edit_message(embed=self.build(board, move(board, board.seek(self.first_key))), view=self)
+
+    async def _on_prev(self, itx: discord.Interaction) -> None:
+        await self._show(itx, lambda board, start: start - self.page_size)
+
+    async def _on_next(self, itx: discord.Interaction) -> None:
+        await self._show(itx, lambda board, start: start + self.page_size)
+
+    async def _on_me(self, itx: discord.Interaction) -> None:
+        def move(board: Leaderboard, start: int) -> int:
+            i = board.index_of(self.user_id)
+            return start if i is None else i - i % self.page_size
+        await self._show(itx, move)
+
+# ── 시작 단계: 시간 측정 / 풀 예열 / 명령 동기화 ──────────────────────────────
+PROCESS_T0 = time.perf_counter()  # 모듈 로드 시각 ≈ 프로세스 시작
+
+class StartupTimer:
+    """setup_hook 단계별 소요 시간. 로그 한 줄 + mm_startup_seconds{phase} 게이지로 노출."""
+    def __init__(self):
+        self.phases: List[Tuple[str, float]] = []
+
+    @contextmanager
+    def phase(self, name: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - t0))
+
+    def mark(self, name: str, seconds: float) -> None:
+        self.phases.append((name, seconds))
+
+    def summary(self) -> str:
+        return " ".join(f"{name}={sec:.2f}s" for name, sec in self.phases)
+
+async def prewarm_pool(pool: aiomysql.Pool, n: int) -> int:
+    """연결 n개를 동시에 잡아 SELECT 1: 재시작 직후 첫 명령들이 연결 수립 비용을 내지 않게. return: 확인한 연결 수"""
+    async def ping() -> None:
+        async with pool.acquire() as conn, conn.cursor() as cur:
+            await cur.execute("SELECT 1")
+            await cur.fetchone()
+            await conn.commit()
+    n = max(0, min(n, pool.maxsize))
+    await asyncio.gather(*(ping() for _ in range(n)))
+    return n
+
+def command_tree_hash(tree: app_commands.CommandTree, application_id: int | None) -> str:
+    """등록된 명령 정의(이름/설명/옵션/권한) + 애플리케이션 ID 의 SHA-256."""
+    payload = {
+        "application_id": application_id,
+        "commands": sorted((c.to_dict(tree) for c in tree.get_commands()), key=lambda d: d["name"]),
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+async def sync_commands_if_changed(tree: app_commands.CommandTree, application_id: int | None,
+                                   path: str = COMMAND_HASH_PATH, *, force: bool = COMMAND_SYNC_FORCE) -> bool:
+    """명령 정의 해시가 저장된 값과 다를 때만 tree.sync(). 성공 후 해시 저장. return: 동기화 여부"""
+    digest = command_tree_hash(tree, application_id)
+    try:
+        with open(path, encoding="utf-8") as f:
+            stored = f.read().strip()
+    except FileNotFoundError:
+        stored = ""
+    if stored == digest and not force:
+        return False
+    await tree.sync()
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(digest + "\n")
+    os.replace(tmp, path)
+    return True
 
 # ── BOT ────────────────────────────────────────────────────────────────────────
-mahjong_group = app_commands.Group(name="마장", description="마장 명령 모음")
+mahjong_group = app_commands.Group(name="마장", description="마장 명령 모음", guild_only=True)
 
-class MyBot(discord.Client):
+class MeteredTree(app_commands.CommandTree):
+    """슬래시 명령 지연/오류 기록. 시작 시각은 interaction.extras 에 보관, 완료는 on_app_command_completion."""
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        interaction.extras["mm_t0"] = time.perf_counter()
+        return True
+
+    async def on_error(self, interaction: discord.Interaction, error: app_commands.AppCommandError) -> None:
+        name = interaction.command.qualified_name if interaction.command else "?"
+        metrics.inc("mm_errors_total", kind="mm_command_seconds", command=name)
+        t0 = interaction.extras.get("mm_t0")
+        if t0 is not None:
+            metrics.observe("mm_command_seconds", time.perf_counter() - t0, command=name)
+        await super().on_error(interaction, error)
+
+class MyBot(discord.AutoShardedClient):
+    """여러 길드용: 샤드 수는 Discord 권장값, 캐시/레이팅 재계산은 길드별."""
     def __init__(self):
         intents = discord.Intents.default()
         intents.members = True
         super().__init__(intents=intents)
-        self.tree = app_commands.CommandTree(self)
+        self.tree = MeteredTree(self)
         self.db_pool: aiomysql.Pool | None = None
+        self.guild_configs = GuildConfigs()
+        # 길드별 캐시: 한 길드의 점수 입력이 다른 길드 순위를 무효화하지 않음
+        self.standings_cache: Dict[int, StandingsCache] = defaultdict(StandingsCache)
+        self.player_cache: Dict[int, StandingsCache] = defaultdict(StandingsCache)  # 키 = user_id
+        self.roster = RoleRoster(lambda guild_id: self.guild_configs.get(guild_id).role_name)
+        self.recent_games = RecentGames(GAME_LRU_SIZE)
+        self.score_writer: ScoreWriter | None = None
+        self.updater = MessageUpdater(self)
+        self._bg_tasks: List[asyncio.Task] = []
+        self._rating_task: asyncio.Task | None = None
+        self._rating_dirty: set = set()   # 재계산 대기 길드
+        self.loop_monitor = LoopLagMonitor()
+        self.startup = StartupTimer()
+        self.history = HistoryStore()
+        self._metrics_runner: web.AppRunner | None = None
+        metrics.add_collector(self._collect_gauges)
 
     async def setup_hook(self):
-        self.db_pool = await aiomysql.create_pool(
-            host=DB_HOST, port=DB_PORT,
-            user=DB_USER, password=DB_PASSWORD, db=DB_NAME,
-            autocommit=False, minsize=1, maxsize=5,
+        timer = self.startup
+        stats.start()
+        with timer.phase("db_pool"):
+            self.db_pool = MeteredPool(await aiomysql.create_pool(
+                host=DB_HOST, port=DB_PORT,
+                user=DB_USER, password=DB_PASSWORD, db=DB_NAME,
+                autocommit=False, minsize=max(1, min(DB_POOL_PREWARM, DB_POOL_MAX)), maxsize=DB_POOL_MAX,
+            ))
+            await prewarm_pool(self.db_pool, DB_POOL_PREWARM)
+        with timer.phase("migrations"):
+            applied = await run_migrations(self.db_pool)
+            if LEGACY_GUILD_ID:
+                moved = await adopt_legacy_rows(self.db_pool, LEGACY_GUILD_ID)
+                if moved:
+                    log.info("moved %d legacy game(s) to guild %d", moved, LEGACY_GUILD_ID)
+            else:
+                legacy = await count_legacy_games(self.db_pool)
+                if legacy:
+                    log.warning("%d game(s) from before guild support are hidden (guild_id=0): "
+                                "set LEGACY_GUILD_ID to the guild that should own them and restart", legacy)
+            if STANDINGS_MIGRATION in applied:
+                # 기존 게임 기록이 있는 DB 에 누적 테이블을 새로 만든 경우: 한 번 채움
+                users = await rebuild_standings(self.db_pool, LEGACY_GUILD_ID)
+                snaps = await rebuild_snapshots(self.db_pool, LEGACY_GUILD_ID)
+                log.info("standings initialised: %d users, %d snapshots", users, snaps)
+            game_guilds = await fetch_game_guilds(self.db_pool)
+            if PAIRS_MIGRATION in applied:
+                for guild_id in game_guilds:
+                    log.info("head-to-head initialised: guild %d, %d pairs", guild_id,
+                             await rebuild_pairs(self.db_pool, guild_id))
+        with timer.phase("guild_configs"):
+            log.info("guild configs loaded: %d", await self.guild_configs.load(self.db_pool))
+        for guild_id, dirty in game_guilds.items():
+            if dirty:
+                self.schedule_rating_replay(guild_id)  # 이전 실행에서 남은 재계산 표시 처리
+        with timer.phase("journal"):
+            self.score_writer = ScoreWriter(ScoreJournal(JOURNAL_PATH), self.db_pool,
+                                            self._on_game_committed, self._on_game_message,
+                                            on_ratings_dirty=self.schedule_rating_replay)
+            replay = self.score_writer.start()
+            if replay:
+                log.info("score journal: replaying %d uncommitted game(s)", replay)
+        with timer.phase("command_sync"):
+            self.tree.add_command(mahjong_group)
+            synced = await sync_commands_if_changed(self.tree, self.application_id)
+            log.info("command tree %s", "synced" if synced else "unchanged, sync skipped")
+        self._bg_tasks.append(asyncio.create_task(self._snapshot_loop()))
+        if self.history.enabled:
+            self._bg_tasks.append(asyncio.create_task(self._sync_history(list(game_guilds))))
+        self.loop_monitor.start()
+        if METRICS_PORT:
+            with timer.phase("metrics"):
+                self._metrics_runner = await start_metrics_server(METRICS_HOST, METRICS_PORT)
+            log.info("metrics on http://%s:%d/metrics", METRICS_HOST, METRICS_PORT)
+        timer.mark("setup_total", time.perf_counter() - PROCESS_T0)
+        log.info("startup: %s", timer.summary())
+
+    def _collect_gauges(self) -> Iterable[Tuple[str, Dict[str, str], float]]:
+        pool = self.db_pool
+        if pool is not None:
+            yield "mm_db_pool_size", {}, pool.size
+            yield "mm_db_pool_free", {}, pool.freesize
+            yield "mm_db_pool_max", {}, pool.maxsize
+            yield "mm_db_pool_waiting", {}, getattr(pool, "waiting", 0)
+        if self.score_writer is not None:
+            yield "mm_write_pending", {}, self.score_writer.backlog()
+        yield "mm_message_pending", {}, self.updater.backlog()
+        yield "mm_stats_workers", {}, stats.workers
+        if self.history.enabled:
+            for k, v in self.history.stats().items():
+                yield "mm_history_" + k, {}, v
+        for phase, seconds in self.startup.phases:
+            yield "mm_startup_seconds", {"phase": phase}, seconds
+        yield "mm_guilds", {}, len(self.guilds)
+        for shard_id, latency in self.latencies:
+            yield "mm_shard_latency_seconds", {"shard": str(shard_id)}, latency
+        for cache_name, caches in (("standings", self.standings_cache), ("player", self.player_cache)):
+            for k, v in cache_stats(caches).items():
+                yield "mm_cache_" + k, {"cache": cache_name}, v
+
+    def invalidate_game(self, guild_id: int, user_ids: Iterable[int]) -> None:
+        """게임 저장/수정/삭제 커밋 후 호출: 그 길드의 순위 캐시 전체 + 해당 사용자 개인 기록 무효화."""
+        self.standings_cache[guild_id].invalidate()
+        self.player_cache[guild_id].invalidate(*{int(u) for u in user_ids})
+
+    def schedule_rating_replay(self, guild_id: int) -> None:
+        """수정/삭제 커밋 후 호출: 레이팅 재계산을 백그라운드 한 곳에서 길드 순서대로. 진행 중이면 대기 목록에 추가."""
+        self._rating_dirty.add(guild_id)
+        if self._rating_task is None or self._rating_task.done():
+            self._rating_task = asyncio.create_task(self._replay_ratings())
+
+    async def _replay_ratings(self) -> None:
+        while self._rating_dirty:
+            guild_id = self._rating_dirty.pop()
+            try:
+                n = await replay_ratings(self.db_pool, guild_id)
+                if n:
+                    log.info("ratings replayed: guild %d, %d game(s)", guild_id, n)
+            except Exception:
+                log.exception("rating replay failed (guild %d)", guild_id)
+            self.standings_cache[guild_id].invalidate("rating")
+
+    async def _on_game_committed(self, entry: PendingGame) -> None:
+        """ScoreWriter 커밋 콜백(게임마다 한 번): 캐시 갱신 + 이미 게시된 공개 메시지 교체."""
+        rows = entry.row_dicts()
+        self.invalidate_game(entry.guild_id, [r["user_id"] for r in rows])
+        await self.history.on_commit(entry.guild_id, entry.detail_rows())
+        self.recent_games.put(entry.guild_id, entry.game_id, 0, entry.date, rows)
+        await self._on_game_message(entry)
+
+    async def _on_game_message(self, entry: PendingGame) -> None:
+        """커밋된 게임의 공개 메시지를 game_id 임베드/버튼으로 교체. 메시지가 커밋 뒤에 게시되면 단독 호출."""
+        if entry.message_id is None:
+            return
+        rows = entry.row_dicts()
+        rules = self.guild_configs.get(entry.guild_id).rules
+        self.updater.edit(
+            entry.channel_id, entry.message_id,
+            embed=build_game_embed(entry.game_id, rows, title_prefix="게임 결과", rules=rules),
+            view=ManageGameView(entry.game_id, entry.message_id, entry.channel_id),
         )
-        self.tree.add_command(mahjong_group)
-        await self.tree.sync()
+
+    async def _snapshot_loop(self):
+        """기간 순위용 누적 스냅샷 주기 생성 + 컬럼 스냅샷 DB 대조 (게임 기록이 있는 길드마다)."""
+        while True:
+            await asyncio.sleep(SNAPSHOT_PERIOD_SEC)
+            try:
+                guild_ids = list(await fetch_game_guilds(self.db_pool))
+                for guild_id in guild_ids:
+                    snap = await take_snapshot(self.db_pool, guild_id)
+                    if snap is not None:
+                        log.info("standings snapshot created: guild %d, game_id=%d", guild_id, snap)
+            except Exception:
+                log.exception("standings snapshot failed")
+                continue
+            if self.history.enabled:
+                await self._sync_history(guild_ids)
+
+    async def _sync_history(self, guild_ids: List[int]) -> None:
+        """컬럼 스냅샷을 DB high-water mark 와 맞춤. 시작 시에는 mmap 로드 + 밀린 게임만 이어 받기."""
+        for guild_id in guild_ids:
+            t0 = time.perf_counter()
+            try:
+                result = await self.history.sync(self.db_pool, guild_id)
+            except Exception:
+                log.exception("history snapshot sync failed (guild %d)", guild_id)
+                continue
+            if result != "fresh":
+                log.info("history snapshot %s: guild %d, %d games, %.2fs", result, guild_id,
+                         self.history.get(guild_id).meta["games"], time.perf_counter() - t0)
 
     async def close(self):
+        for t in self._bg_tasks:
+            t.cancel()
+        self.loop_monitor.close()
+        stats.close()
+        if self._rating_task is not None:
+            self._rating_task.cancel()
+        if self.score_writer is not None:
+            await self.score_writer.close()
+        await self.updater.close()
+        if self._metrics_runner is not None:
+            await self._metrics_runner.cleanup()
         if self.db_pool is not None:
             self.db_pool.close()
             await self.db_pool.wait_closed()
@@ -451,63 +3688,472 @@ class MyBot(discord.Client):
 
 bot = MyBot()
 
+@bot.event
+async def on_app_command_completion(interaction: discord.Interaction, command: app_commands.Command):
+    t0 = interaction.extras.get("mm_t0")
+    if t0 is not None:
+        metrics.observe("mm_command_seconds", time.perf_counter() - t0, command=command.qualified_name)
+
 # ── /마장 ─────────────────────────────────────────────────────────────────────
-@mahjong_group.command(name="점수입력", description=f"{ROLE_NAME} 역할 4명 선택 후 점수 입력")
-async def cmd_score_input(interaction: discord.Interaction):
-    if interaction.channel_id != CHANNEL_ID:
+async def channel_config(interaction: discord.Interaction) -> GuildConfig | None:
+    """길드 설정의 지정 채널에서 온 요청이면 그 설정, 아니면 거절 응답 후 None."""
+    if interaction.guild_id is None:
+        await interaction.response.send_message("길드에서만 사용 가능합니다.", ephemeral=True)
+        return None
+    cfg = bot.guild_configs.get(interaction.guild_id)
+    if not cfg.allows(interaction.channel_id):
         await interaction.response.send_message("지정 채널에서만 사용 가능합니다.", ephemeral=True)
+        return None
+    return cfg
+
+@mahjong_group.command(name="점수입력", description="선수 역할 4명 선택 후 점수 입력")
+async def cmd_score_input(interaction: discord.Interaction):
+    cfg = await channel_config(interaction)
+    if cfg is None:
         return
     guild = interaction.guild
-    if guild is None:
-        await interaction.response.send_message("길드에서만 사용 가능합니다.", ephemeral=True)
-        return
     if bot.db_pool is None:
         await interaction.response.send_message("DB 연결 초기화 실패", ephemeral=True)
         return
-    role = discord.utils.get(guild.roles, name=ROLE_NAME)
+    role = discord.utils.get(guild.roles, name=cfg.role_name)
     if role is None:
-        await interaction.response.send_message(f"역할 '{ROLE_NAME}' 없음", ephemeral=True)
+        await interaction.response.send_message(f"역할 '{cfg.role_name}' 없음", ephemeral=True)
         return
-    members = [m for m in guild.members if (role in m.roles and not m.bot)]
+    members = bot.roster.members(guild)
     if len(members) < 4:
         await interaction.response.send_message("인원 부족: 최소 4명 필요", ephemeral=True)
         return
-    view = PagedPlayerSelectView(members, pool=bot.db_pool, per_page=PAGE_SIZE)
+    view = PagedPlayerSelectView(bot.roster.pages(guild, PAGE_SIZE), pool=bot.db_pool, config=cfg)
     await interaction.response.send_message("현재 페이지에서 정확히 4명을 선택하세요.", view=view, ephemeral=True)
 
-@mahjong_group.command(name="순위조회", description="계산점 기준 상위 사용자(평균=총점/판수)")
-@app_commands.describe(limit="상위 N명 (기본 10)")
-async def cmd_rank(interaction: discord.Interaction, limit: int = 10):
-    if interaction.channel_id != CHANNEL_ID:
-        await interaction.response.send_message("지정 채널에서만 사용 가능합니다.", ephemeral=True)
+@mahjong_group.command(name="점수입력검색", description="선수 역할 4명을 이름 검색으로 지정 후 점수 입력")
+@app_commands.rename(east=POS_LABEL[0], west=POS_LABEL[1], south=POS_LABEL[2], north=POS_LABEL[3])
+@app_commands.describe(
+    east=f"{POS_LABEL[0]} 좌석", west=f"{POS_LABEL[1]} 좌석", south=f"{POS_LABEL[2]} 좌석", north=f"{POS_LABEL[3]} 좌석",
+)
+async def cmd_score_input_search(interaction: discord.Interaction, east: str, west: str, south: str, north: str):
+    cfg = await channel_config(interaction)
+    if cfg is None:
+        return
+    guild = interaction.guild
+    if bot.db_pool is None:
+        await interaction.response.send_message("DB 연결 초기화 실패", ephemeral=True)
+        return
+    eligible = {m.id: m for m in bot.roster.members(guild)}
+    ordered: List[discord.Member] = []
+    for p, raw in enumerate((east, west, south, north)):
+        m = eligible.get(int(raw)) if raw.isdigit() else None
+        if m is None:
+            await interaction.response.send_message(
+                f"{POS_LABEL[p]}: 목록에서 '{cfg.role_name}' 역할 멤버를 선택하세요.", ephemeral=True
+            )
+            return
+        ordered.append(m)
+    if len({m.id for m in ordered}) != 4:
+        await interaction.response.send_message("서로 다른 4명을 지정해야 합니다.", ephemeral=True)
+        return
+    await interaction.response.send_modal(ScoreModal(ordered, bot.db_pool, cfg))
+
+@cmd_score_input_search.autocomplete("east")
+@cmd_score_input_search.autocomplete("west")
+@cmd_score_input_search.autocomplete("south")
+@cmd_score_input_search.autocomplete("north")
+async def player_autocomplete(interaction: discord.Interaction, current: str) -> List[app_commands.Choice[str]]:
+    guild = interaction.guild
+    if guild is None:
+        return []
+    # 다른 좌석에 이미 고른 멤버는 제외. Namespace 키는 디스코드 쪽 이름(rename 된 POS_LABEL)
+    chosen = vars(interaction.namespace)
+    taken = {str(chosen.get(POS_LABEL[p])) for p in range(4)}
+    found = bot.roster.search(guild, current, limit=25 + 4)
+    return [
+        app_commands.Choice(name=m.display_name[:100], value=str(m.id))
+        for m in found if str(m.id) not in taken
+    ][:25]
+
+@mahjong_group.command(name="순위조회", description="계산점 기준 순위(평균=총점/판수), 페이지 넘기기/내 순위")
+@app_commands.describe(
+    limit="페이지당 인원 (기본 10, 최대 25)",
+    start="기간 시작일 YYYY-MM-DD",
+    end="기간 종료일 YYYY-MM-DD (포함)",
+    month="월 YYYY-MM",
+    season="시즌 이름",
+    sort="정렬 기준 (레이팅은 전체 기간만)",
+)
+@app_commands.choices(sort=[
+    app_commands.Choice(name="평균 계산점", value="avg"),
+    app_commands.Choice(name="레이팅", value="rating"),
+])
+async def cmd_rank(interaction: discord.Interaction, limit: int = 10,
+                   start: str | None = None, end: str | None = None,
+                   month: str | None = None, season: str | None = None, sort: str = "avg"):
+    cfg = await channel_config(interaction)
+    if cfg is None:
         return
+    guild_id, rules = cfg.guild_id, cfg.rules
+    cache = bot.standings_cache[guild_id]
     pool = bot.db_pool
     if pool is None:
         await interaction.response.send_message("DB 연결 초기화 실패", ephemeral=True)
         return
+    try:
+        window = parse_rank_window(start, end, month, season)
+    except ValueError as e:
+        await interaction.response.send_message(str(e), ephemeral=True)
+        return
+
+    page_size = max(1, min(25, int(limit)))
+    if sort == "rating":
+        if window is not None:
+            await interaction.response.send_message("레이팅 정렬은 전체 기간만 가능합니다.", ephemeral=True)
+            return
+
+        async def load() -> Leaderboard:
+            async def build() -> Leaderboard:
+                return Leaderboard(await fetch_ratings(pool, guild_id), rating_sort_key)
+            return await cache.get("rating", build)
+
+        def render(board: Leaderboard, start: int, rows: List[Tuple[int, float, int]]) -> discord.Embed:
+            embed = discord.Embed(
+                title="마장 순위조회 — 레이팅 • 전체",
+                description="\n".join(
+                    f"{i}. {mention(uid)} 레이팅 **{rating:.0f}** / 판수 {games}"
+                    for i, (uid, rating, games) in enumerate(rows, start + 1)
+                ),
+                colour=discord.Colour.gold(),
+                timestamp=datetime.now(timezone.utc),
+            )
+            embed.set_footer(text=f"{start + 1}–{start + len(rows)} / {len(board)}명 • "
+                                  f"다인 Elo: 상대 3명과 1:1 비교 • 시작 {RATING_INITIAL:.0f}, K={RATING_K:g}")
+            return embed
+    else:
+        if window is None:
+            label, cache_key = "전체", "all"
+            fetch = lambda: fetch_standings(pool, guild_id, rules)
+        else:
+            lo, hi, label = window
+            cache_key = ("window", lo, hi)
+            fetch = lambda: fetch_window_standings(pool, guild_id, lo, hi, rules)
+
+        async def load() -> Leaderboard:
+            async def build() -> Leaderboard:
+                return Leaderboard(await fetch(), standings_sort_key)
+            return await cache.get(cache_key, build)
+
+        def render(board: Leaderboard, start: int, rows: List[Tuple[int, float, int]]) -> discord.Embed:
+            embed = discord.Embed(
+                title=f"마장 순위조회 — 계산점 평균(총점/판수) • {label}",
+                description="\n".join(
+                    f"{i}. {mention(uid)} 총점 **{total:+.1f}** / 판수 {games} = 평균 **{total / games if games else 0.0:+.2f}**"
+                    for i, (uid, total, games) in enumerate(rows, start + 1)
+                ),
+                colour=discord.Colour.gold(),
+                timestamp=datetime.now(timezone.utc),
+            )
+            embed.set_footer(text=f"{start + 1}–{start + len(rows)} / {len(board)}명 • 계산식: {rules.formula()}")
+            return embed
 
-    agg = await compute_aggregate_points(pool)
-    if not agg:
+    board = await load()
+    if not len(board):
         await interaction.response.send_message("데이터가 없습니다.", ephemeral=True)
         return
+    view = LeaderboardView(load, render, interaction.user.id, page_size)
+    # 호출자에게만 표시
+    await interaction.response.send_message(embed=view.build(board, 0), view=view, ephemeral=True)
+
+@cmd_rank.autocomplete("season")
+async def rank_season_autocomplete(interaction: discord.Interaction, current: str) -> List[app_commands.Choice[str]]:
+    return [app_commands.Choice(name=n, value=n) for n in SEASONS if current in n][:25]
+
+@mahjong_group.command(name="내기록", description="개인 기록(총점/평균/순위 분포/최근 게임)")
+@app_commands.describe(member="대상 멤버 (기본: 본인)", recent=f"최근 게임 수 (최대 {RECENT_MAX})")
+async def cmd_my_record(interaction: discord.Interaction, member: discord.Member | None = None, recent: int = 5):
+    cfg = await channel_config(interaction)
+    if cfg is None:
+        return
+    pool = bot.db_pool
+    if pool is None:
+        await interaction.response.send_message("DB 연결 초기화 실패", ephemeral=True)
+        return
+    target = member or interaction.user
+    uid = int(target.id)
+    summary = await bot.player_cache[cfg.guild_id].get(
+        uid, lambda: fetch_player_summary(pool, cfg.guild_id, uid, cfg.rules)
+    )
+    if not summary["games"]:
+        await interaction.response.send_message(f"{target.display_name}: 기록이 없습니다.", ephemeral=True)
+        return
+
+    n = summary["games"]
+    embed = discord.Embed(
+        title=f"마장 내기록 — {target.display_name}",
+        colour=discord.Colour.green(),
+        timestamp=datetime.now(timezone.utc),
+    )
+    embed.add_field(
+        name="계산점",
+        value=f"총점 **{summary['total']:+.1f}** / 판수 {n} = 평균 **{summary['avg']:+.2f}**",
+        inline=False,
+    )
+    embed.add_field(
+        name="순위 분포",
+        value=" • ".join(f"{r}위 {c}회 ({c / n:.0%})" for r, c in enumerate(summary["ranks"], 1)),
+        inline=False,
+    )
+    embed.add_field(name="평균 원점수", value=f"**{summary['avg_score']:.0f}**", inline=False)
+    for label, rec in (("최고 게임", summary["best"]), ("최저 게임", summary["worst"])):
+        gid, date, sc, rk, hp = rec
+        embed.add_field(name=label, value=f"#{gid} {rk}위 원점수 {sc} 계산점 **{hp:+.1f}**", inline=True)
+    lines = [
+        f"#{gid} {date:%m-%d} {rk}위 {sc} ({hp:+.1f})"
+        for gid, date, sc, rk, hp in summary["recent"][:max(1, min(RECENT_MAX, int(recent)))]
+    ]
+    embed.add_field(name="최근 게임", value="\n".join(lines), inline=False)
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+@mahjong_group.command(name="상대전적", description="두 사람이 같은 판에서 만난 기록(판수/순위 우열/평균 점수 차)")
+@app_commands.describe(opponent="상대 멤버", member="기준 멤버 (기본: 본인)")
+async def cmd_head_to_head(interaction: discord.Interaction, opponent: discord.Member,
+                           member: discord.Member | None = None):
+    cfg = await channel_config(interaction)
+    if cfg is None:
+        return
+    pool = bot.db_pool
+    if pool is None:
+        await interaction.response.send_message("DB 연결 초기화 실패", ephemeral=True)
+        return
+    target = member or interaction.user
+    uid, oid = int(target.id), int(opponent.id)
+    if uid == oid:
+        await interaction.response.send_message("서로 다른 두 사람을 지정하세요.", ephemeral=True)
+        return
+    counters = await bot.standings_cache[cfg.guild_id].get(
+        ("pair", *sorted((uid, oid))), lambda: fetch_pair(pool, cfg.guild_id, uid, oid)
+    )
+    h2h = head_to_head(uid, oid, counters, cfg.rules)
+    if not h2h["games"]:
+        await interaction.response.send_message(
+            f"{target.display_name} / {opponent.display_name}: 같은 판 기록이 없습니다.", ephemeral=True
+        )
+        return
 
-    rows = agg[:max(1, int(limit))]
+    n = h2h["games"]
     embed = discord.Embed(
-        title="마장 순위조회 — 계산점 평균(총점/판수)",
-        colour=discord.Colour.gold(),
+        title=f"마장 상대전적 — {target.display_name} vs {opponent.display_name}",
+        colour=discord.Colour.green(),
         timestamp=datetime.now(timezone.utc),
     )
-    for i, (uid, total, games) in enumerate(rows, 1):
-        avg_val = total / games if games else 0.0
+    embed.add_field(name="같은 판", value=f"**{n}**판", inline=True)
+    embed.add_field(
+        name="순위 우열",
+        value=f"{target.display_name} 위 **{h2h['above']}** ({h2h['above'] / n:.0%}) • "
+              f"아래 **{h2h['below']}** ({h2h['below'] / n:.0%})",
+        inline=False,
+    )
+    embed.add_field(
+        name="판당 평균 차이",
+        value=f"원점수 **{h2h['score_diff']:+,.0f}** • 계산점 **{h2h['points_diff']:+.2f}**",
+        inline=False,
+    )
+    embed.set_footer(text=f"계산식: {cfg.rules.formula()}")
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+@mahjong_group.command(name="상태", description="봇 지연/DB/캐시 상태 요약 (관리자)")
+async def cmd_status(interaction: discord.Interaction):
+    if not isinstance(interaction.user, discord.Member) or not interaction.user.guild_permissions.administrator:
+        await interaction.response.send_message("관리자만 사용 가능합니다.", ephemeral=True)
+        return
+    embed = discord.Embed(title="마장 상태", colour=discord.Colour.dark_grey(), timestamp=datetime.now(timezone.utc))
+
+    def hist_lines(name: str, label: str) -> str:
+        lines = []
+        for (n, labels), h in sorted(metrics.histograms.items()):
+            if n != name:
+                continue
+            tag = dict(labels).get(label, "-")
+            errs = metrics.counters.get(metrics._key("mm_errors_total", {"kind": name, **dict(labels)}), 0)
+            lines.append(
+                f"`{tag}` n={h.count} 평균 {h.sum / h.count * 1000:.0f}ms "
+                f"p50≤{h.quantile(0.5) * 1000:.0f}ms p95≤{h.quantile(0.95) * 1000:.0f}ms 오류 {errs:.0f}"
+            )
+        return "\n".join(lines)[:1024] or "-"
+
+    embed.add_field(name="명령", value=hist_lines("mm_command_seconds", "command"), inline=False)
+    embed.add_field(name="버튼", value=hist_lines("mm_component_seconds", "prefix"), inline=False)
+    embed.add_field(name="모달", value=hist_lines("mm_modal_seconds", "modal"), inline=False)
+    embed.add_field(name="DB 호출", value=hist_lines("mm_db_call_seconds", "call"), inline=False)
+    embed.add_field(name="Discord", value=hist_lines("mm_discord_seconds", "op"), inline=False)
+    embed.add_field(name="CPU 작업", value=hist_lines("mm_stats_seconds", "op"), inline=False)
+    lag = metrics.histograms.get(metrics._key("mm_loop_lag_seconds", {}))
+    mon = bot.loop_monitor
+    embed.add_field(
+        name="이벤트 루프",
+        value=(f"지연 p95≤{lag.quantile(0.95) * 1000:.0f}ms 최대 {mon.max_lag * 1000:.0f}ms "
+               f"멈춤(>{mon.threshold * 1000:.0f}ms) {mon.stalls}회 • 작업 프로세스 {stats.workers}")
+        if lag is not None and lag.count else "-",
+        inline=False,
+    )
+    if bot.history.enabled:
+        hs = bot.history.stats()
         embed.add_field(
-            name=f"{i}.",
-            value=f"{mention(uid)}\n총점 **{total:+.1f}** / 판수 {games} = 평균 **{avg_val:+.2f}**",
-            inline=False
+            name="기록 스냅샷(mmap)",
+            value=f"길드 {hs['guilds']} • {hs['games']:,}판 • {hs['bytes'] / 2**20:.1f} MiB • 동기화 대기 {hs['stale']}",
+            inline=False,
         )
-    embed.set_footer(text="계산식: ((종료-25,000)/1,000)+우마 • 우마 15/5/-5/-15")
-    # 호출자에게만 표시
+
+    pool = bot.db_pool
+    wait = metrics.histograms.get(metrics._key("mm_db_pool_wait_seconds", {}))
+    pool_line = "-" if pool is None else f"size {pool.size}/{pool.maxsize} free {pool.freesize} 대기 {getattr(pool, 'waiting', 0)}"
+    if wait is not None and wait.count:
+        pool_line += f"\nacquire 대기 평균 {wait.sum / wait.count * 1000:.1f}ms p95≤{wait.quantile(0.95) * 1000:.0f}ms"
+    rows_read = sum(v for (n, _), v in metrics.counters.items() if n == "mm_db_rows_read_total")
+    embed.add_field(name="DB 풀", value=f"{pool_line}\n읽은 행 {rows_read:.0f}", inline=False)
+    embed.add_field(
+        name="캐시",
+        value="\n".join(
+            f"{name}: " + " ".join(f"{k}={v}" for k, v in cache_stats(c).items())
+            for name, c in (("순위", bot.standings_cache), ("개인", bot.player_cache))
+        ),
+        inline=False,
+    )
+    shards = " ".join(f"#{sid} {lat * 1000:.0f}ms" for sid, lat in bot.latencies)
+    embed.add_field(name="샤드", value=f"길드 {len(bot.guilds)} • {shards or '-'}", inline=False)
+    if METRICS_PORT:
+        embed.set_footer(text=f"Prometheus: http://{METRICS_HOST}:{METRICS_PORT}/metrics")
     await interaction.response.send_message(embed=embed, ephemeral=True)
 
+@mahjong_group.command(name="순위재계산", description="이 길드 전체 기록으로 누적 순위표/상대전적/레이팅 재작성 (관리자)")
+async def cmd_rebuild_standings(interaction: discord.Interaction):
+    if not isinstance(interaction.user, discord.Member) or not interaction.user.guild_permissions.administrator:
+        await interaction.response.send_message("관리자만 사용 가능합니다.", ephemeral=True)
+        return
+    pool = bot.db_pool
+    if pool is None:
+        await interaction.response.send_message("DB 연결 초기화 실패", ephemeral=True)
+        return
+    guild_id = interaction.guild_id
+    await interaction.response.defer(ephemeral=True, thinking=True)
+    try:
+        n = await rebuild_standings(pool, guild_id, bot.history.fresh(guild_id))
+        pairs = await rebuild_pairs(pool, guild_id, bot.history.fresh(guild_id))
+        snaps = await rebuild_snapshots(pool, guild_id)
+        rated = await rebuild_ratings(pool, guild_id)
+    except Exception as e:
+        await interaction.followup.send(f"재계산 실패: {e}", ephemeral=True)
+        return
+    finally:
+        bot.standings_cache[guild_id].invalidate()
+        bot.player_cache[guild_id].invalidate()
+    cache_line = " ".join(f"{k}={v}" for k, v in bot.standings_cache[guild_id].stats().items())
+    await interaction.followup.send(
+        f"누적 순위표 재계산 완료: {n}명, 상대전적 {pairs}쌍, 스냅샷 {snaps}개, 레이팅 {rated}판\n캐시: {cache_line}", ephemeral=True
+    )
+
+@mahjong_group.command(name="설정", description="이 길드의 사용 채널/선수 역할/점수 규칙 (관리자)")
+@app_commands.describe(
+    channel="사용 채널 추가/제거 (이미 있으면 제거)",
+    role="선수 역할 이름",
+    start_points="시작 점수 (예: 25000)",
+    uma="우마 1위,2위,3위,4위 (예: 15,5,-5,-15)",
+)
+async def cmd_settings(interaction: discord.Interaction, channel: discord.TextChannel | None = None,
+                       role: str | None = None, start_points: int | None = None, uma: str | None = None):
+    """
+    옵션 없이 호출하면 현재 설정만 표시.
+    누적 순위표는 정수(원점수 합/순위 횟수)라 점수 규칙을 바꿔도 재계산 없이 다음 조회부터 새 규칙으로 표시됨.
+    """
+    if not isinstance(interaction.user, discord.Member) or not interaction.user.guild_permissions.administrator:
+        await interaction.response.send_message("관리자만 사용 가능합니다.", ephemeral=True)
+        return
+    pool = bot.db_pool
+    if pool is None:
+        await interaction.response.send_message("DB 연결 초기화 실패", ephemeral=True)
+        return
+    guild = interaction.guild
+    cur = bot.guild_configs.get(guild.id)
+    if any(v is not None for v in (channel, role, start_points, uma)):
+        try:
+            rules = ScoreRules(
+                cur.rules.start_points if start_points is None else start_points,
+                cur.rules.uma if uma is None else parse_uma(uma),
+            )
+        except ValueError as e:
+            await interaction.response.send_message(str(e), ephemeral=True)
+            return
+        channel_ids = set(cur.channel_ids)
+        if channel is not None:
+            channel_ids ^= {channel.id}
+        new = GuildConfig(guild.id, channel_ids, (role or cur.role_name).strip(), rules)
+        try:
+            await bot.guild_configs.save(pool, new)
+        except Exception as e:
+            await interaction.response.send_message(f"저장 실패: {e}", ephemeral=True)
+            return
+        if new.role_name != cur.role_name:
+            bot.roster.build(guild)
+        if new.rules.formula() != cur.rules.formula():
+            bot.standings_cache[guild.id].invalidate()
+            bot.player_cache[guild.id].invalidate()
+        cur = new
+    channels = " ".join(f"<#{c}>" for c in sorted(cur.channel_ids)) or "(없음)"
+    await interaction.response.send_message(
+        f"채널: {channels}\n선수 역할: {cur.role_name}\n계산식: {cur.rules.formula()}", ephemeral=True
+    )
+
+# ── 멤버 이벤트: 역할 인덱스 갱신 ─────────────────────────────────────────────
+@bot.event
+async def on_ready():
+    t0 = time.perf_counter()
+    for guild in bot.guilds:
+        bot.roster.build(guild)
+    log.info("role roster built for %d guild(s)", len(bot.guilds))
+    if not any(name == "ready" for name, _ in bot.startup.phases):  # 재연결 시 on_ready 는 다시 불림
+        bot.startup.mark("roster", time.perf_counter() - t0)
+        bot.startup.mark("ready", time.perf_counter() - PROCESS_T0)
+        log.info("ready %.2fs after process start (%s)", bot.startup.phases[-1][1], bot.startup.summary())
+
+@bot.event
+async def on_guild_available(guild: discord.Guild):
+    bot.roster.build(guild)
+
+@bot.event
+async def on_guild_remove(guild: discord.Guild):
+    bot.roster.drop(guild.id)
+
+@bot.event
+async def on_member_join(member: discord.Member):
+    bot.roster.update(member)
+
+@bot.event
+async def on_member_update(before: discord.Member, after: discord.Member):
+    if before.roles != after.roles or before.display_name != after.display_name:
+        bot.roster.update(after, name_changed=before.display_name != after.display_name)
+
+@bot.event
+async def on_member_remove(member: discord.Member):
+    bot.roster.remove(member)
+
+@bot.event
+async def on_user_update(before: discord.User, after: discord.User):
+    if before.display_name != after.display_name:
+        bot.roster.user_renamed(after.id)
+
+@bot.event
+async def on_guild_role_update(before: discord.Role, after: discord.Role):
+    role_name = bot.guild_configs.get(after.guild.id).role_name
+    if role_name in (before.name, after.name) and before.name != after.name:
+        bot.roster.build(after.guild)
+
+@bot.event
+async def on_guild_role_create(role: discord.Role):
+    if role.name == bot.guild_configs.get(role.guild.id).role_name:
+        bot.roster.build(role.guild)
+
+@bot.event
+async def on_guild_role_delete(role: discord.Role):
+    if role.name == bot.guild_configs.get(role.guild.id).role_name:
+        bot.roster.build(role.guild)
+
 # ── 버튼 처리: 재시작 후에도 동작 ──────────────────────────────────────────────
 @bot.event
 async def on_interaction(interaction: discord.Interaction):
@@ -523,22 +4169,49 @@ async def on_interaction(interaction: discord.Interaction):
     except ValueError:
         return
 
-    if interaction.channel_id != CHANNEL_ID:
-        await interaction.response.send_message("지정 채널에서만 가능", ephemeral=True)
+    label = prefix if prefix in COMPONENT_PREFIXES else "other"
+    with metrics.timer("mm_component_seconds", prefix=label):
+        await handle_component(interaction, prefix, gid, mid, ch)
+
+COMPONENT_PREFIXES = ("mm_edit", "mm_del", "mm_del_ok", "mm_del_cancel")
+
+async def handle_component(interaction: discord.Interaction, prefix: str, gid: str, mid: str, ch: str):
+    cfg = await channel_config(interaction)
+    if cfg is None:
         return
+    guild_id = cfg.guild_id
 
     pool = bot.db_pool
     if pool is None:
         await interaction.response.send_message("DB 연결 초기화 실패", ephemeral=True)
         return
 
+    if int(gid) < 0:  # 저장 중에 게시된 버튼: -jid
+        jid, writer = -int(gid), bot.score_writer
+        if writer is not None and jid in writer.pending:
+            await interaction.response.send_message("아직 DB에 반영 중인 게임입니다. 잠시 후 다시 시도하세요.", ephemeral=True)
+            return
+        resolved = writer.resolve(jid) if writer else None
+        if resolved is None:
+            resolved = await fetch_game_id_by_journal(pool, guild_id, jid)
+        if resolved is None:
+            await interaction.response.send_message("게임 데이터를 찾을 수 없습니다.", ephemeral=True)
+            return
+        gid = str(resolved)
+
     if prefix == "mm_edit":
-        rows = await fetch_game(pool, int(gid))
-        if len(rows) != 4:
+        cached = bot.recent_games.get(guild_id, int(gid))
+        if cached is None:
+            cached = await fetch_game_versioned(pool, guild_id, int(gid))
+            if cached is not None:
+                bot.recent_games.put(guild_id, int(gid), *cached)
+        if cached is None or len(cached[2]) != 4:
             await interaction.response.send_message("게임 데이터를 찾을 수 없습니다.", ephemeral=True)
             return
+        version, date, rows = cached
         await interaction.response.send_modal(
-            EditScoreModal(int(gid), rows, interaction.guild, pool, int(mid), int(ch))
+            EditScoreModal(int(gid), rows, interaction.guild, cfg, pool, int(mid), int(ch),
+                           version=version, game_date=date)
         )
         return
 
@@ -552,19 +4225,18 @@ async def on_interaction(interaction: discord.Interaction):
 
     if prefix == "mm_del_ok":
         try:
-            await delete_game(pool, int(gid))
+            deleted = await delete_game(pool, guild_id, int(gid))
+            bot.invalidate_game(guild_id, [r[1] for r in deleted])
+            bot.history.on_delete(guild_id)
+            bot.schedule_rating_replay(guild_id)
+            bot.recent_games.discard(guild_id, int(gid))
         except Exception as e:
             await interaction.response.send_message(f"삭제 실패: {e}", ephemeral=True)
             return
-        # 공개 알림
-        try:
-            channel = interaction.client.get_channel(int(ch)) or await interaction.client.fetch_channel(int(ch))  # type: ignore
-            msg = await channel.fetch_message(int(mid))  # type: ignore
-            await msg.delete()
-        except Exception:
-            pass
+        # 공개 메시지 삭제(대기 중인 편집은 버려짐) + 알림
+        bot.updater.delete(int(ch), int(mid))
+        bot.updater.notice(int(ch), ("deleted", int(gid)), f"🗑️ 게임 #{gid} 기록이 삭제되었습니다.")
         await interaction.response.send_message("삭제 완료", ephemeral=True)
-        await interaction.followup.send(f"🗑️ 게임 #{gid} 기록이 삭제되었습니다.", ephemeral=False)
         return
 
     if prefix == "mm_del_cancel":
@@ -573,4 +4245,7 @@ async def on_interaction(interaction: discord.Interaction):
 
 # ── ENTRY ─────────────────────────────────────────────────────────────────────
 if __name__ == "__main__":
+    # 설정 검사는 실행 시에만: bench.py 등 오프라인 도구가 app 모듈을 import 할 수 있도록
+    if not BOT_TOKEN:
+        raise RuntimeError("DISCORD_BOT_TOKEN 필요")
     bot.run(BOT_TOKEN)
@@ -0,0 +1,266 @@
+# bench.py  (오프라인 벤치마크)
+#
+# MySQL / Discord 없이 랭킹 경로 성능 측정.
+#   - 합성 게임 기록 생성(4인 합계 100,000, 100점 단위, 일부 동점)
+#   - aiomysql.Pool 대용 인메모리 FakePool 로 app 의 DB 함수 구동
+#   - 데이터 크기별 시간 / 최대 메모리(tracemalloc, StatsExecutor 작업도 같은 프로세스에서 실행해 포함) 출력
+#   - 기준 결과(bench_baseline.json) 저장 및 비교 → 회귀 시 종료코드 1
+#
+# 사용:
+#   python bench.py                                  # 기본 크기, 기준 결과와 비교
+#   python bench.py --sizes 1000,100000,1000000      # 크기 지정
+#   python bench.py --save-baseline                  # 기준 결과 갱신
+
+import argparse
+import asyncio
+import gc
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import List, Tuple, Dict, Any, Callable, Iterable
+
+import app
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+DEFAULT_SIZES = [1_000, 10_000, 100_000]
+EMBED_GAMES = 2_000  # build_game_embed 는 게임당 비용이라 고정 개수만 측정
+
+Row = Tuple[int, int, int, int]
+
+# ── 합성 데이터 ───────────────────────────────────────────────────────────────
+def generate_games(n_games: int, *, n_players: int = 60, tie_rate: float = 0.05, seed: int = 1) -> List[Row]:
+    """
+    game_id 오름차순 (game_id, user_id, score, position) 행 생성.
+    참가 빈도는 사용자별로 치우치게(상위 몇 명이 자주 참가), 점수는 100점 단위, 합계 TARGET_TOTAL.
+    """
+    rnd = random.Random(seed)
+    players = [10**17 + i for i in range(n_players)]  # 디스코드 snowflake 크기
+    weights = [1.0 / (i + 1) ** 0.5 for i in range(n_players)]
+    mean = app.TARGET_TOTAL // 4
+    rows: List[Row] = []
+    for gid in range(1, n_games + 1):
+        seat: List[int] = []
+        while len(seat) < 4:
+            u = rnd.choices(players, weights)[0]
+            if u not in seat:
+                seat.append(u)
+        scores = [int(rnd.gauss(mean, 12_000)) // 100 * 100 for _ in range(3)]
+        if rnd.random() < tie_rate:
+            scores[1] = scores[0]
+        scores.append(app.TARGET_TOTAL - sum(scores))
+        for pos in range(4):
+            rows.append((gid, seat[pos], scores[pos], pos))
+    return rows
+
+# ── 인메모리 Pool ─────────────────────────────────────────────────────────────
+class FakeCursor:
+    """app 이 쓰는 game_detail/high-water 조회만 지원(길드 하나). 서버측 커서(SSCursor)는 fetchmany 로 조금씩 반환."""
+    def __init__(self, pool: "FakePool"):
+        self.pool = pool
+        self._result: List[Any] = []
+        self._pos = 0
+        self.lastrowid = None
+        self.rowcount = 0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self._result = []
+
+    async def execute(self, sql: str, params: Iterable[Any] = ()) -> int:
+        q = " ".join(sql.split())
+        self.pool.queries += 1
+        if q.startswith("SELECT game_id, user_id, score, position FROM game_detail WHERE guild_id=%s ORDER BY game_id"):
+            self._result = self.pool.rows
+        elif q.startswith("SELECT game_id, user_id, score, position FROM game_detail WHERE guild_id=%s AND game_id > %s"):
+            after = int(list(params)[1])
+            self._result = [r for r in self.pool.rows if r[0] > after]
+        elif q.startswith("SELECT COUNT(*), COALESCE(MAX(id), 0), COALESCE(SUM(version), 0) FROM game WHERE guild_id=%s"):
+            games = self.pool.by_game()
+            self._result = [(len(games), max(games, default=0), 0)]
+        elif q.startswith("SELECT user_id, score, position FROM game_detail WHERE guild_id=%s AND game_id=%s"):
+            gid = int(list(params)[1])
+            self._result = [(u, s, p) for (_, u, s, p) in self.pool.by_game().get(gid, [])]
+        else:
+            raise NotImplementedError(f"FakePool: 지원하지 않는 쿼리: {q}")
+        self._pos = 0
+        self.rowcount = len(self._result)
+        return self.rowcount
+
+    async def fetchall(self) -> List[Any]:
+        out = self._result[self._pos:]
+        self._pos = len(self._result)
+        return list(out)
+
+    async def fetchmany(self, size: int) -> List[Any]:
+        out = self._result[self._pos:self._pos + size]
+        self._pos += len(out)
+        return out
+
+    async def fetchone(self) -> Any:
+        if self._pos >= len(self._result):
+            return None
+        self._pos += 1
+        return self._result[self._pos - 1]
+
+class FakeConnection:
+    def __init__(self, pool: "FakePool"):
+        self.pool = pool
+
+    def cursor(self, cursor_cls: Any = None) -> FakeCursor:
+        return FakeCursor(self.pool)
+
+    async def begin(self): pass
+    async def commit(self): pass
+    async def rollback(self): pass
+
+class _Acquire:
+    def __init__(self, pool: "FakePool"):
+        self.pool = pool
+
+    async def __aenter__(self) -> FakeConnection:
+        self.pool.acquired += 1
+        return FakeConnection(self.pool)
+
+    async def __aexit__(self, *exc):
+        return False
+
+class FakePool:
+    """aiomysql.Pool 대용. rows 는 game_id 오름차순 game_detail 행."""
+    def __init__(self, rows: List[Row]):
+        self.rows = rows
+        self._by_game: Dict[int, List[Row]] | None = None
+        self.queries = 0
+        self.acquired = 0
+
+    def by_game(self) -> Dict[int, List[Row]]:
+        if self._by_game is None:
+            self._by_game = {gid: bucket for gid, bucket in app.iter_groupby_game(self.rows)}
+        return self._by_game
+
+    def acquire(self) -> _Acquire:
+        return _Acquire(self)
+
+# ── 측정 ──────────────────────────────────────────────────────────────────────
+def _run(fn: Callable[[], Any]) -> Any:
+    out = fn()
+    if asyncio.iscoroutine(out):
+        out = asyncio.run(out)
+    return out
+
+def measure(fn: Callable[[], Any], *, memory: bool = True, repeat: int = 3) -> Dict[str, float]:
+    """최소 실행 시간(초)과 tracemalloc 최대 메모리(바이트)."""
+    best = float("inf")
+    for _ in range(repeat):
+        gc.collect()
+        t0 = time.perf_counter()
+        _run(fn)
+        best = min(best, time.perf_counter() - t0)
+    result = {"seconds": best}
+    if memory:
+        # tracemalloc 은 StatsExecutor 워커 프로세스의 메모리를 못 봄 -> 메모리는 같은 프로세스(workers=0)에서 측정
+        workers, app.stats.workers = app.stats.workers, 0
+        gc.collect()
+        tracemalloc.start()
+        try:
+            _run(fn)
+            result["peak_bytes"] = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+            app.stats.workers = workers
+    return result
+
+def bench_cases(rows: List[Row], history_dir: str) -> Dict[str, Callable[[], Any]]:
+    pool = FakePool(rows)
+    history = app.HistorySnapshot(history_dir, 0)
+    history.load()
+    buckets = [b for _, b in app.iter_groupby_game(rows)]
+    embed_games = [
+        (gid, [{"user_id": u, "score": s, "position": p} for (_, u, s, p) in b])
+        for gid, b in zip(range(1, EMBED_GAMES + 1), buckets)
+    ]
+    cases: Dict[str, Callable[[], Any]] = {
+        "iter_groupby_game": lambda: sum(1 for _ in app.iter_groupby_game(rows)),
+        "assign_ranks_for_game": lambda: [app.assign_ranks_for_game(b) for b in buckets],
+        "aggregate_points_py": lambda: app.aggregate_points_py(rows),
+        "compute_aggregate_points": lambda: app.compute_aggregate_points(pool, 0),
+        "compute_aggregate_points[stream]": lambda: app.compute_aggregate_points(pool, 0, stream=True),
+        "sync_history[rebuild]": lambda: (history.reset(), app.sync_history(pool, history))[1],
+        "compute_aggregate_points[mmap]": lambda: app.compute_aggregate_points(pool, 0, history=history),
+        "build_game_embed[x%d]" % len(embed_games): lambda: [app.build_game_embed(g, r) for g, r in embed_games],
+    }
+    if app.np is not None:
+        cases["aggregate_points_np"] = lambda: app.aggregate_points_np(*app.pack_games(rows)[1:])
+    return cases
+
+def run_suite(sizes: List[int], *, memory: bool, repeat: int, seed: int) -> Dict[str, Dict[str, Dict[str, float]]]:
+    results: Dict[str, Dict[str, Dict[str, float]]] = {}
+    for n in sizes:
+        rows = generate_games(n, seed=seed)
+        results[str(n)] = {}
+        with tempfile.TemporaryDirectory() as history_dir:
+            for name, fn in bench_cases(rows, history_dir).items():
+                r = measure(fn, memory=memory, repeat=repeat)
+                results[str(n)][name] = r
+                mem = f"{r['peak_bytes'] / 2**20:9.1f} MiB" if "peak_bytes" in r else ""
+                print(f"{n:>9} games  {name:<36} {r['seconds'] * 1000:10.1f} ms {mem}", flush=True)
+        del rows
+    return results
+
+MIN_COMPARE_SECONDS = 0.005  # 이보다 짧은 측정은 잡음이 커서 시간 비교 제외
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """기준 대비 threshold 배 이상 느려지거나 메모리가 늘어난 항목."""
+    regressions = []
+    for size, cases in results.items():
+        for name, r in cases.items():
+            base = baseline.get(size, {}).get(name)
+            if not base:
+                continue
+            for metric in ("seconds", "peak_bytes"):
+                if metric == "seconds" and base.get(metric, 0) < MIN_COMPARE_SECONDS:
+                    continue
+                if metric in r and metric in base and base[metric] > 0 and r[metric] > base[metric] * threshold:
+                    regressions.append(
+                        f"{size} games {name} {metric}: {base[metric]:.4g} -> {r[metric]:.4g} "
+                        f"(x{r[metric] / base[metric]:.2f})"
+                    )
+    return regressions
+
+def main(argv: List[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description="랭킹 경로 오프라인 벤치마크")
+    ap.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)), help="게임 수 목록 (쉼표 구분)")
+    ap.add_argument("--repeat", type=int, default=3, help="시간 측정 반복 횟수(최솟값 사용)")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--no-memory", action="store_true", help="tracemalloc 측정 생략")
+    ap.add_argument("--baseline", default=BASELINE_PATH)
+    ap.add_argument("--save-baseline", action="store_true", help="결과를 기준 파일로 저장")
+    ap.add_argument("--threshold", type=float, default=1.5, help="회귀 판정 배수 (기본 1.5)")
+    args = ap.parse_args(argv)
+
+    sizes = [int(x) for x in args.sizes.split(",") if x.strip()]
+    results = run_suite(sizes, memory=not args.no_memory, repeat=args.repeat, seed=args.seed)
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"기준 결과 저장: {args.baseline}")
+        return 0
+    if not os.path.exists(args.baseline):
+        print("기준 결과 없음 (--save-baseline 으로 생성)")
+        return 0
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.threshold)
+    for line in regressions:
+        print("REGRESSION", line)
+    print("회귀 없음" if not regressions else f"회귀 {len(regressions)}건")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,338 @@
+# history.py  (게임 기록 일괄 입력 / 내보내기)
+#
+# 봇 없이 DB에 직접 연결(DB_* 환경변수는 app.py 와 동일).
+#   import : CSV/JSONL 게임 기록 검증 후 청크 단위 트랜잭션으로 INSERT
+#            (game, game_detail, player_standings, 기존 스냅샷 갱신, 끝나면 스냅샷 간격 재구성/레이팅 재계산)
+#            파일은 날짜 오름차순(game_id 도 날짜 순으로 붙음). 봇 이전 기록처럼 길드의 기존 게임보다
+#            이른 날짜도 입력 가능: 레이팅은 (date, game_id) 순서라 입력한 첫 날짜부터 다시 계산
+#   export : game/game_detail 를 서버측 커서로 스트리밍해 순위/계산점과 함께 CSV/JSONL 출력
+#
+# 입력 형식 (한 줄 = 한 게임, 좌석 순서 동/서/남/북 = position 0~3):
+#   CSV  : 헤더 date,user0,score0,user1,score1,user2,score2,user3,score3 (다른 열은 무시)
+#   JSONL: {"date": "...", "seats": [[user_id, score], ...x4]}   (좌석 항목의 3번째 이후 값은 무시)
+#   date : "YYYY-MM-DD" / "YYYY-MM-DD HH:MM[:SS]", 비어 있으면 입력 시각
+#   user : 숫자 ID 또는 멘션(<@id>)
+# export 결과는 그대로 import 입력으로 쓸 수 있음.
+# 길드: --guild (기본 LEGACY_GUILD_ID). 합계 검증/계산점은 그 길드 설정(guild_config)의 시작 점수/우마 사용.
+#
+# 사용:
+#   python history.py import old_games.csv --guild 1234 --dry-run --start-points 25000
+#   python history.py import old_games.jsonl --guild 1234 --chunk 2000
+#   python history.py export all_games.csv --guild 1234 --start 2024-01-01
+#
+# 실행 중인 봇의 순위 캐시는 다음 점수 입력 또는 /마장 순위재계산 때 갱신됨.
+
+import argparse
+import asyncio
+import csv
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from typing import List, Tuple, Dict, Any, Iterator, TextIO
+
+import aiomysql
+
+import app
+
+DEFAULT_CHUNK = 1000  # 트랜잭션당 게임 수
+DATE_FORMATS = ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d")
+
+Game = Tuple[datetime, List[Tuple[int, int]]]  # (date, [(user_id, score)] position 순)
+
+# ── 입력 파싱 ─────────────────────────────────────────────────────────────────
+def parse_date(raw: Any, default: datetime) -> datetime:
+    text = str(raw or "").strip()
+    if not text:
+        return default
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt)
+        except ValueError:
+            pass
+    raise ValueError(f"날짜 형식 오류: {text!r}")
+
+def parse_user(raw: Any) -> int:
+    text = str(raw).strip().strip("<@!>")
+    try:
+        return int(text)
+    except ValueError:
+        raise ValueError(f"사용자 ID 오류: {raw!r}") from None
+
+def parse_score(raw: Any) -> int:
+    try:
+        return int(str(raw).strip())
+    except ValueError:
+        raise ValueError(f"점수는 정수만: {raw!r}") from None
+
+def _iter_csv(f: TextIO) -> Iterator[Tuple[int, Any, List[Tuple[Any, Any]]]]:
+    reader = csv.DictReader(f)
+    for row in reader:
+        seats = [(row.get(f"user{p}"), row.get(f"score{p}")) for p in range(4)]
+        seats = [s for s in seats if s[0] not in (None, "") or s[1] not in (None, "")]
+        yield reader.line_num, row.get("date"), seats
+
+def _iter_jsonl(f: TextIO) -> Iterator[Tuple[int, Any, List[Tuple[Any, Any]]]]:
+    for line_no, line in enumerate(f, 1):
+        if not line.strip():
+            continue
+        try:
+            obj = json.loads(line)
+            seats = [(s[0], s[1]) for s in obj["seats"]]
+        except (ValueError, KeyError, TypeError, IndexError):
+            yield line_no, None, None
+            continue
+        yield line_no, obj.get("date"), seats
+
+def iter_games(path: str, fmt: str, now: datetime,
+               target_total: int = app.TARGET_TOTAL) -> Iterator[Tuple[int, Game | None, str | None]]:
+    """파일을 한 줄씩 읽어 (줄 번호, 게임 | None, 오류 | None) 산출. 규칙은 app.validate_seats 와 동일."""
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        raw_iter = _iter_csv(f) if fmt == "csv" else _iter_jsonl(f)
+        for line_no, raw_date, raw_seats in raw_iter:
+            if raw_seats is None:
+                yield line_no, None, "JSON 형식 오류 (seats 필요)"
+                continue
+            try:
+                seats = [(parse_user(u), parse_score(s)) for u, s in raw_seats]
+                app.validate_seats(seats, target_total)
+                yield line_no, (parse_date(raw_date, now), seats), None
+            except ValueError as e:
+                yield line_no, None, str(e)
+
+def detect_format(path: str, fmt: str | None) -> str:
+    if fmt:
+        return fmt
+    return "jsonl" if os.path.splitext(path)[1].lower() in (".jsonl", ".json", ".ndjson") else "csv"
+
+# ── DB ────────────────────────────────────────────────────────────────────────
+async def create_pool() -> aiomysql.Pool:
+    return await aiomysql.create_pool(
+        host=app.DB_HOST, port=app.DB_PORT,
+        user=app.DB_USER, password=app.DB_PASSWORD, db=app.DB_NAME,
+        autocommit=False, minsize=1, maxsize=2,
+    )
+
+async def load_rules(pool: aiomysql.Pool, guild_id: int) -> app.ScoreRules:
+    configs = app.GuildConfigs()
+    await configs.load(pool)
+    return configs.get(guild_id).rules
+
+async def insert_chunk(pool: aiomysql.Pool, guild_id: int, games: List[Game]) -> None:
+    """
+    게임 묶음을 한 트랜잭션으로 저장. game/game_detail/누적값 모두 다중 행 INSERT 한 문장씩.
+    기존 스냅샷/레이팅도 같은 트랜잭션에서 맞춤(스냅샷 증감분, 레이팅 재계산 표시): 중간에 실패해도 어긋나지 않음.
+    game.id 는 AUTO_INCREMENT(ScoreWriter 와 같은 방식): 다중 행 VALUES 는 행 수가 정해진 "simple insert" 라
+    한 문장의 id 가 연속(auto_increment_increment=1) -> 첫 id(lastrowid)부터 차례로 배정.
+    """
+    async with pool.acquire() as conn:
+        await conn.begin()
+        try:
+            async with conn.cursor() as cur:
+                n = await cur.execute(
+                    "INSERT INTO game (guild_id, date) VALUES " + ",".join(["(%s,%s)"] * len(games)),
+                    [v for date, _ in games for v in (guild_id, date)],
+                )
+                if n != len(games):
+                    raise RuntimeError(f"game INSERT 행 수 불일치: {n} != {len(games)}")
+                first_id = cur.lastrowid
+                detail_rows = []
+                dated = []
+                acc: Dict[int, List[int]] = {}
+                pairs: Dict[Tuple[int, int], List[int]] = {}
+                for gid, (date, seats) in enumerate(games, first_id):
+                    rows = [(gid, uid, sc, pos) for pos, (uid, sc) in enumerate(seats)]
+                    detail_rows.extend(rows)
+                    dated.append((date, rows))
+                    app.add_deltas(acc, app.standings_deltas(rows))
+                    app.add_pair_deltas(pairs, app.pair_deltas(rows))
+                await cur.executemany(
+                    "INSERT INTO game_detail (guild_id, game_id, user_id, score, position) VALUES (%s,%s,%s,%s,%s)",
+                    [(guild_id, *r) for r in detail_rows],
+                )
+                await app.apply_standings_deltas(cur, guild_id, [(uid, *v) for uid, v in acc.items()])
+                await app.apply_pair_deltas(cur, guild_id, [(*k, *v) for k, v in pairs.items()])
+                # 기간 순위 스냅샷: 이보다 늦은 기존 스냅샷에 바로 반영 (중단/진행 중에도 기간 조회가 맞음)
+                await app.apply_snapshot_games(cur, guild_id, dated)
+                await app.mark_ratings_dirty(cur, guild_id, first_id, min(date for date, _ in games))
+            await conn.commit()
+        except Exception:
+            await conn.rollback()
+            raise
+
+async def import_games(path: str, fmt: str, *, guild_id: int, chunk: int, dry_run: bool,
+                       start_points: int | None) -> int:
+    now = datetime.now().replace(microsecond=0)
+    pool = None if dry_run else await create_pool()
+    try:
+        return await _import_games(pool, path, fmt, now, guild_id=guild_id, chunk=chunk, start_points=start_points)
+    finally:
+        if pool is not None:
+            pool.close()
+            await pool.wait_closed()
+
+async def _import_games(pool: aiomysql.Pool | None, path: str, fmt: str, now: datetime, *,
+                        guild_id: int, chunk: int, start_points: int | None) -> int:
+    if start_points is not None:
+        rules = app.ScoreRules(start_points)
+    elif pool is not None:
+        rules = await load_rules(pool, guild_id)
+    else:
+        rules = app.DEFAULT_RULES
+    n_ok, errors = 0, 0
+    last_date = None
+    for line_no, game, err in iter_games(path, fmt, now, rules.target_total):
+        if not err:
+            if last_date is not None and game[0] < last_date:
+                err = f"날짜 역순: {game[0]} < 이전 게임 {last_date} (날짜 오름차순으로 정렬 필요)"
+            else:
+                last_date = game[0]
+        if err:
+            errors += 1
+            print(f"{path}:{line_no}: {err}", file=sys.stderr)
+        else:
+            n_ok += 1
+    if errors:
+        print(f"오류 {errors}건, 입력하지 않음", file=sys.stderr)
+        return 1
+    print(f"검증 통과: {n_ok}판 (합계 {rules.target_total})")
+    if pool is None or not n_ok:
+        return 0
+
+    t0 = time.perf_counter()
+    done = 0
+    batch: List[Game] = []
+    for _, game, _ in iter_games(path, fmt, now, rules.target_total):
+        batch.append(game)
+        if len(batch) >= chunk:
+            await insert_chunk(pool, guild_id, batch)
+            done += len(batch)
+            batch = []
+            elapsed = time.perf_counter() - t0
+            print(f"  {done}/{n_ok}판  {done / elapsed:,.0f} games/s", flush=True)
+    if batch:
+        await insert_chunk(pool, guild_id, batch)
+        done += len(batch)
+    elapsed = time.perf_counter() - t0
+    print(f"입력 완료: {done}판, {elapsed:.1f}s, {done / elapsed:,.0f} games/s")
+    # 청크마다 기존 스냅샷은 이미 맞춤: 입력한 기간에도 SNAPSHOT_MIN_GAMES 간격 스냅샷이 생기게 다시 만듦
+    snaps = await app.rebuild_snapshots(pool, guild_id)
+    print(f"스냅샷 재생성: {snaps}개")
+    rated = await app.replay_ratings(pool, guild_id)
+    print(f"레이팅 재계산: {rated}판")
+    return 0
+
+# ── 내보내기 ──────────────────────────────────────────────────────────────────
+EXPORT_SQL = (
+    "SELECT g.id, g.date, d.user_id, d.score, d.position "
+    "FROM game g JOIN game_detail d ON d.guild_id = g.guild_id AND d.game_id = g.id "
+    "WHERE g.guild_id=%s"
+)
+
+def export_record(gid: int, date: datetime, bucket: List[Tuple[int, int, int, int]],
+                  rules: app.ScoreRules = app.DEFAULT_RULES) -> Dict[str, Any]:
+    """한 게임 -> {"game_id", "date", "seats": [[user_id, score, rank, points], ...]} (position 순)"""
+    ranks = app.assign_ranks_for_game(bucket) if len(bucket) == 4 else {}
+    seats = []
+    for _, uid, sc, _ in sorted(bucket, key=lambda r: r[3]):
+        rk = ranks.get(uid)
+        seats.append([uid, sc, rk, round(rules.points(sc, rk), 1) if rk else None])
+    return {"game_id": gid, "date": date.strftime("%Y-%m-%d %H:%M:%S"), "seats": seats}
+
+CSV_HEADER = ["game_id", "date"] + [f"{k}{p}" for p in range(4) for k in ("user", "score", "rank", "points")]
+
+def csv_row(rec: Dict[str, Any]) -> List[Any]:
+    out = [rec["game_id"], rec["date"]]
+    for seat in rec["seats"][:4]:
+        out.extend("" if v is None else v for v in seat)
+    return out
+
+async def export_games(path: str, fmt: str, *, guild_id: int, start: datetime | None, end: datetime | None) -> int:
+    """SSCursor 로 STREAM_CHUNK 행씩 읽어 게임 단위로 바로 기록. 메모리는 청크 크기에 비례."""
+    where, params = [], [guild_id]
+    if start:
+        where.append("g.date >= %s")
+        params.append(start)
+    if end:
+        where.append("g.date < %s")
+        params.append(end)
+    sql = EXPORT_SQL + "".join(" AND " + w for w in where) + " ORDER BY g.id, d.position"
+
+    pool = await create_pool()
+    out = sys.stdout if path == "-" else open(path, "w", encoding="utf-8", newline="")
+    try:
+        rules = await load_rules(pool, guild_id)
+        writer = csv.writer(out) if fmt == "csv" else None
+        if writer:
+            writer.writerow(CSV_HEADER)
+        t0 = time.perf_counter()
+        n = 0
+
+        def emit(gid, date, bucket):
+            rec = export_record(gid, date, bucket, rules)
+            if writer:
+                writer.writerow(csv_row(rec))
+            else:
+                out.write(json.dumps(rec, ensure_ascii=False) + "\n")
+
+        async with pool.acquire() as conn:
+            async with conn.cursor(aiomysql.SSCursor) as cur:
+                await cur.execute(sql, params)
+                cur_gid, cur_date, bucket = None, None, []
+                while True:
+                    chunk = await cur.fetchmany(app.STREAM_CHUNK)
+                    if not chunk:
+                        break
+                    for gid, date, uid, sc, pos in chunk:
+                        gid = int(gid)
+                        if gid != cur_gid:
+                            if bucket:
+                                emit(cur_gid, cur_date, bucket)
+                                n += 1
+                            cur_gid, cur_date, bucket = gid, date, []
+                        bucket.append((gid, int(uid), int(sc), int(pos)))
+                if bucket:
+                    emit(cur_gid, cur_date, bucket)
+                    n += 1
+            await conn.commit()
+        elapsed = time.perf_counter() - t0
+        print(f"내보내기 완료: {n}판, {elapsed:.1f}s, {n / elapsed if elapsed else 0:,.0f} games/s", file=sys.stderr)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        pool.close()
+        await pool.wait_closed()
+    return 0
+
+def main(argv: List[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description="게임 기록 일괄 입력 / 내보내기")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    ap_in = sub.add_parser("import", help="CSV/JSONL 게임 기록 입력")
+    ap_in.add_argument("path")
+    ap_in.add_argument("--format", choices=("csv", "jsonl"), help="기본: 확장자로 판단")
+    ap_in.add_argument("--chunk", type=int, default=DEFAULT_CHUNK, help=f"트랜잭션당 게임 수 (기본 {DEFAULT_CHUNK})")
+    ap_in.add_argument("--dry-run", action="store_true", help="검증만 하고 입력하지 않음 (DB 접속 없음)")
+    ap_in.add_argument("--start-points", type=int, help="합계 검증용 시작 점수 (기본: 길드 설정, --dry-run 이면 25000)")
+
+    ap_out = sub.add_parser("export", help="게임 기록 내보내기 (순위/계산점 포함)")
+    ap_out.add_argument("path", help="출력 파일 (- 이면 표준 출력)")
+    ap_out.add_argument("--format", choices=("csv", "jsonl"), help="기본: 확장자로 판단")
+    ap_out.add_argument("--start", help="시작일 YYYY-MM-DD (포함)")
+    ap_out.add_argument("--end", help="종료일 YYYY-MM-DD (미포함)")
+
+    for p in (ap_in, ap_out):
+        p.add_argument("--guild", type=int, default=app.LEGACY_GUILD_ID, help="길드 ID (기본 LEGACY_GUILD_ID)")
+
+    args = ap.parse_args(argv)
+    fmt = detect_format(args.path, args.format)
+    if args.cmd == "import":
+        return asyncio.run(import_games(args.path, fmt, guild_id=args.guild, chunk=max(1, args.chunk),
+                                        dry_run=args.dry_run, start_points=args.start_points))
+    start = datetime.strptime(args.start, "%Y-%m-%d") if args.start else None
+    end = datetime.strptime(args.end, "%Y-%m-%d") if args.end else None
+    return asyncio.run(export_games(args.path, fmt, guild_id=args.guild, start=start, end=end))
+
+if __name__ == "__main__":
+    sys.exit(main())
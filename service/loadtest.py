@@ -0,0 +1,561 @@
+# loadtest.py  (동시 입력 부하 시험)
+#
+# 대회 라운드 종료 직후처럼 여러 탁이 한꺼번에 결과를 올릴 때의 동작 측정.
+# Discord 쪽만 흉내 내고(상호작용/응답/후속 메시지/채널) 봇 코드와 로컬 MySQL 은 실제로 사용:
+#   - ScoreModal.on_submit      : 탁 수만큼 동시 점수 입력 (저널 -> ScoreWriter 배치 커밋)
+#   - on_interaction + EditScoreModal.on_submit : 수정 버튼 -> 모달 제출. 같은 게임을 두 명이 같은 버전으로
+#                                 동시에 수정하는 경합(낙관적 잠금 충돌)도 포함
+#   - cmd_rank                  : 순위 조회 + 다음 페이지
+# 결과: 작업별 응답(첫 응답까지) / 전체 지연 p50·p99, 커밋 지연, 풀 고갈(대기), 데드락·잠금 대기 초과,
+#       정합성 검사(누락/중복 게임, 4행 아닌 게임, 누적표/상대전적과 game_detail 재계산 비교, 수정 반영).
+# 정합성 문제가 있으면 종료코드 1. --record 로 결과를 JSONL 에 한 줄씩 쌓아 추이 비교.
+#
+# 사용 (DB_* 환경변수는 app.py 와 동일, 시험 길드의 행만 지우고 씀):
+#   docker run -d --name mm-load -e MYSQL_ROOT_PASSWORD=pw -e MYSQL_DATABASE=mm -p 3307:3306 mysql:8
+#   DB_PORT=3307 DB_USER=root DB_PASSWORD=pw DB_NAME=mm python loadtest.py --migrate --tables 40 --rounds 3
+#   python loadtest.py --tables 80 --pool 10 --record loadtest_history.jsonl
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import List, Dict, Any, Callable, Awaitable
+
+import aiomysql
+import discord
+
+import app
+
+LOAD_GUILD_ID = 990_000_000_000_000_001
+LOAD_CHANNEL_ID = 990_000_000_000_000_002
+# 시험 길드 정리 순서 (game_detail 은 game 을 참조)
+CLEAN_TABLES = ("game_detail", "game", "player_standings", "standings_snapshot", "player_pair",
+                "player_rating", "rating_checkpoint", "rating_state", "guild_config")
+DB_ERROR_KINDS = {1213: "deadlock", 1205: "lock_wait_timeout"}
+DB_ERROR_REPLY = re.compile(r"^DB 오류: \((\d+),")  # EditScoreModal 응답: "DB 오류: (1213, '...')"
+
+# ── 가짜 Discord ──────────────────────────────────────────────────────────────
+class FakeGateway:
+    """봇이 보내는 Discord API 호출 대신: api_latency 만큼 기다리고 호출 수만 셈."""
+    def __init__(self, api_latency: float):
+        self.api_latency = api_latency
+        self.calls: Dict[str, int] = {}
+        self._ids = 10**15
+
+    def next_id(self) -> int:
+        self._ids += 1
+        return self._ids
+
+    async def call(self, op: str) -> None:
+        self.calls[op] = self.calls.get(op, 0) + 1
+        await asyncio.sleep(self.api_latency)
+
+    # MessageUpdater 가 쓰는 discord.Client 메서드
+    def get_channel(self, channel_id: int) -> "FakeChannel":
+        return FakeChannel(self, channel_id)
+
+    get_partial_messageable = get_channel
+
+class FakeChannel:
+    def __init__(self, gateway: FakeGateway, channel_id: int):
+        self.gateway = gateway
+        self.id = channel_id
+
+    def get_partial_message(self, message_id: int) -> "FakeMessage":
+        return FakeMessage(self, message_id)
+
+    async def send(self, content: str | None = None, **kwargs: Any) -> "FakeMessage":
+        await self.gateway.call("channel_send")
+        return FakeMessage(self, self.gateway.next_id())
+
+class FakeMessage:
+    def __init__(self, channel: FakeChannel, message_id: int):
+        self.channel = channel
+        self.id = message_id
+
+    async def edit(self, **kwargs: Any) -> "FakeMessage":
+        await self.channel.gateway.call("message_edit")
+        return self
+
+    async def delete(self) -> None:
+        await self.channel.gateway.call("message_delete")
+
+class FakeMember:
+    def __init__(self, uid: int):
+        self.id = uid
+        self.display_name = f"player{uid % 1000:03d}"
+        self.mention = app.mention(uid)
+        self.roles: List[Any] = []
+        self.guild_permissions = discord.Permissions.none()
+
+class FakeGuild:
+    def __init__(self, guild_id: int, members: List[FakeMember]):
+        self.id = guild_id
+        self.members = members
+        self._by_id = {m.id: m for m in members}
+
+    def get_member(self, uid: int) -> FakeMember | None:
+        return self._by_id.get(uid)
+
+class FakeResponse:
+    """InteractionResponse 대용: 첫 응답 시각과 보낸 내용을 기록."""
+    def __init__(self, itx: "FakeInteraction"):
+        self.itx = itx
+        self.acked_at: float | None = None
+        self.content: str | None = None
+        self.kwargs: Dict[str, Any] = {}
+        self.modal: discord.ui.Modal | None = None
+
+    def is_done(self) -> bool:
+        return self.acked_at is not None
+
+    async def _ack(self, op: str) -> None:
+        if self.acked_at is not None:
+            raise discord.InteractionResponded(self.itx)  # type: ignore[arg-type]
+        self.acked_at = time.perf_counter()
+        await self.itx.gateway.call(op)
+
+    async def send_message(self, content: str | None = None, **kwargs: Any) -> None:
+        self.content, self.kwargs = content, kwargs
+        await self._ack("interaction_send")
+
+    async def edit_message(self, content: str | None = None, **kwargs: Any) -> None:
+        self.content, self.kwargs = content, kwargs
+        await self._ack("interaction_edit")
+
+    async def send_modal(self, modal: discord.ui.Modal) -> None:
+        self.modal = modal
+        await self._ack("interaction_modal")
+
+    async def defer(self, **kwargs: Any) -> None:
+        await self._ack("interaction_defer")
+
+class FakeFollowup:
+    def __init__(self, itx: "FakeInteraction"):
+        self.itx = itx
+
+    async def send(self, content: str | None = None, *, wait: bool = False, **kwargs: Any) -> FakeMessage:
+        await self.itx.gateway.call("followup_send")
+        return FakeMessage(FakeChannel(self.itx.gateway, self.itx.channel_id), self.itx.gateway.next_id())
+
+class FakeInteraction:
+    def __init__(self, gateway: FakeGateway, guild: FakeGuild, user: FakeMember, *,
+                 type: discord.InteractionType = discord.InteractionType.application_command,
+                 data: Dict[str, Any] | None = None):
+        self.gateway = gateway
+        self.type = type
+        self.data = data or {}
+        self.user = user
+        self.guild = guild
+        self.guild_id = guild.id
+        self.channel_id = LOAD_CHANNEL_ID
+        self.client = app.bot
+        self.response = FakeResponse(self)
+        self.followup = FakeFollowup(self)
+
+def fill_modal(modal: discord.ui.Modal, itx: FakeInteraction, values: List[int]) -> None:
+    """게이트웨이의 MODAL_SUBMIT 페이로드처럼 입력 칸 값 설정."""
+    for child, v in zip(modal.children, values):
+        child._refresh_state(itx, {"type": 4, "custom_id": child.custom_id, "value": str(v)})  # type: ignore[attr-defined]
+
+# ── 측정 ──────────────────────────────────────────────────────────────────────
+def percentile(values: List[float], q: float) -> float:
+    """최근접 순위 분위수."""
+    if not values:
+        return 0.0
+    s = sorted(values)
+    return s[min(len(s) - 1, max(0, int(q * len(s) + 0.5) - 1))]
+
+class OpStats:
+    def __init__(self):
+        self.ack: List[float] = []
+        self.total: List[float] = []
+        self.errors = 0
+        self.outcomes: Dict[str, int] = {}
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "n": len(self.total),
+            "errors": self.errors,
+            "ack_p50_ms": percentile(self.ack, 0.5) * 1000,
+            "ack_p99_ms": percentile(self.ack, 0.99) * 1000,
+            "p50_ms": percentile(self.total, 0.5) * 1000,
+            "p99_ms": percentile(self.total, 0.99) * 1000,
+            "outcomes": dict(self.outcomes),
+        }
+
+class DbErrorLog(logging.Handler):
+    """app 로거의 예외(ScoreWriter 재시도 등)에서 MySQL 오류 코드 집계."""
+    def __init__(self):
+        super().__init__(logging.WARNING)
+        self.counts: Dict[str, int] = {}
+
+    def add(self, code: int) -> None:
+        kind = DB_ERROR_KINDS.get(code, f"mysql_{code}")
+        self.counts[kind] = self.counts.get(kind, 0) + 1
+
+    def count(self, exc: BaseException | None) -> None:
+        while exc is not None:
+            if exc.args and isinstance(exc.args[0], int):
+                self.add(exc.args[0])
+                return
+            exc = exc.__cause__ or exc.__context__
+
+    def count_reply(self, content: str | None) -> None:
+        """로그 없이 사용자 응답으로만 나가는 DB 오류."""
+        m = DB_ERROR_REPLY.match(content or "")
+        if m:
+            self.add(int(m.group(1)))
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if record.exc_info:
+            self.count(record.exc_info[1])
+
+class PoolSampler:
+    """풀 대기 상태를 sample_sec 마다 확인: 최대 대기 수, 고갈 구간(대기 0 -> 양수 전환) 수."""
+    def __init__(self, pool: app.MeteredPool, sample_sec: float = 0.002):
+        self.pool = pool
+        self.sample_sec = sample_sec
+        self.max_waiting = 0
+        self.episodes = 0
+        self.exhausted_sec = 0.0
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        was_waiting = False
+        last = time.perf_counter()
+        while True:
+            await asyncio.sleep(self.sample_sec)
+            now = time.perf_counter()
+            waiting = self.pool.waiting
+            self.max_waiting = max(self.max_waiting, waiting)
+            if waiting and not was_waiting:
+                self.episodes += 1
+            if waiting:
+                self.exhausted_sec += now - last
+            was_waiting, last = bool(waiting), now
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+class LoadRun:
+    def __init__(self, args: argparse.Namespace, pool: app.MeteredPool, gateway: FakeGateway, db_errors: DbErrorLog):
+        self.args = args
+        self.pool = pool
+        self.gateway = gateway
+        self.db_errors = db_errors
+        self.rnd = random.Random(args.seed)
+        self.players = [FakeMember(10**17 + i) for i in range(args.players)]
+        self.guild = FakeGuild(args.guild, self.players)
+        self.config = app.bot.guild_configs.get(args.guild)
+        self.ops: Dict[str, OpStats] = {}
+        self.commit_lat: List[float] = []
+        self.committed: List[app.PendingGame] = []
+        self.acked = 0
+        self.expected: Dict[int, List[int]] = {}   # game_id -> 성공한 마지막 수정의 좌석 점수
+        self.race_games = 0
+        self.race_winners: Dict[int, int] = {}     # 경합 게임 -> 성공한 수정 수 (정상 1)
+
+    def stats(self, op: str) -> OpStats:
+        return self.ops.setdefault(op, OpStats())
+
+    async def timed(self, op: str, itx: FakeInteraction, fn: Callable[[], Awaitable[None]]) -> FakeInteraction:
+        st = self.stats(op)
+        t0 = time.perf_counter()
+        try:
+            await fn()
+        except Exception:
+            st.errors += 1
+            logging.getLogger("loadtest").exception("%s failed", op)
+        st.total.append(time.perf_counter() - t0)
+        if itx.response.acked_at is not None:
+            st.ack.append(itx.response.acked_at - t0)
+        self.db_errors.count_reply(itx.response.content)
+        outcome = classify(itx.response.content)
+        st.outcomes[outcome] = st.outcomes.get(outcome, 0) + 1
+        return itx
+
+    async def on_commit(self, entry: app.PendingGame) -> None:
+        self.commit_lat.append(time.time() - entry.ts)
+        self.committed.append(entry)
+        await app.bot._on_game_committed(entry)
+
+    def table_scores(self) -> List[int]:
+        scores = [self.rnd.randrange(0, 600) * 100 for _ in range(3)]
+        scores.append(self.config.rules.target_total - sum(scores))
+        return scores
+
+    # ── 작업 ──
+    async def submit(self) -> None:
+        members = self.rnd.sample(self.players, 4)
+        itx = FakeInteraction(self.gateway, self.guild, members[0], type=discord.InteractionType.modal_submit)
+        modal = app.ScoreModal(members, self.pool, self.config)  # type: ignore[arg-type]
+        fill_modal(modal, itx, self.table_scores())
+        await self.timed("score_submit", itx, lambda: modal.on_submit(itx))  # type: ignore[arg-type]
+        if (itx.response.content or "").startswith("저장 완료"):
+            self.acked += 1
+
+    async def open_edit(self, entry: app.PendingGame) -> discord.ui.Modal | None:
+        itx = FakeInteraction(
+            self.gateway, self.guild, self.guild.get_member(entry.rows[0][0]),
+            type=discord.InteractionType.component,
+            data={"custom_id": f"mm_edit:{entry.game_id}:{entry.message_id}:{entry.channel_id}"},
+        )
+        await self.timed("edit_open", itx, lambda: app.on_interaction(itx))  # type: ignore[arg-type]
+        return itx.response.modal
+
+    async def submit_edit(self, modal: discord.ui.Modal, entry: app.PendingGame, shift: int) -> bool:
+        scores = [s for _, s, _ in sorted(entry.rows, key=lambda r: r[2])]
+        scores[0] += shift
+        scores[1] -= shift
+        itx = FakeInteraction(self.gateway, self.guild, self.guild.get_member(entry.rows[0][0]),
+                              type=discord.InteractionType.modal_submit)
+        fill_modal(modal, itx, scores)
+        await self.timed("edit_submit", itx, lambda: modal.on_submit(itx))  # type: ignore[arg-type]
+        ok = itx.response.content == "수정 완료"
+        if ok:
+            self.expected[entry.game_id] = scores
+        return ok
+
+    async def edit(self, entry: app.PendingGame) -> None:
+        modal = await self.open_edit(entry)
+        if modal is not None:
+            await self.submit_edit(modal, entry, 100)
+
+    async def edit_race(self, entry: app.PendingGame) -> None:
+        """같은 버전으로 연 모달 두 개를 동시에 제출: 하나만 성공해야 함."""
+        modals = await asyncio.gather(self.open_edit(entry), self.open_edit(entry))
+        if any(m is None for m in modals):
+            return
+        self.race_games += 1
+        results = await asyncio.gather(*(self.submit_edit(m, entry, shift) for m, shift in zip(modals, (200, 300))))
+        self.race_winners[entry.game_id] = sum(results)
+
+    async def rank(self) -> None:
+        user = self.rnd.choice(self.players)
+        sort = "rating" if self.rnd.random() < 0.2 else "avg"
+        itx = FakeInteraction(self.gateway, self.guild, user)
+        await self.timed("rank", itx, lambda: app.cmd_rank.callback(itx, limit=10, sort=sort))  # type: ignore[arg-type]
+        view = itx.response.kwargs.get("view")
+        if isinstance(view, app.LeaderboardView) and not view.next_btn.disabled:
+            page = FakeInteraction(self.gateway, self.guild, user, type=discord.InteractionType.component)
+            await self.timed("rank_page", page, lambda: view.next_btn.callback(page))  # type: ignore[arg-type]
+
+    async def drain(self, timeout: float = 120.0) -> None:
+        """ScoreWriter 대기열이 빌 때까지."""
+        deadline = time.perf_counter() + timeout
+        while app.bot.score_writer.backlog() and time.perf_counter() < deadline:
+            await asyncio.sleep(0.01)
+
+    async def round(self, n: int) -> None:
+        t0 = time.perf_counter()
+        start = len(self.committed)
+        await asyncio.gather(*(self.submit() for _ in range(self.args.tables)),
+                             *(self.rank() for _ in range(self.args.ranks)))
+        await self.drain()
+        fresh = [e for e in self.committed[start:] if e.game_id is not None and e.message_id is not None]
+        self.rnd.shuffle(fresh)
+        races = fresh[:self.args.races]
+        edits = fresh[self.args.races:self.args.races + self.args.edits]
+        await asyncio.gather(*(self.edit(e) for e in edits), *(self.edit_race(e) for e in races),
+                             *(self.rank() for _ in range(self.args.ranks)))
+        print(f"  라운드 {n}: 입력 {self.args.tables} / 수정 {len(edits)} / 경합 {len(races)} / "
+              f"순위 {self.args.ranks * 2}  {time.perf_counter() - t0:.2f}s", flush=True)
+
+def classify(content: str | None) -> str:
+    """응답 문구 -> 결과 분류."""
+    if content is None:
+        return "view"
+    for prefix, label in (("저장 완료", "ok"), ("수정 완료", "ok"), ("DB 오류", "db_error"), ("저장 실패", "error"),
+                          ("아직 DB에 반영 중", "pending"), ("데이터가 없습니다", "empty")):
+        if content.startswith(prefix):
+            return label
+    if "먼저 수정/삭제" in content:
+        return "conflict"
+    return "other"
+
+# ── 정합성 검사 ───────────────────────────────────────────────────────────────
+async def check_integrity(pool: aiomysql.Pool, run: LoadRun) -> Dict[str, int]:
+    guild_id = run.args.guild
+    async with pool.acquire() as conn, conn.cursor() as cur:
+        await cur.execute("SELECT COUNT(*) FROM game WHERE guild_id=%s", (guild_id,))
+        games = int((await cur.fetchone())[0])
+        await cur.execute(
+            "SELECT COUNT(*) FROM (SELECT game_id FROM game_detail WHERE guild_id=%s "
+            "GROUP BY game_id HAVING COUNT(*) <> 4) t",
+            (guild_id,),
+        )
+        bad_games = int((await cur.fetchone())[0])
+        await cur.execute(
+            "SELECT user_id, games, score_sum, rank1, rank2, rank3, rank4 FROM player_standings "
+            "WHERE guild_id=%s AND games <> 0",
+            (guild_id,),
+        )
+        standings = {int(r[0]): [int(v) for v in r[1:]] for r in await cur.fetchall()}
+        await cur.execute(
+            "SELECT user_lo, user_hi, games, lo_above, score_diff, net1, net2, net3, net4 FROM player_pair "
+            "WHERE guild_id=%s AND games <> 0",
+            (guild_id,),
+        )
+        pairs = {(int(r[0]), int(r[1])): [int(v) for v in r[2:]] for r in await cur.fetchall()}
+        await conn.commit()
+    details = await app.fetch_all_details(pool, guild_id)
+    expect_standings = {uid: v for uid, *v in app.standings_packed(app.pack_rows(details)) if v[0]}
+    expect_pairs = {k: v for k, v in app.pairs_from_details(details).items() if v[0]}
+    scores = {gid: [sc for _, _, sc, _ in sorted(b, key=lambda r: r[3])] for gid, b in app.iter_groupby_game(details)}
+    keys = lambda a, b: set(a) | set(b)
+    return {
+        "acked": run.acked,
+        "committed": len(run.committed),
+        "games_in_db": games,
+        "lost_games": max(0, run.acked - games),
+        "duplicate_games": max(0, games - run.acked),
+        "incomplete_games": bad_games,
+        "standings_mismatch": sum(standings.get(k) != expect_standings.get(k) for k in keys(standings, expect_standings)),
+        "pair_mismatch": sum(pairs.get(k) != expect_pairs.get(k) for k in keys(pairs, expect_pairs)),
+        "edit_mismatch": sum(scores.get(gid) != want for gid, want in run.expected.items()),
+        "race_games": run.race_games,
+        "race_lost_updates": sum(n > 1 for n in run.race_winners.values()),
+        "race_no_winner": sum(n == 0 for n in run.race_winners.values()),
+    }
+
+INTEGRITY_FAILURES = ("lost_games", "duplicate_games", "incomplete_games", "standings_mismatch", "pair_mismatch",
+                      "edit_mismatch", "race_lost_updates")
+
+async def clean_guild(pool: aiomysql.Pool, guild_id: int) -> None:
+    async with pool.acquire() as conn, conn.cursor() as cur:
+        for table in CLEAN_TABLES:
+            await cur.execute(f"DELETE FROM {table} WHERE guild_id=%s", (guild_id,))
+        await conn.commit()
+
+# ── 실행 ──────────────────────────────────────────────────────────────────────
+async def run(args: argparse.Namespace) -> int:
+    pool = app.MeteredPool(await aiomysql.create_pool(
+        host=app.DB_HOST, port=app.DB_PORT,
+        user=app.DB_USER, password=app.DB_PASSWORD, db=app.DB_NAME,
+        autocommit=False, minsize=min(args.prewarm, args.pool), maxsize=args.pool,
+    ))
+    db_errors = DbErrorLog()
+    app.log.addHandler(db_errors)
+    gateway = FakeGateway(args.api_latency)
+    sampler = PoolSampler(pool)
+    bot = app.bot
+    integrity: Dict[str, int] = {}
+    try:
+        if args.migrate:
+            applied = await app.run_migrations(pool)
+            print(f"마이그레이션 적용: {applied or '없음'}")
+        await clean_guild(pool, args.guild)
+        await app.prewarm_pool(pool, args.prewarm)
+        bot.db_pool = pool
+        bot.updater = app.MessageUpdater(gateway)  # type: ignore[arg-type]
+        await bot.guild_configs.save(pool, app.GuildConfig(args.guild, [LOAD_CHANNEL_ID], "loadtest"))
+
+        with tempfile.TemporaryDirectory() as tmp:
+            load = LoadRun(args, pool, gateway, db_errors)
+            bot.score_writer = app.ScoreWriter(app.ScoreJournal(os.path.join(tmp, "journal.jsonl")),
+                                               pool, load.on_commit, bot._on_game_message)
+            bot.score_writer.start()
+            print(f"부하 시험: 탁 {args.tables} × {args.rounds}라운드, 풀 {args.pool}, "
+                  f"API 지연 {args.api_latency * 1000:.0f}ms")
+            sampler.start()
+            t0 = time.perf_counter()
+            for n in range(1, args.rounds + 1):
+                await load.round(n)
+            await load.drain()
+            while bot._rating_task is not None and not bot._rating_task.done():  # 수정 후 레이팅 재계산
+                await asyncio.sleep(0.05)
+            elapsed = time.perf_counter() - t0
+            await sampler.close()
+            await bot.score_writer.close()
+            await bot.updater.close()
+
+        integrity = await check_integrity(pool, load)
+        wait = app.metrics.histograms.get(app.metrics._key("mm_db_pool_wait_seconds", {}))
+        result = {
+            "time": datetime.now().isoformat(timespec="seconds"),
+            "params": {k: v for k, v in vars(args).items() if k not in ("record", "keep", "migrate")},
+            "elapsed_sec": elapsed,
+            "games_per_sec": len(load.committed) / elapsed if elapsed else 0.0,
+            "ops": {op: st.summary() for op, st in load.ops.items()},
+            "commit_p50_ms": percentile(load.commit_lat, 0.5) * 1000,
+            "commit_p99_ms": percentile(load.commit_lat, 0.99) * 1000,
+            "pool": {
+                "acquires": wait.count if wait else 0,
+                "waited": sum(wait.counts[1:]) if wait else 0,  # 첫 버킷(5ms) 초과 대기
+                "wait_p99_ms": (wait.quantile(0.99) if wait else 0.0) * 1000,
+                "max_waiting": sampler.max_waiting,
+                "exhaustion_episodes": sampler.episodes,
+                "exhausted_sec": sampler.exhausted_sec,
+            },
+            "db_errors": db_errors.counts,
+            "discord_calls": gateway.calls,
+            "integrity": integrity,
+        }
+        report(result)
+        if args.record:
+            with open(args.record, "a", encoding="utf-8") as f:
+                f.write(json.dumps(result, ensure_ascii=False) + "\n")
+        if not args.keep:
+            await clean_guild(pool, args.guild)
+    finally:
+        app.log.removeHandler(db_errors)
+        await sampler.close()
+        pool.close()
+        await pool.wait_closed()
+        app.stats.close()
+    failures = [k for k in INTEGRITY_FAILURES if integrity.get(k)]
+    print("정합성 문제 없음" if not failures else "정합성 문제: " + ", ".join(failures))
+    return 1 if failures else 0
+
+def report(r: Dict[str, Any]) -> None:
+    print(f"\n{'작업':<14}{'n':>6}{'오류':>6}{'응답 p50':>11}{'응답 p99':>11}{'전체 p50':>11}{'전체 p99':>11}  결과")
+    for op, s in r["ops"].items():
+        outcomes = " ".join(f"{k}={v}" for k, v in sorted(s["outcomes"].items()))
+        print(f"{op:<14}{s['n']:>6}{s['errors']:>6}{s['ack_p50_ms']:>9.1f}ms{s['ack_p99_ms']:>9.1f}ms"
+              f"{s['p50_ms']:>9.1f}ms{s['p99_ms']:>9.1f}ms  {outcomes}")
+    p = r["pool"]
+    print(f"\nDB 커밋 지연(입력 -> 커밋): p50 {r['commit_p50_ms']:.0f}ms  p99 {r['commit_p99_ms']:.0f}ms  "
+          f"({r['games_per_sec']:.1f} games/s, {r['elapsed_sec']:.1f}s)")
+    print(f"풀: 획득 {p['acquires']}회, 5ms 넘게 대기 {p['waited']}회 (p99 ≤{p['wait_p99_ms']:.0f}ms), "
+          f"최대 대기 {p['max_waiting']}, 고갈 구간 {p['exhaustion_episodes']}회 / {p['exhausted_sec']:.2f}s")
+    print(f"DB 오류: {' '.join(f'{k}={v}' for k, v in sorted(r['db_errors'].items())) or '없음'}")
+    print(f"Discord 호출: {' '.join(f'{k}={v}' for k, v in sorted(r['discord_calls'].items()))}")
+    print("정합성: " + " ".join(f"{k}={v}" for k, v in r["integrity"].items()))
+
+def main(argv: List[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description="동시 입력/수정/순위 조회 부하 시험 (가짜 Discord + 로컬 MySQL)")
+    ap.add_argument("--migrate", action="store_true", help="시작 전에 마이그레이션 적용")
+    ap.add_argument("--guild", type=int, default=LOAD_GUILD_ID, help="시험 길드 ID (이 길드 행은 지우고 씀)")
+    ap.add_argument("--tables", type=int, default=40, help="라운드당 동시 점수 입력(탁) 수")
+    ap.add_argument("--rounds", type=int, default=3)
+    ap.add_argument("--edits", type=int, default=10, help="라운드당 수정 수")
+    ap.add_argument("--races", type=int, default=5, help="라운드당 같은 게임 동시 수정(경합) 수")
+    ap.add_argument("--ranks", type=int, default=20, help="입력/수정 구간마다 동시 순위 조회 수")
+    ap.add_argument("--players", type=int, default=64)
+    ap.add_argument("--pool", type=int, default=app.DB_POOL_MAX, help="DB 풀 최대 연결 수")
+    ap.add_argument("--prewarm", type=int, default=app.DB_POOL_PREWARM)
+    ap.add_argument("--api-latency", type=float, default=0.05, help="가짜 Discord API 호출 지연(초)")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--record", help="결과를 JSONL 로 추가할 파일")
+    ap.add_argument("--keep", action="store_true", help="끝난 뒤 시험 길드 데이터 유지")
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    return asyncio.run(run(ap.parse_args(argv)))
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,301 @@
+# plancheck.py  (쿼리 실행 계획 검사)
+#
+# 로컬 MySQL/MariaDB 에 app 의 DB 함수를 실제로 돌려 실행된 쿼리를 기록하고,
+# 각 쿼리의 EXPLAIN 에서 인덱스가 있어야 할 곳의 전체 스캔/정렬이 보이면 종료코드 1.
+#   - 기록용 Pool 은 commit 을 rollback 으로 바꿔 검사 자체는 데이터를 바꾸지 않음
+#   - 옵티마이저가 작은 테이블은 그냥 전체 스캔하므로 빈 DB 는 --seed 로 합성 게임을 먼저 채움
+#
+# 사용 (DB_* 환경변수는 app.py 와 동일):
+#   docker run -d --name mm-plan -e MYSQL_ROOT_PASSWORD=pw -e MYSQL_DATABASE=mm -p 3307:3306 mysql:8
+#   DB_PORT=3307 DB_USER=root DB_PASSWORD=pw DB_NAME=mm python plancheck.py --migrate --seed 5000
+#   (--guild: 검사할 길드, 기본 1. 다른 길드 행이 섞여 있어도 guild_id 접두 인덱스만 타야 함)
+#   (MariaDB: mariadb:11 이미지, MARIADB_ROOT_PASSWORD / MARIADB_DATABASE)
+# pytest 로도 실행됨 (tests/test_plancheck.py): 같은 DB_* 로 접속, 접속할 수 없으면 건너뜀
+
+import argparse
+import asyncio
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import List, Tuple, Dict, Any
+
+import aiomysql
+
+import app
+import bench
+import history
+import loadtest
+
+# (라벨, SQL, 인자) — 라벨은 app 의 @metered 호출 이름
+Recorded = Tuple[str, str, Any]
+
+# 검사 대상 테이블: 여기서 인덱스 없는 전체 스캔(type ALL/index)은 실패
+INDEXED_TABLES = {"game", "game_detail", "standings_snapshot", "player_standings", "player_rating", "player_pair"}
+# 전체 스캔이 의도된 호출: 대신 PK 순서로 읽어 정렬(filesort)이 없어야 함
+ORDERED_FULL_SCANS = {"fetch_all_details", "stream_all_details", "fetch_packed_details", "rebuild_standings",
+                      "rebuild_pairs"}
+
+# ── 기록용 Pool ───────────────────────────────────────────────────────────────
+class RecordingCursor:
+    def __init__(self, cur: aiomysql.Cursor, log: List[Recorded]):
+        self._cur = cur
+        self._log = log
+
+    async def execute(self, sql: str, args: Any = None) -> int:
+        self._log.append((app._db_call.get() or "other", sql, args))
+        return await self._cur.execute(sql, args)
+
+    async def executemany(self, sql: str, args: Any) -> int:
+        args = list(args)
+        if args:
+            self._log.append((app._db_call.get() or "other", sql, args[0]))  # 계획은 한 행으로 충분
+        return await self._cur.executemany(sql, args)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._cur, name)
+
+class _RecordingCursorContext:
+    def __init__(self, ctx: Any, log: List[Recorded]):
+        self._ctx = ctx
+        self._log = log
+
+    async def __aenter__(self) -> RecordingCursor:
+        return RecordingCursor(await self._ctx.__aenter__(), self._log)
+
+    async def __aexit__(self, *exc):
+        return await self._ctx.__aexit__(*exc)
+
+class RecordingConnection:
+    """commit 은 rollback 으로 대체: 검사 중 쓰기 경로(삭제/수정)를 돌려도 DB 는 그대로."""
+    def __init__(self, conn: aiomysql.Connection, log: List[Recorded]):
+        self._conn = conn
+        self._log = log
+
+    def cursor(self, *cursor_cls: Any) -> _RecordingCursorContext:
+        return _RecordingCursorContext(self._conn.cursor(*cursor_cls), self._log)
+
+    async def commit(self) -> None:
+        await self._conn.rollback()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._conn, name)
+
+class _RecordingAcquire:
+    def __init__(self, pool: "RecordingPool"):
+        self.pool = pool
+        self._ctx = None
+
+    async def __aenter__(self) -> RecordingConnection:
+        self._ctx = self.pool.pool.acquire()
+        return RecordingConnection(await self._ctx.__aenter__(), self.pool.log)
+
+    async def __aexit__(self, *exc):
+        return await self._ctx.__aexit__(*exc)
+
+class RecordingPool:
+    def __init__(self, pool: aiomysql.Pool):
+        self.pool = pool
+        self.log: List[Recorded] = []
+
+    def acquire(self) -> _RecordingAcquire:
+        return _RecordingAcquire(self)
+
+# ── 데이터 준비 ───────────────────────────────────────────────────────────────
+async def seed(pool: aiomysql.Pool, guild_id: int, n_games: int) -> bool:
+    """길드에 게임이 없으면 합성 게임 n_games 판(2시간 간격) 입력 후 누적표/스냅샷 재계산."""
+    async with pool.acquire() as conn, conn.cursor() as cur:
+        await cur.execute("SELECT COUNT(*) FROM game WHERE guild_id=%s", (guild_id,))
+        if (await cur.fetchone())[0]:
+            await conn.commit()
+            return False
+        await cur.execute("SELECT COALESCE(MAX(id), 0) FROM game")
+        base = int((await cur.fetchone())[0])
+        rows = [(guild_id, base + g, u, sc, p) for g, u, sc, p in bench.generate_games(n_games)]
+        start = datetime.now().replace(microsecond=0) - timedelta(hours=2 * n_games + 1)
+        for lo in range(0, n_games, 1000):
+            hi = min(lo + 1000, n_games)
+            await cur.executemany(
+                "INSERT INTO game (id, guild_id, date) VALUES (%s,%s,%s)",
+                [(base + gid, guild_id, start + timedelta(hours=2 * gid)) for gid in range(lo + 1, hi + 1)],
+            )
+            await cur.executemany(
+                "INSERT INTO game_detail (guild_id, game_id, user_id, score, position) VALUES (%s,%s,%s,%s,%s)",
+                rows[lo * 4:hi * 4],
+            )
+            await conn.commit()
+    await app.rebuild_standings(pool, guild_id)
+    await app.rebuild_pairs(pool, guild_id)
+    await app.rebuild_snapshots(pool, guild_id)
+    await app.rebuild_ratings(pool, guild_id)
+    return True
+
+async def analyze(pool: aiomysql.Pool) -> None:
+    async with pool.acquire() as conn, conn.cursor() as cur:
+        await cur.execute("ANALYZE TABLE game, game_detail, player_standings, standings_snapshot, player_rating, player_pair")
+        await cur.fetchall()
+        await conn.commit()
+
+async def sample_keys(pool: aiomysql.Pool, guild_id: int) -> Tuple[int, int, datetime, datetime]:
+    """검사에 쓸 (game_id, user_id, 기간 시작, 기간 끝): 중간쯤 게임과 가장 많이 참가한 사용자."""
+    async with pool.acquire() as conn, conn.cursor() as cur:
+        await cur.execute("SELECT MIN(date), MAX(date), MIN(id), MAX(id) FROM game WHERE guild_id=%s", (guild_id,))
+        lo, hi, min_id, max_id = await cur.fetchone()
+        await cur.execute(
+            "SELECT user_id FROM player_standings WHERE guild_id=%s ORDER BY games DESC LIMIT 1", (guild_id,)
+        )
+        row = await cur.fetchone()
+        await conn.commit()
+    if max_id is None or row is None:
+        raise SystemExit("게임 기록 없음: --seed 로 합성 데이터를 먼저 넣으세요")
+    span = hi - lo
+    return (int(min_id) + int(max_id)) // 2, int(row[0]), lo + span / 3, lo + span * 2 / 3
+
+# ── 실행 + 기록 ───────────────────────────────────────────────────────────────
+async def exercise(rec: RecordingPool, guild: int, gid: int, uid: int, start: datetime, end: datetime) -> None:
+    """봇의 읽기/쓰기 경로를 기록용 Pool 로 실행."""
+    await app.fetch_game(rec, guild, gid)
+    version, date, rows = await app.fetch_game_versioned(rec, guild, gid)
+    await app.fetch_game_id_by_journal(rec, guild, 1)
+    await app.fetch_all_details(rec, guild)
+    async for _ in app.stream_all_details(rec, guild):
+        pass
+    async for _ in app.fetch_packed_details(rec, guild):
+        pass
+    await app.fetch_player_games(rec, guild, uid)
+    await app.fetch_standings(rec, guild)
+    await app.fetch_window_standings(rec, guild, start, end)
+    await app.fetch_ratings(rec, guild)
+    await app.fetch_pair(rec, guild, uid, next(int(r["user_id"]) for r in rows if int(r["user_id"]) != uid))
+    await app.rebuild_standings(rec, guild)
+    await app.rebuild_pairs(rec, guild)
+    with tempfile.TemporaryDirectory() as history_dir:
+        snap = app.HistorySnapshot(history_dir, guild)
+        snap.load()
+        await app.sync_history(rec, snap)
+        # /마장 순위재계산: 스냅샷이 DB 와 같으면 game 잠금 조회만
+        await app.rebuild_standings(rec, guild, snap)
+        await app.rebuild_pairs(rec, guild, snap)
+    await app.take_snapshot(rec, guild, min_games=1)
+    await app.delete_game(rec, guild, gid)
+
+    # 봇이 쓰는 경로 그대로: ScoreWriter 배치 커밋, 수정 모달 제출(Discord 쪽은 loadtest 의 가짜 객체)
+    await app.commit_pending_games(rec, [app.PendingGame(time.time_ns() // 1_000_000, time.time(),
+                                                         [(int(r["user_id"]), int(r["score"]), int(r["position"]))
+                                                          for r in rows], guild)])
+    # 기록 입력(history.py import): 기존 스냅샷보다 이른 날짜 -> 스냅샷 반영
+    seats = [(int(r["user_id"]), int(r["score"])) for r in sorted(rows, key=lambda r: int(r["position"]))]
+    await history.insert_chunk(rec, guild, [(date, seats)])
+    await submit_edit(rec, guild, gid, version, date, rows)
+
+async def submit_edit(rec: RecordingPool, guild: int, gid: int, version: int, date: datetime,
+                      rows: List[Dict[str, Any]]) -> None:
+    """EditScoreModal.on_submit 실행 (동/서 100점 이동). 제출 후 예약되는 레이팅 재계산까지 기다림."""
+    bot = app.bot
+    gateway = loadtest.FakeGateway(0.0)
+    fake_guild = loadtest.FakeGuild(guild, [])
+    bot.db_pool = rec
+    bot.updater = app.MessageUpdater(gateway)  # type: ignore[arg-type]
+    modal = app.EditScoreModal(gid, rows, fake_guild, app.GuildConfig(guild), rec,  # type: ignore[arg-type]
+                               gateway.next_id(), loadtest.LOAD_CHANNEL_ID, version=version, game_date=date)
+    itx = loadtest.FakeInteraction(gateway, fake_guild, loadtest.FakeMember(int(rows[0]["user_id"])))
+    scores = [int(r["score"]) + (100 if p == 0 else -100 if p == 1 else 0) for p, r in enumerate(rows)]
+    loadtest.fill_modal(modal, itx, scores)
+    with app.metrics.db_call("edit_game"):
+        await modal.on_submit(itx)  # type: ignore[arg-type]
+    if itx.response.content != "수정 완료":
+        raise SystemExit(f"수정 모달 실패: {itx.response.content}")
+    if bot._rating_task is not None:
+        await bot._rating_task
+    await bot.updater.close()
+    bot.db_pool = None
+
+def explainable(sql: str) -> bool:
+    """테이블을 읽는 SELECT/UPDATE/DELETE 만 (INSERT, GET_LOCK 등 제외)."""
+    head = sql.split(None, 1)[0].upper()
+    return head in ("UPDATE", "DELETE") or (head == "SELECT" and " FROM " in sql.upper())
+
+def check_plan(label: str, sql: str, plan: List[Dict[str, Any]]) -> List[str]:
+    """
+    EXPLAIN 행 목록 -> 문제 목록.
+    ORDER BY .. LIMIT 의 인덱스 순서 읽기(type=index)는 앞에서 멈추므로 전체 스캔으로 보지 않음.
+    """
+    limited = " LIMIT " in sql.upper()
+    problems = []
+    for row in plan:
+        table = row["_table"]
+        access = (row.get("type") or "").upper()
+        if label in ORDERED_FULL_SCANS:
+            if "filesort" in (row.get("Extra") or ""):
+                problems.append(f"{table}: 정렬(filesort) — PK 순서로 읽혀야 함")
+        elif (access == "ALL" or (access == "INDEX" and not limited)) and table in INDEXED_TABLES:
+            problems.append(f"{table}: 전체 스캔(type={access}, key={row.get('key')})")
+    return problems
+
+TABLE_ALIASES = {"g": "game", "d": "game_detail", "me": "game_detail"}  # EXPLAIN 은 별칭으로 표시
+
+async def explain_all(pool: aiomysql.Pool, recorded: List[Recorded]) -> int:
+    seen = set()
+    failures = 0
+    async with pool.acquire() as conn, conn.cursor(aiomysql.DictCursor) as cur:
+        for label, sql, args in recorded:
+            flat = " ".join(sql.split())
+            if (label, flat) in seen or not explainable(flat):
+                continue
+            seen.add((label, flat))
+            await cur.execute("EXPLAIN " + flat, args)
+            plan = await cur.fetchall()
+            for row in plan:
+                t = row.get("table") or ""
+                row["_table"] = TABLE_ALIASES.get(t, t).strip("<>")
+            problems = check_plan(label, flat, plan)
+            status = "FAIL" if problems else "ok"
+            failures += bool(problems)
+            print(f"[{status:>4}] {label:<24} {flat[:110]}")
+            for row in plan:
+                print(f"        {row['_table']:<20} type={row.get('type')!s:<7} key={row.get('key')!s:<22} "
+                      f"rows={row.get('rows')!s:<8} {row.get('Extra') or ''}")
+            for p in problems:
+                print(f"        !! {p}")
+        await conn.rollback()
+    return failures
+
+async def create_pool(**kwargs: Any) -> aiomysql.Pool:
+    return await aiomysql.create_pool(
+        host=app.DB_HOST, port=app.DB_PORT,
+        user=app.DB_USER, password=app.DB_PASSWORD, db=app.DB_NAME,
+        autocommit=False, minsize=1, maxsize=2, **kwargs,
+    )
+
+async def check(pool: aiomysql.Pool, guild: int, *, migrate: bool, seed_games: int) -> int:
+    """마이그레이션/합성 데이터 준비 후 경로 실행 + EXPLAIN 검사. return: 문제 있는 쿼리 수 (tests/test_plancheck.py 도 사용)"""
+    if migrate:
+        applied = await app.run_migrations(pool)
+        print(f"마이그레이션 적용: {applied or '없음'}")
+    if seed_games and await seed(pool, guild, seed_games):
+        print(f"길드 {guild}: 합성 게임 {seed_games}판 입력")
+    await analyze(pool)
+    gid, uid, start, end = await sample_keys(pool, guild)
+    rec = RecordingPool(pool)
+    await exercise(rec, guild, gid, uid, start, end)
+    return await explain_all(pool, rec.log)
+
+async def run(args: argparse.Namespace) -> int:
+    pool = await create_pool()
+    try:
+        failures = await check(pool, args.guild, migrate=args.migrate, seed_games=args.seed)
+    finally:
+        pool.close()
+        await pool.wait_closed()
+    print("계획 문제 없음" if not failures else f"계획 문제 {failures}건")
+    return 1 if failures else 0
+
+def main(argv: List[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description="app 쿼리 실행 계획 검사 (EXPLAIN)")
+    ap.add_argument("--migrate", action="store_true", help="검사 전에 마이그레이션 적용")
+    ap.add_argument("--seed", type=int, default=0, help="길드에 게임이 없으면 합성 게임 N판 입력")
+    ap.add_argument("--guild", type=int, default=1, help="검사할 길드 ID (기본 1)")
+    return asyncio.run(run(ap.parse_args(argv)))
+
+if __name__ == "__main__":
+    sys.exit(main())
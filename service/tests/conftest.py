@@ -0,0 +1,101 @@
+import os
+import re
+import sqlite3
+import sys
+from datetime import datetime
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+sqlite3.register_adapter(datetime, lambda d: d.isoformat(" "))
+
+class SqliteCursor:
+    """aiomysql 커서 흉내: %s 자리표시자/MySQL 전용 구문을 sqlite 로 옮겨 실행."""
+    _REWRITES = (
+        (re.compile(r" LOCK IN SHARE MODE| FOR UPDATE"), ""),
+        (re.compile(r"NOW\(\) - INTERVAL %s SECOND"), "datetime('now', '-' || ? || ' seconds')"),
+        (re.compile(r"\bINSERT IGNORE\b"), "INSERT OR IGNORE"),
+        (re.compile(r"\bLEAST\("), "MIN("),
+        (re.compile(r"\bGREATEST\("), "MAX("),
+        (re.compile(r"\bON DUPLICATE KEY UPDATE\b"), "ON CONFLICT DO UPDATE SET"),
+        (re.compile(r"\bVALUES\((\w+)\)"), r"excluded.\1"),
+        (re.compile(r"%s"), "?"),
+    )
+
+    def __init__(self, db: sqlite3.Connection):
+        self._cur = db.cursor()
+        self._first_rowid = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self._cur.close()
+
+    @classmethod
+    def translate(cls, sql: str) -> str:
+        for pat, repl in cls._REWRITES:
+            sql = pat.sub(repl, sql)
+        return sql
+
+    async def execute(self, sql, params=()):
+        self._cur.execute(self.translate(sql), tuple(params))
+        # MySQL 처럼 다중 행 INSERT 의 lastrowid 는 첫 행 id
+        self._first_rowid = None
+        if sql.lstrip().upper().startswith("INSERT") and self._cur.rowcount > 1:
+            self._first_rowid = self._cur.lastrowid - self._cur.rowcount + 1
+        return self._cur.rowcount
+
+    async def executemany(self, sql, seq):
+        self._cur.executemany(self.translate(sql), [tuple(p) for p in seq])
+        return self._cur.rowcount
+
+    async def fetchone(self):
+        return self._cur.fetchone()
+
+    async def fetchall(self):
+        return self._cur.fetchall()
+
+    async def fetchmany(self, size):
+        return self._cur.fetchmany(size)
+
+    @property
+    def lastrowid(self):
+        return self._first_rowid or self._cur.lastrowid
+
+class SqliteConn:
+    def __init__(self, db: sqlite3.Connection):
+        self.db = db
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+    def cursor(self, *_):
+        return SqliteCursor(self.db)
+
+    async def begin(self):
+        pass
+
+    async def commit(self):
+        self.db.commit()
+
+    async def rollback(self):
+        self.db.rollback()
+
+class SqlitePool:
+    """app 함수에 넘길 수 있는 최소 pool. 스키마는 테스트가 직접 만든다."""
+    def __init__(self):
+        self.db = sqlite3.connect(":memory:")
+
+    def acquire(self):
+        return SqliteConn(self.db)
+
+@pytest.fixture
+def sqlite_pool():
+    pool = SqlitePool()
+    yield pool
+    pool.db.close()
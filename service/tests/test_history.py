@@ -0,0 +1,102 @@
+"""history.py import 검증 (DB 없이 --dry-run 경로), 청크 저장 시 기존 기간 스냅샷 반영."""
+import asyncio
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+import app
+import bench
+import history
+
+def write_csv(path, dates):
+    seats = [(10**17 + p, app.TARGET_TOTAL // 4) for p in range(4)]
+    lines = ["date,user0,score0,user1,score1,user2,score2,user3,score3"]
+    lines += [",".join([d] + [str(v) for s in seats for v in s]) for d in dates]
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+def dry_run(path):
+    now = datetime(2025, 6, 1)
+    return asyncio.run(history._import_games(None, str(path), "csv", now, guild_id=1, chunk=10, start_points=None))
+
+def test_import_accepts_dates_in_order(tmp_path):
+    path = tmp_path / "games.csv"
+    write_csv(path, ["2025-01-01", "2025-01-01 12:00", "2025-01-02", ""])
+    assert dry_run(path) == 0
+
+def test_import_rejects_out_of_order_dates(tmp_path, capsys):
+    path = tmp_path / "games.csv"
+    write_csv(path, ["2025-01-02", "2025-01-01"])
+    assert dry_run(path) == 1
+    assert "날짜 역순" in capsys.readouterr().err
+
+SCHEMA = (
+    "CREATE TABLE game (id INTEGER PRIMARY KEY AUTOINCREMENT, guild_id INTEGER NOT NULL, date TIMESTAMP NOT NULL)",
+    "CREATE TABLE game_detail (guild_id INTEGER NOT NULL, game_id INTEGER NOT NULL, user_id INTEGER NOT NULL, "
+    "score INTEGER NOT NULL, position INTEGER NOT NULL, PRIMARY KEY (guild_id, game_id, position))",
+    "CREATE TABLE player_standings (guild_id INTEGER NOT NULL, user_id INTEGER NOT NULL, games INTEGER, "
+    "score_sum INTEGER, rank1 INTEGER, rank2 INTEGER, rank3 INTEGER, rank4 INTEGER, PRIMARY KEY (guild_id, user_id))",
+    "CREATE TABLE player_pair (guild_id INTEGER NOT NULL, user_lo INTEGER NOT NULL, user_hi INTEGER NOT NULL, "
+    "games INTEGER, lo_above INTEGER, score_diff INTEGER, net1 INTEGER, net2 INTEGER, net3 INTEGER, net4 INTEGER, "
+    "PRIMARY KEY (guild_id, user_lo, user_hi))",
+    "CREATE TABLE standings_snapshot (guild_id INTEGER NOT NULL, snap_game_id INTEGER NOT NULL, "
+    "snap_date TIMESTAMP NOT NULL, user_id INTEGER NOT NULL, games INTEGER, score_sum INTEGER, rank1 INTEGER, "
+    "rank2 INTEGER, rank3 INTEGER, rank4 INTEGER, PRIMARY KEY (guild_id, snap_game_id, user_id))",
+    "CREATE TABLE rating_state (guild_id INTEGER PRIMARY KEY, last_game_id INTEGER NOT NULL DEFAULT 0, "
+    "last_date TEXT NULL, checkpoint_game_id INTEGER NOT NULL DEFAULT 0, dirty_from INTEGER NULL, "
+    "dirty_date TEXT NULL, version INTEGER NOT NULL DEFAULT 0, since_checkpoint INTEGER NOT NULL DEFAULT 0)",
+)
+GUILD = 1
+START = datetime(2025, 3, 1)
+
+@pytest.fixture
+def pool(sqlite_pool, monkeypatch):
+    """봇으로 쌓은 게임 200판 + SNAPSHOT_MIN_GAMES 간격 스냅샷. 날짜 열은 datetime 으로 읽음(MySQL 처럼)."""
+    sqlite3.register_converter("TIMESTAMP", lambda b: datetime.fromisoformat(b.decode()))
+    sqlite_pool.db.close()
+    sqlite_pool.db = db = sqlite3.connect(":memory:", detect_types=sqlite3.PARSE_DECLTYPES)
+    monkeypatch.setattr(app.stats, "workers", 0)
+    monkeypatch.setattr(app, "SNAPSHOT_MIN_GAMES", 40)
+    for sql in SCHEMA:
+        db.execute(sql)
+    for gid, bucket in app.iter_groupby_game(bench.generate_games(200, seed=4)):
+        db.execute("INSERT INTO game (id, guild_id, date) VALUES (?,?,?)", (gid, GUILD, START + timedelta(hours=gid)))
+        db.executemany("INSERT INTO game_detail VALUES (?,?,?,?,?)", [(GUILD, *r) for r in bucket])
+    db.commit()
+    asyncio.run(app.rebuild_snapshots(sqlite_pool, GUILD))
+    return sqlite_pool
+
+def snapshots(pool):
+    snaps = {}
+    for gid, date, uid, *v in pool.db.execute(
+            "SELECT snap_game_id, snap_date, user_id, games, score_sum, rank1, rank2, rank3, rank4 "
+            "FROM standings_snapshot WHERE guild_id=?", (GUILD,)):
+        snaps.setdefault((date, gid), {})[uid] = tuple(v)
+    return snaps
+
+def expected_snapshots(pool, keys):
+    """스냅샷 키 이하 (date, id) 게임 전부로 처음부터 센 누적값."""
+    dates = dict(pool.db.execute("SELECT id, date FROM game"))
+    rows = list(pool.db.execute("SELECT game_id, user_id, score, position FROM game_detail ORDER BY game_id"))
+    return {key: {uid: tuple(v) for uid, *v in app.standings_rows(r for r in rows if (dates[r[0]], r[0]) <= key)}
+            for key in keys}
+
+def test_import_chunks_keep_later_snapshots_exact(pool):
+    """이전 날짜 기록 입력이 중간에 멈춰도(또는 진행 중에도) 그 뒤 스냅샷의 기간 순위가 맞음."""
+    before = snapshots(pool)
+    assert len(before) == 5
+    def seats(bucket):
+        return [(uid, sc) for _, uid, sc, _ in bucket]
+
+    imported = [(START - timedelta(days=30) + timedelta(hours=i), seats(bucket))
+                for i, (_, bucket) in enumerate(app.iter_groupby_game(bench.generate_games(90, seed=8)))]
+    # 봇 기록 사이 날짜도 섞음: 일부 스냅샷만 포함해야 함
+    imported += [(START + timedelta(hours=100, minutes=i), seats(bucket))
+                 for i, (_, bucket) in enumerate(app.iter_groupby_game(bench.generate_games(20, seed=13)))]
+    for lo in (0, 50):  # 두 번째 청크 전이 "중간에 멈춘" 상태
+        asyncio.run(history.insert_chunk(pool, GUILD, imported[lo:lo + 50]))
+        after = snapshots(pool)
+        assert after.keys() == before.keys()
+        assert after == expected_snapshots(pool, after.keys())
+    asyncio.run(history.insert_chunk(pool, GUILD, imported[100:]))
+    assert snapshots(pool) == expected_snapshots(pool, before.keys())
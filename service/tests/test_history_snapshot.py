@@ -0,0 +1,109 @@
+"""컬럼 스냅샷(HistorySnapshot): 재계산이 스냅샷을 쓰는 조건, 파일 교체."""
+import asyncio
+
+import pytest
+
+import app
+import bench
+
+SCHEMA = (
+    "CREATE TABLE game (id INTEGER PRIMARY KEY, guild_id INTEGER NOT NULL, version INTEGER NOT NULL DEFAULT 0)",
+    "CREATE TABLE game_detail (guild_id INTEGER NOT NULL, game_id INTEGER NOT NULL, user_id INTEGER NOT NULL, "
+    "score INTEGER NOT NULL, position INTEGER NOT NULL, PRIMARY KEY (guild_id, game_id, position))",
+    "CREATE TABLE player_standings (guild_id INTEGER NOT NULL, user_id INTEGER NOT NULL, games INTEGER, "
+    "score_sum INTEGER, rank1 INTEGER, rank2 INTEGER, rank3 INTEGER, rank4 INTEGER, PRIMARY KEY (guild_id, user_id))",
+    "CREATE TABLE player_pair (guild_id INTEGER NOT NULL, user_lo INTEGER NOT NULL, user_hi INTEGER NOT NULL, "
+    "games INTEGER, lo_above INTEGER, score_diff INTEGER, net1 INTEGER, net2 INTEGER, net3 INTEGER, net4 INTEGER, "
+    "PRIMARY KEY (guild_id, user_lo, user_hi))",
+)
+GUILD = 1
+
+@pytest.fixture
+def pool(sqlite_pool, monkeypatch):
+    monkeypatch.setattr(app.stats, "workers", 0)
+    db = sqlite_pool.db
+    for sql in SCHEMA:
+        db.execute(sql)
+    rows = bench.generate_games(300, seed=5)
+    db.executemany("INSERT INTO game (id, guild_id) VALUES (?,?)",
+                   [(gid, GUILD) for gid, _ in app.iter_groupby_game(rows)])
+    db.executemany("INSERT INTO game_detail VALUES (?,?,?,?,?)", [(GUILD, *r) for r in rows])
+    db.commit()
+    return sqlite_pool
+
+@pytest.fixture
+def snap(pool, tmp_path):
+    snap = app.HistorySnapshot(str(tmp_path), GUILD)
+    snap.load()
+    assert asyncio.run(app.sync_history(pool, snap)) != "fresh"
+    return snap
+
+def tables(pool):
+    return (sorted(pool.db.execute("SELECT * FROM player_standings")),
+            sorted(pool.db.execute("SELECT * FROM player_pair")))
+
+def rebuild(pool, history=None):
+    asyncio.run(app.rebuild_standings(pool, GUILD, history))
+    asyncio.run(app.rebuild_pairs(pool, GUILD, history))
+    return tables(pool)
+
+def spy(monkeypatch, name):
+    calls = []
+    fn = getattr(app, name)
+
+    def wrapped(*args):
+        calls.append(args)
+        return fn(*args)
+
+    monkeypatch.setattr(app, name, wrapped)
+    return calls
+
+def test_rebuild_reads_synced_snapshot(pool, snap, monkeypatch):
+    expected = rebuild(pool)
+    standings, pairs = spy(monkeypatch, "standings_history"), spy(monkeypatch, "pairs_history")
+    packed = spy(monkeypatch, "standings_packed")
+    assert rebuild(pool, snap) == expected
+    assert len(standings) == len(pairs) == 1 and not packed
+
+def test_rebuild_falls_back_when_db_moved_on(pool, snap, monkeypatch):
+    """스냅샷 이후 수정(version +1)이 반영되지 않았으면 game_detail 에서 읽음."""
+    pool.db.execute("UPDATE game SET version=version+1 WHERE id=(SELECT MIN(id) FROM game)")
+    pool.db.commit()
+    standings = spy(monkeypatch, "standings_history")
+    packed = spy(monkeypatch, "standings_packed")
+    rebuild(pool, snap)
+    assert not standings and packed
+
+def test_reset_and_edit_replace_files(snap):
+    """워커가 매핑 중인 파일은 자르거나 덮어쓰지 않음: 새 파일로 교체, 이전 매핑은 그대로 읽힘."""
+    old = app.map_history_columns(snap.path, snap.rows)
+    before = list(old["score"][:4])
+    inode = app.os.stat(snap._file("score", "i")).st_ino
+    gid = old["game_id"][0]
+    rows = [(gid, old["user_id"][k], old["score"][k] + (100 if k == 0 else -100 if k == 1 else 0),
+             old["position"][k]) for k in range(4)]
+    assert snap.update_scores(gid, rows)
+    assert app.os.stat(snap._file("score", "i")).st_ino != inode
+    assert list(old["score"][:4]) == before
+    assert list(snap._cols["score"][:4]) == [r[2] for r in rows]
+
+    snap.reset()
+    assert snap.rows == 0
+    assert list(old["score"][:4]) == before and len(old["game_id"]) == 4 * 300
+
+def test_sync_after_delete_and_inserts_drops_deleted_game(pool, snap):
+    """삭제 1 + 새 게임 2: 전체 수/MAX(id)/SUM(version) 만으로는 추가처럼 보여도 삭제된 게임 행을 남기지 않음."""
+    db = pool.db
+    (gone,) = db.execute("SELECT MIN(id) FROM game").fetchone()
+    (last,) = db.execute("SELECT MAX(id) FROM game").fetchone()
+    db.execute("DELETE FROM game_detail WHERE game_id=?", (gone,))
+    db.execute("DELETE FROM game WHERE id=?", (gone,))
+    new = [(gid, 10**17 + p, app.TARGET_TOTAL // 4, p) for gid in (last + 1, last + 2) for p in range(4)]
+    db.executemany("INSERT INTO game (id, guild_id) VALUES (?,?)", [(last + 1, GUILD), (last + 2, GUILD)])
+    db.executemany("INSERT INTO game_detail VALUES (?,?,?,?,?)", [(GUILD, *r) for r in new])
+    db.commit()
+
+    assert asyncio.run(app.sync_history(pool, snap)) == "rebuilt"
+    assert gone not in snap.columns()["game_id"]
+    expected = rebuild(pool)
+    assert rebuild(pool, snap) == expected
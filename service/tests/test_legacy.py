@@ -0,0 +1,82 @@
+"""단일 길드 시절 기록(guild_id=0) 옮기기: 게임만 옮기고 파생 테이블은 옮긴 길드에서 다시 계산."""
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+import app
+import bench
+
+SCHEMA = (
+    "CREATE TABLE game (id INTEGER PRIMARY KEY, guild_id INTEGER NOT NULL, date TEXT NOT NULL, "
+    "version INTEGER NOT NULL DEFAULT 0)",
+    "CREATE TABLE game_detail (guild_id INTEGER NOT NULL, game_id INTEGER NOT NULL, user_id INTEGER NOT NULL, "
+    "score INTEGER NOT NULL, position INTEGER NOT NULL, PRIMARY KEY (guild_id, game_id, position))",
+    "CREATE TABLE player_standings (guild_id INTEGER NOT NULL, user_id INTEGER NOT NULL, games INTEGER, "
+    "score_sum INTEGER, rank1 INTEGER, rank2 INTEGER, rank3 INTEGER, rank4 INTEGER, PRIMARY KEY (guild_id, user_id))",
+    "CREATE TABLE standings_snapshot (guild_id INTEGER NOT NULL, snap_game_id INTEGER NOT NULL, snap_date TEXT, "
+    "user_id INTEGER NOT NULL, games INTEGER, score_sum INTEGER, rank1 INTEGER, rank2 INTEGER, rank3 INTEGER, "
+    "rank4 INTEGER, PRIMARY KEY (guild_id, snap_game_id, user_id))",
+    "CREATE TABLE player_pair (guild_id INTEGER NOT NULL, user_lo INTEGER NOT NULL, user_hi INTEGER NOT NULL, "
+    "games INTEGER, lo_above INTEGER, score_diff INTEGER, net1 INTEGER, net2 INTEGER, net3 INTEGER, net4 INTEGER, "
+    "PRIMARY KEY (guild_id, user_lo, user_hi))",
+    "CREATE TABLE player_rating (guild_id INTEGER NOT NULL, user_id INTEGER NOT NULL, rating REAL NOT NULL, "
+    "games INTEGER NOT NULL, PRIMARY KEY (guild_id, user_id))",
+    "CREATE TABLE rating_checkpoint (guild_id INTEGER NOT NULL, game_id INTEGER NOT NULL, game_date TEXT NULL, "
+    "user_id INTEGER NOT NULL, rating REAL NOT NULL, games INTEGER NOT NULL, PRIMARY KEY (guild_id, game_id, user_id))",
+    "CREATE TABLE rating_state (guild_id INTEGER PRIMARY KEY, last_game_id INTEGER NOT NULL DEFAULT 0, "
+    "last_date TEXT NULL, checkpoint_game_id INTEGER NOT NULL DEFAULT 0, dirty_from INTEGER NULL, "
+    "dirty_date TEXT NULL, version INTEGER NOT NULL DEFAULT 0, since_checkpoint INTEGER NOT NULL DEFAULT 0)",
+)
+GUILD = 42
+LEGACY_GAMES = 120
+
+@pytest.fixture
+def pool(sqlite_pool, monkeypatch):
+    """
+    guild_id=0 의 옛 기록(파생 행 포함) + LEGACY_GUILD_ID 없이 먼저 올려 GUILD 에 이미 쌓인 기록.
+    같은 사용자가 양쪽에 있어 파생 테이블을 그대로 옮기면 PK 가 겹침.
+    """
+    monkeypatch.setattr(app.stats, "workers", 0)
+    monkeypatch.setattr(app, "SNAPSHOT_MIN_GAMES", 25)
+    db = sqlite_pool.db
+    for sql in SCHEMA:
+        db.execute(sql)
+    start = datetime(2024, 1, 1)
+    for gid, bucket in app.iter_groupby_game(bench.generate_games(LEGACY_GAMES + 30, seed=9)):
+        guild = 0 if gid <= LEGACY_GAMES else GUILD
+        db.execute("INSERT INTO game (id, guild_id, date) VALUES (?,?,?)", (gid, guild, start + timedelta(hours=gid)))
+        db.executemany("INSERT INTO game_detail VALUES (?,?,?,?,?)", [(guild, *r) for r in bucket])
+    db.commit()
+    for guild in (0, GUILD):
+        asyncio.run(app.rebuild_standings(sqlite_pool, guild))
+        asyncio.run(app.rebuild_pairs(sqlite_pool, guild))
+        asyncio.run(app.rebuild_snapshots(sqlite_pool, guild))
+        asyncio.run(app.rebuild_ratings(sqlite_pool, guild))
+    return sqlite_pool
+
+def rows(pool, table, guild_id):
+    return sorted(pool.db.execute(f"SELECT * FROM {table} WHERE guild_id=?", (guild_id,)))
+
+def test_adopt_merges_into_existing_guild(pool):
+    assert asyncio.run(app.adopt_legacy_rows(pool, GUILD)) == LEGACY_GAMES
+    for table in ("game", "game_detail", *app.LEGACY_DERIVED_TABLES):
+        assert rows(pool, table, 0) == [], table
+    (games,) = pool.db.execute("SELECT COUNT(*) FROM game WHERE guild_id=?", (GUILD,)).fetchone()
+    assert games == LEGACY_GAMES + 30
+    assert pool.db.execute("SELECT dirty_from FROM rating_state WHERE guild_id=?", (GUILD,)).fetchone() == (0,)
+    assert asyncio.run(app.replay_ratings(pool, GUILD)) == games
+
+    # 파생 테이블은 옮긴 뒤 전체 기록에서 처음부터 만든 것과 같음
+    adopted = {t: rows(pool, t, GUILD) for t in ("player_standings", "player_pair", "standings_snapshot",
+                                                  "player_rating")}
+    asyncio.run(app.rebuild_standings(pool, GUILD))
+    asyncio.run(app.rebuild_pairs(pool, GUILD))
+    asyncio.run(app.rebuild_snapshots(pool, GUILD))
+    asyncio.run(app.rebuild_ratings(pool, GUILD))
+    for table, before in adopted.items():
+        assert before and rows(pool, table, GUILD) == pytest.approx(before), table
+
+    # 다시 시작해도 옮길 게임이 없으니 그대로
+    assert asyncio.run(app.adopt_legacy_rows(pool, GUILD)) == 0
+    assert asyncio.run(app.count_legacy_games(pool)) == 0
@@ -0,0 +1,26 @@
+"""마이그레이션 재실행 시 "이미 적용됨" 으로 넘기는 오류 판정."""
+import aiomysql
+
+import app
+
+def err(code: int) -> aiomysql.Error:
+    return aiomysql.OperationalError(code, "test")
+
+def test_unknown_column_only_for_drop_or_rename():
+    assert app.migration_already_applied("ALTER TABLE rating_state CHANGE id guild_id BIGINT NOT NULL", err(1054))
+    assert app.migration_already_applied("ALTER TABLE t DROP COLUMN old", err(1054))
+    assert app.migration_already_applied("ALTER TABLE t RENAME COLUMN a TO b", err(1054))
+    assert not app.migration_already_applied("CREATE INDEX idx ON game (guild_id, dte)", err(1054))
+    assert not app.migration_already_applied(
+        "ALTER TABLE game_detail DROP PRIMARY KEY, ADD PRIMARY KEY (guild_id, game_idd, position)", err(1054)
+    )
+
+def test_existing_objects_are_already_applied():
+    for code in (1050, 1060, 1061, 1068, 1826, 1091):
+        assert app.migration_already_applied("ALTER TABLE t ADD COLUMN c INT", err(code))
+    assert not app.migration_already_applied("ALTER TABLE t ADD COLUMN c INT", err(1146))
+
+def test_every_migration_1054_statement_is_exempt():
+    """CHANGE 로 이름을 바꾸는 기존 마이그레이션 문장은 재실행해도 통과."""
+    renames = [sql for _, _, stmts in app.MIGRATIONS for sql in stmts if " CHANGE " in sql]
+    assert renames and all(app.migration_already_applied(sql, err(1054)) for sql in renames)
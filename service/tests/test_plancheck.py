@@ -0,0 +1,32 @@
+"""
+핫 쿼리 실행 계획 회귀 검사: plancheck 를 DB_* 의 MySQL/MariaDB 에 실행해 EXPLAIN 에 전체 스캔/정렬이 있으면 실패.
+마이그레이션을 적용하고 PLANCHECK_GUILD 길드가 비어 있으면 합성 게임을 넣으므로 검사용 DB 를 가리킬 것.
+접속할 수 없으면 건너뜀.
+"""
+import asyncio
+import os
+
+import aiomysql
+import pytest
+
+import plancheck
+
+GUILD = int(os.getenv("PLANCHECK_GUILD", "1"))
+SEED_GAMES = int(os.getenv("PLANCHECK_SEED", "5000"))
+
+async def connect() -> aiomysql.Pool:
+    try:
+        return await plancheck.create_pool(connect_timeout=3)
+    except (OSError, aiomysql.Error) as e:
+        pytest.skip(f"MySQL/MariaDB 에 접속할 수 없음 ({e})")
+
+def test_hot_queries_have_no_full_scans():
+    async def run():
+        pool = await connect()
+        try:
+            return await plancheck.check(pool, GUILD, migrate=True, seed_games=SEED_GAMES)
+        finally:
+            pool.close()
+            await pool.wait_closed()
+
+    assert asyncio.run(run()) == 0
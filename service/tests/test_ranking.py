@@ -0,0 +1,73 @@
+"""NumPy 배치 순위 엔진과 파이썬 기준 구현(aggregate_points_py)의 결과 일치."""
+import random
+
+import pytest
+
+import app
+import bench
+
+np = pytest.importorskip("numpy")
+
+def tie_heavy_games(n_games: int, *, n_players: int = 12, seed: int = 7):
+    """
+    동점이 많은 게임: 4명 동점(전원 25000), 2~3명 동점, 일반 게임을 섞음.
+    게임 내 행 순서를 섞어 좌석 순서와 행 순서가 다르게 함.
+    """
+    rnd = random.Random(seed)
+    players = [10**17 + i for i in range(n_players)]
+    mean = app.TARGET_TOTAL // 4
+    rows = []
+    for gid in range(1, n_games + 1):
+        seat = rnd.sample(players, 4)
+        kind = rnd.randrange(4)
+        if kind == 0:
+            scores = [mean] * 4
+        elif kind == 1:
+            a = rnd.randrange(-100, 101) * 100
+            scores = [mean + a, mean + a, mean + a, mean - 3 * a]
+        elif kind == 2:
+            a = rnd.randrange(-100, 101) * 100
+            scores = [mean + a, mean + a, mean - a, mean - a]
+        else:
+            scores = [rnd.randrange(-200, 600) * 100 for _ in range(3)]
+            scores.append(app.TARGET_TOTAL - sum(scores))
+        bucket = [(gid, seat[pos], scores[pos], pos) for pos in range(4)]
+        rnd.shuffle(bucket)
+        rows.extend(bucket)
+    return rows
+
+DATASETS = {
+    "random": lambda: bench.generate_games(2000, seed=3),
+    "ties": lambda: bench.generate_games(2000, tie_rate=0.5, seed=5),
+    "tie_heavy": lambda: tie_heavy_games(2000),
+}
+
+@pytest.mark.parametrize("name", sorted(DATASETS))
+def test_aggregate_np_matches_py(name):
+    rows = DATASETS[name]()
+    _, users, scores, positions = app.pack_games(rows)
+    assert app.aggregate_points_np(users, scores, positions) == app.aggregate_points_py(rows)
+
+@pytest.mark.parametrize("name", sorted(DATASETS))
+@pytest.mark.parametrize("engine", ["numpy", "python"])
+def test_aggregate_packed_matches_py(name, engine):
+    rows = DATASETS[name]()
+    assert app.aggregate_packed(app.pack_rows(rows), engine) == app.aggregate_points_py(rows)
+
+def test_rank_games_np_four_way_tie_uses_seat_order():
+    rows = tie_heavy_games(400)
+    gids, users, scores, positions = app.pack_games(rows)
+    ranks = app.rank_games_np(scores, positions)
+    by_game = dict(app.iter_groupby_game(rows))
+    four_way = 0
+    for i, gid in enumerate(gids.tolist()):
+        expected = app.assign_ranks_for_game(by_game[gid])
+        assert {int(u): int(r) for u, r in zip(users[i], ranks[i])} == expected
+        four_way += len(set(scores[i].tolist())) == 1
+    assert four_way > 0
+
+def test_aggregate_np_skips_incomplete_games():
+    rows = bench.generate_games(50, seed=11)
+    rows = [r for r in rows if not (r[0] == 10 and r[3] == 3)]
+    _, users, scores, positions = app.pack_games(rows)
+    assert app.aggregate_points_np(users, scores, positions) == app.aggregate_points_py(rows)
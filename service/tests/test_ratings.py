@@ -0,0 +1,161 @@
+"""레이팅 재계산(replay_ratings): 길드별 체크포인트 간격, 잠금 없는 계산 후 version 비교, (date, id) 순서."""
+import asyncio
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+import app
+import bench
+import history
+
+SCHEMA = (
+    "CREATE TABLE game (id INTEGER PRIMARY KEY AUTOINCREMENT, guild_id INTEGER NOT NULL, date TEXT NOT NULL)",
+    "CREATE TABLE game_detail (guild_id INTEGER NOT NULL, game_id INTEGER NOT NULL, user_id INTEGER NOT NULL, "
+    "score INTEGER NOT NULL, position INTEGER NOT NULL, PRIMARY KEY (guild_id, game_id, position))",
+    "CREATE TABLE player_rating (guild_id INTEGER NOT NULL, user_id INTEGER NOT NULL, rating REAL NOT NULL, "
+    "games INTEGER NOT NULL, PRIMARY KEY (guild_id, user_id))",
+    "CREATE TABLE rating_checkpoint (guild_id INTEGER NOT NULL, game_id INTEGER NOT NULL, game_date TEXT NULL, "
+    "user_id INTEGER NOT NULL, rating REAL NOT NULL, games INTEGER NOT NULL, PRIMARY KEY (guild_id, game_id, user_id))",
+    "CREATE TABLE rating_state (guild_id INTEGER PRIMARY KEY, last_game_id INTEGER NOT NULL DEFAULT 0, "
+    "last_date TEXT NULL, checkpoint_game_id INTEGER NOT NULL DEFAULT 0, dirty_from INTEGER NULL, "
+    "dirty_date TEXT NULL, version INTEGER NOT NULL DEFAULT 0, since_checkpoint INTEGER NOT NULL DEFAULT 0)",
+)
+GUILD, OTHER_GUILD = 1, 2
+EVERY = 50
+START = datetime(2025, 1, 1)
+
+def game_date(gid):
+    return START + timedelta(hours=gid)
+
+@pytest.fixture
+def pool(sqlite_pool, monkeypatch):
+    monkeypatch.setattr(app, "RATING_CHECKPOINT_GAMES", EVERY)
+    monkeypatch.setattr(app.stats, "workers", 0)
+    db = sqlite_pool.db
+    for sql in SCHEMA:
+        db.execute(sql)
+    # 두 길드 게임이 game_id 를 번갈아 씀: 체크포인트 간격은 길드 게임 수로 세야 함
+    rnd = random.Random(3)
+    games = {GUILD: [], OTHER_GUILD: []}
+    rows = bench.generate_games(1000, seed=2)
+    for gid, bucket in app.iter_groupby_game(rows):
+        guild = GUILD if rnd.random() < 0.3 else OTHER_GUILD
+        games[guild].append(bucket)
+        db.execute("INSERT INTO game (id, guild_id, date) VALUES (?,?,?)", (gid, guild, game_date(gid)))
+        db.executemany("INSERT INTO game_detail VALUES (?,?,?,?,?)", [(guild, *r) for r in bucket])
+    db.executemany("INSERT INTO rating_state (guild_id, dirty_from) VALUES (?, 0)", [(GUILD,), (OTHER_GUILD,)])
+    db.commit()
+    sqlite_pool.games = games
+    return sqlite_pool
+
+def expected_ratings(games):
+    ratings = {}
+    for bucket in games:
+        app.apply_rating_game(ratings, bucket)
+    return {uid: (r, n) for uid, (r, n) in ratings.items()}
+
+def stored(pool, guild_id):
+    return {u: (r, n) for u, r, n in pool.db.execute(
+        "SELECT user_id, rating, games FROM player_rating WHERE guild_id=?", (guild_id,))}
+
+def state(pool, guild_id):
+    return pool.db.execute(
+        "SELECT dirty_from, checkpoint_game_id, since_checkpoint, version FROM rating_state WHERE guild_id=?",
+        (guild_id,),
+    ).fetchone()
+
+def test_replay_counts_checkpoints_per_guild(pool):
+    games = pool.games[GUILD]
+    n = asyncio.run(app.replay_ratings(pool, GUILD))
+    assert n == len(games)
+    assert stored(pool, GUILD) == pytest.approx(expected_ratings(games))
+    cps = [g for (g,) in pool.db.execute(
+        "SELECT DISTINCT game_id FROM rating_checkpoint WHERE guild_id=? ORDER BY game_id", (GUILD,))]
+    assert cps == [games[i - 1][0][0] for i in range(EVERY, len(games) + 1, EVERY)]
+    dirty_from, ck, since, _ = state(pool, GUILD)
+    assert (dirty_from, ck, since) == (None, cps[-1], len(games) % EVERY)
+
+def test_replay_after_edit_starts_from_checkpoint(pool):
+    games = pool.games[GUILD]
+    asyncio.run(app.replay_ratings(pool, GUILD))
+    edited = games[-EVERY - 5]
+    old, new = edited[0][2], edited[1][2]
+    pool.db.executemany("UPDATE game_detail SET score=? WHERE guild_id=? AND game_id=? AND position=?",
+                        [(new, GUILD, edited[0][0], 0), (old, GUILD, edited[0][0], 1)])
+    pool.db.execute("UPDATE rating_state SET dirty_from=?, dirty_date=?, version=version+1 WHERE guild_id=?",
+                    (edited[0][0], game_date(edited[0][0]), GUILD))
+    pool.db.commit()
+    games[-EVERY - 5] = [(g, u, new if p == 0 else old if p == 1 else s, p) for g, u, s, p in edited]
+
+    n = asyncio.run(app.replay_ratings(pool, GUILD))
+    assert n < len(games)
+    assert stored(pool, GUILD) == pytest.approx(expected_ratings(games))
+
+def test_replay_recomputes_when_version_changes(pool, monkeypatch):
+    """계산 중 다른 커밋(version 증가)이 있으면 쓰지 않고 다시 계산."""
+    compute = app._replay_rating_games
+    calls = []
+
+    async def concurrent_commit(cur, guild_id, ck, ratings):
+        calls.append(ck)
+        if len(calls) == 1:
+            pool.db.execute("UPDATE rating_state SET version=version+1 WHERE guild_id=?", (guild_id,))
+        return await compute(cur, guild_id, ck, ratings)
+
+    monkeypatch.setattr(app, "_replay_rating_games", concurrent_commit)
+    assert asyncio.run(app.replay_ratings(pool, GUILD)) == len(pool.games[GUILD])
+    assert len(calls) == 2
+    assert stored(pool, GUILD) == pytest.approx(expected_ratings(pool.games[GUILD]))
+
+def test_replay_locks_on_last_attempt(pool, monkeypatch):
+    """계속 충돌해도 RATING_REPLAY_ATTEMPTS 번째(잠금)에서 끝남."""
+    monkeypatch.setattr(app, "RATING_REPLAY_ATTEMPTS", 3)
+    compute = app._replay_rating_games
+    calls = []
+
+    async def always_conflict(cur, guild_id, ck, ratings):
+        calls.append(ck)
+        pool.db.execute("UPDATE rating_state SET version=version+1 WHERE guild_id=?", (guild_id,))
+        return await compute(cur, guild_id, ck, ratings)
+
+    monkeypatch.setattr(app, "_replay_rating_games", always_conflict)
+    assert asyncio.run(app.replay_ratings(pool, GUILD)) == len(pool.games[GUILD])
+    assert len(calls) == 3
+    assert state(pool, GUILD)[0] is None
+
+def back_dated_games(n, before):
+    """before 보다 이른 날짜의 게임 n판 (history.Game 형식, 날짜 오름차순)."""
+    rows = bench.generate_games(n, seed=11)
+    return [(before - timedelta(minutes=30 * (n - i)), [(uid, sc) for _, uid, sc, _ in bucket])
+            for i, (_, bucket) in enumerate(app.iter_groupby_game(rows))]
+
+def test_back_dated_import_replays_in_date_order(pool, monkeypatch):
+    """기존 게임보다 이른 날짜로 입력한 게임은 id 가 커도 날짜 자리에서 계산."""
+    async def no_op(*_):
+        pass
+
+    monkeypatch.setattr(app, "apply_standings_deltas", no_op)
+    monkeypatch.setattr(app, "apply_pair_deltas", no_op)
+    monkeypatch.setattr(app, "apply_snapshot_games", no_op)
+    games = pool.games[GUILD]
+    asyncio.run(app.replay_ratings(pool, GUILD))
+    cut = games[len(games) // 2][0][0]
+    imported = back_dated_games(2 * EVERY + 7, game_date(cut))
+    asyncio.run(history.insert_chunk(pool, GUILD, imported[:EVERY]))
+    asyncio.run(history.insert_chunk(pool, GUILD, imported[EVERY:]))
+    dirty_from, dirty_date = pool.db.execute(
+        "SELECT dirty_from, dirty_date FROM rating_state WHERE guild_id=?", (GUILD,)).fetchone()
+    assert dirty_from > max(g[0][0] for g in games) and dirty_date == str(imported[0][0])
+
+    n = asyncio.run(app.replay_ratings(pool, GUILD))
+    new = [[(gid, uid, sc, pos) for pos, (uid, sc) in enumerate(seats)]
+           for gid, (_, seats) in enumerate(imported, dirty_from)]
+    dated = [(game_date(b[0][0]), b) for b in games] + [(d, b) for (d, _), b in zip(imported, new)]
+    ordered = [b for _, b in sorted(dated, key=lambda t: (t[0], t[1][0][0]))]
+    assert n < len(ordered)  # 입력한 날짜 이전 체크포인트부터
+    assert stored(pool, GUILD) == pytest.approx(expected_ratings(ordered))
+
+    # 체크포인트도 날짜 순서 위치: 처음부터 다시 계산한 결과와 같아야 함
+    assert asyncio.run(app.rebuild_ratings(pool, GUILD)) == len(ordered)
+    assert stored(pool, GUILD) == pytest.approx(expected_ratings(ordered))
@@ -0,0 +1,61 @@
+"""선수 이름 검색 인덱스와 점수입력검색 자동완성."""
+import asyncio
+import random
+from types import SimpleNamespace
+
+from discord import app_commands
+
+import app
+
+ROLE = "마작"
+
+def member(uid: int, name: str, *, nick: str | None = None, guild_id: int = 1, role: str = ROLE):
+    return SimpleNamespace(
+        id=uid, name=name, nick=nick, global_name=None, display_name=nick or name, bot=False,
+        roles=[SimpleNamespace(name=role)], guild=SimpleNamespace(id=guild_id),
+    )
+
+def random_members(n: int, seed: int = 1):
+    rnd = random.Random(seed)
+    syllables = ["김", "이", "박", "mah", "jong", "ron", "tsu", "mo", "리치", "쯔모"]
+    return [
+        member(10**17 + i, "".join(rnd.choices(syllables, k=3)),
+               nick="".join(rnd.choices(syllables, k=2)) if rnd.random() < 0.5 else None)
+        for i in range(n)
+    ]
+
+def test_rebuild_matches_incremental_add():
+    members = random_members(300)
+    built, added = app.NameIndex(), app.NameIndex()
+    built.rebuild(members)
+    for m in reversed(members):
+        added.add(m)
+    assert built._keys == added._keys == sorted(built._keys)
+    for q in ("김", "mah", "jong", "리치쯔", "ron", "없음"):
+        assert built.search(q) == added.search(q)
+
+def test_add_after_rebuild_replaces_names():
+    members = random_members(50)
+    idx = app.NameIndex()
+    idx.rebuild(members)
+    renamed = member(members[0].id, "zzz-renamed")
+    idx.add(renamed)
+    assert idx.search("zzz") == [renamed.id]
+    assert all(uid != renamed.id for _, uid in idx._keys if not _.startswith("zzz"))
+    assert idx._keys == sorted(idx._keys)
+
+def test_autocomplete_excludes_players_chosen_in_other_seats(monkeypatch):
+    members = [member(10**17 + i, f"player{i}") for i in range(6)]
+    guild = SimpleNamespace(id=1, members=members)
+    roster = app.RoleRoster(lambda _gid: ROLE)
+    monkeypatch.setattr(app.bot, "roster", roster)
+    # 디스코드는 rename 된 이름(동/서/남/북)으로 옵션 값을 보냄
+    options = [
+        {"type": 3, "name": app.POS_LABEL[0], "value": str(members[0].id)},
+        {"type": 3, "name": app.POS_LABEL[2], "value": str(members[3].id)},
+        {"type": 3, "name": app.POS_LABEL[1], "value": "player", "focused": True},
+    ]
+    raw = SimpleNamespace(_state=None, guild_id=guild.id, guild=guild)
+    interaction = SimpleNamespace(guild=guild, namespace=app_commands.Namespace(raw, {}, options))
+    choices = asyncio.run(app.player_autocomplete(interaction, "player"))
+    assert [c.value for c in choices] == [str(m.id) for m in members if m not in (members[0], members[3])]
@@ -0,0 +1,152 @@
+"""ScoreWriter 콜백 순서, 항목 오류 격리, 커밋된 항목의 game.date, 저장 중에 게시된 버튼(-jid)의 game_id 조회."""
+import asyncio
+import json
+import time
+
+import aiomysql
+import pytest
+
+import app
+
+def test_fetch_game_id_by_journal(sqlite_pool):
+    db = sqlite_pool.db
+    db.execute("CREATE TABLE game (id INTEGER PRIMARY KEY, guild_id INTEGER NOT NULL, journal_id INTEGER UNIQUE)")
+    db.executemany("INSERT INTO game (id, guild_id, journal_id) VALUES (?,?,?)",
+                   [(7, 1, 1700000000001), (8, 2, 1700000000002), (9, 1, None)])
+    db.commit()
+
+    async def check():
+        assert await app.fetch_game_id_by_journal(sqlite_pool, 1, 1700000000001) == 7
+        # 다른 길드의 저널 항목은 찾지 않음
+        assert await app.fetch_game_id_by_journal(sqlite_pool, 1, 1700000000002) is None
+        assert await app.fetch_game_id_by_journal(sqlite_pool, 1, 1700000000003) is None
+
+    asyncio.run(check())
+
+class Calls:
+    """ScoreWriter 콜백 기록. committed_ev 는 on_commit 이 불리면 설정."""
+    def __init__(self):
+        self.committed = []
+        self.messages = []
+        self.committed_ev = asyncio.Event()
+
+    async def on_commit(self, entry):
+        self.committed.append((entry.game_id, entry.message_id))
+        self.committed_ev.set()
+
+    async def on_message(self, entry):
+        self.messages.append((entry.game_id, entry.message_id))
+
+ROWS = [(10 + p, app.TARGET_TOTAL // 4, p) for p in range(4)]
+
+@pytest.fixture
+def gate(monkeypatch):
+    """DB 대신 game_id 만 채우는 commit_pending_games. 반환된 Event 가 설정될 때까지 커밋을 붙잡음."""
+    holder = {}
+
+    async def fake_commit(pool, batch):
+        await holder["gate"].wait()
+        for e in batch:
+            e.game_id = 1
+        return []
+
+    monkeypatch.setattr(app, "commit_pending_games", fake_commit)
+
+    def make():
+        holder["gate"] = asyncio.Event()
+        return holder["gate"]
+    return make
+
+async def run_writer(tmp_path, calls, gate, *, attach_first):
+    opened = gate()
+    writer = app.ScoreWriter(app.ScoreJournal(str(tmp_path / "data" / "score_journal.jsonl")), None,
+                             calls.on_commit, calls.on_message)
+    writer.start()
+    entry = await writer.submit(1, ROWS)
+    if attach_first:
+        await writer.attach_message(entry, 555, 777)
+        opened.set()
+        await calls.committed_ev.wait()
+    else:
+        opened.set()
+        await calls.committed_ev.wait()
+        await writer.attach_message(entry, 555, 777)
+    await writer.close()
+
+def test_attach_after_commit_only_edits_message(tmp_path, gate):
+    """보통 순서: 커밋이 Discord 전송보다 먼저 끝남 -> 커밋 콜백은 한 번, 메시지 콜백이 메시지만 갱신."""
+    calls = Calls()
+    asyncio.run(run_writer(tmp_path, calls, gate, attach_first=False))
+    assert calls.committed == [(1, None)]
+    assert calls.messages == [(1, 555)]
+
+def test_attach_before_commit_is_handled_by_commit(tmp_path, gate):
+    calls = Calls()
+    asyncio.run(run_writer(tmp_path, calls, gate, attach_first=True))
+    assert calls.committed == [(1, 555)]
+    assert calls.messages == []
+
+def test_commit_sets_game_date(sqlite_pool, monkeypatch):
+    """커밋된 항목은 DB 가 정한 game.date 를 가짐: 바로 수정해도 그 날짜부터 레이팅 재계산 (None = 처음부터)."""
+    async def no_op(*_):
+        return False
+
+    for name in ("apply_standings_deltas", "apply_pair_deltas", "apply_snapshots", "apply_ratings"):
+        monkeypatch.setattr(app, name, no_op)
+    db = sqlite_pool.db
+    db.execute("CREATE TABLE game (id INTEGER PRIMARY KEY AUTOINCREMENT, guild_id INTEGER NOT NULL, "
+               "date TEXT NOT NULL, journal_id INTEGER UNIQUE, version INTEGER NOT NULL DEFAULT 0)")
+    db.execute("CREATE TABLE game_detail (guild_id INTEGER, game_id INTEGER, user_id INTEGER, score INTEGER, "
+               "position INTEGER)")
+    db.commit()
+
+    async def run():
+        first = app.PendingGame(1, time.time(), ROWS, 1)
+        await app.commit_pending_games(sqlite_pool, [first])
+        # 저널 재생: 이미 커밋된 항목도 같은 날짜
+        again = app.PendingGame(1, time.time(), ROWS, 1)
+        await app.commit_pending_games(sqlite_pool, [again])
+        return first, again
+
+    first, again = asyncio.run(run())
+    (date,) = db.execute("SELECT date FROM game WHERE id=?", (first.game_id,)).fetchone()
+    assert first.date == again.date == date
+    assert again.game_id == first.game_id
+
+def test_failing_entry_is_quarantined(tmp_path, monkeypatch):
+    """제약 오류로 항상 실패하는 항목은 한 판씩 나눠 찾아 격리하고, 앞뒤 항목은 커밋."""
+    bad_user = 99
+    batches = []
+
+    async def fake_commit(pool, batch):
+        batches.append([e.jid for e in batch])
+        if any(e.rows[0][0] == bad_user for e in batch):
+            raise aiomysql.IntegrityError(1452, "foreign key constraint fails")
+        for e in batch:
+            e.game_id = e.jid
+        return []
+
+    monkeypatch.setattr(app, "commit_pending_games", fake_commit)
+    path = str(tmp_path / "score_journal.jsonl")
+    calls = Calls()
+
+    async def run():
+        writer = app.ScoreWriter(app.ScoreJournal(path), None, calls.on_commit, calls.on_message)
+        # 시작 전에 넣어 한 묶음으로 커밋되게 함
+        jids = [(await writer.submit(1, rows)).jid for rows in (ROWS, [(bad_user, *r[1:]) for r in ROWS], ROWS)]
+        writer.start()
+        while len(calls.committed) < 2:
+            await asyncio.wait_for(calls.committed_ev.wait(), 5)
+            calls.committed_ev.clear()
+        await writer.close()
+        return jids, writer
+
+    (good1, bad, good2), writer = asyncio.run(run())
+    assert batches == [[good1, bad, good2], [good1], [bad], [good2]]
+    assert [g for g, _ in calls.committed] == [good1, good2]
+    assert writer.backlog() == 0
+    # 재시작해도 다시 시도하지 않음. 격리 파일에는 저널 형식 그대로 + 오류
+    assert app.ScoreJournal(path).load() == {}
+    failed = [json.loads(line) for line in open(path + ".failed", encoding="utf-8")]
+    assert [(r["op"], r["jid"]) for r in failed] == [("game", bad)]
+    assert "IntegrityError" in failed[0]["error"]
@@ -0,0 +1,62 @@
+"""StandingsCache: 재계산 공유, 계산 중 무효화, 무효화 후 남는 상태."""
+import asyncio
+
+import app
+
+def test_concurrent_gets_share_one_recompute():
+    async def run():
+        cache = app.StandingsCache()
+        calls = 0
+
+        async def loader():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0)
+            return calls
+
+        results = await asyncio.gather(*(cache.get("all", loader) for _ in range(5)))
+        assert results == [1] * 5
+        assert await cache.get("all", loader) == 1
+        return cache
+
+    cache = asyncio.run(run())
+    assert (cache.recomputes, cache.shared, cache.hits) == (1, 4, 1)
+
+def test_key_invalidated_during_recompute_is_not_stored():
+    async def run():
+        cache = app.StandingsCache()
+        gate = asyncio.Event()
+        values = iter(["old", "new"])
+
+        async def loader():
+            v = next(values)
+            if v == "old":
+                await gate.wait()
+            return v
+
+        first = asyncio.ensure_future(cache.get(7, loader))
+        await asyncio.sleep(0)
+        cache.invalidate(7)
+        gate.set()
+        assert await first == "old"
+        assert await cache.get(7, loader) == "new"
+        assert await cache.get(7, loader) == "new"
+
+    asyncio.run(run())
+
+def test_invalidated_keys_leave_no_state():
+    async def run():
+        cache = app.StandingsCache()
+
+        async def loader():
+            return 0
+
+        for uid in range(1000):
+            await cache.get(uid, loader)
+            cache.invalidate(uid)
+        for uid in range(1000, 2000):
+            cache.invalidate(uid)
+        return cache
+
+    cache = asyncio.run(run())
+    assert not cache._entries and not cache._inflight
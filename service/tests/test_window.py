@@ -0,0 +1,99 @@
+"""기간 순위: 스냅샷+tail 경로(fetch_window_standings)와 전체 스캔(scan_window_standings) 비교."""
+import asyncio
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+import app
+import bench
+from test_ranking import tie_heavy_games
+
+SCHEMA = (
+    "CREATE TABLE game (id INTEGER PRIMARY KEY, guild_id INTEGER NOT NULL, date TIMESTAMP NOT NULL)",
+    "CREATE TABLE game_detail (guild_id INTEGER NOT NULL, game_id INTEGER NOT NULL, user_id INTEGER NOT NULL, "
+    "score INTEGER NOT NULL, position INTEGER NOT NULL)",
+    "CREATE TABLE standings_snapshot (guild_id INTEGER NOT NULL, snap_game_id INTEGER NOT NULL, "
+    "snap_date TIMESTAMP NOT NULL, user_id INTEGER NOT NULL, games INTEGER NOT NULL, score_sum INTEGER NOT NULL, "
+    "rank1 INTEGER NOT NULL, rank2 INTEGER NOT NULL, rank3 INTEGER NOT NULL, rank4 INTEGER NOT NULL, "
+    "PRIMARY KEY (guild_id, snap_game_id, user_id))",
+)
+GUILD, OTHER_GUILD = 1, 2
+T0 = datetime(2025, 1, 1)
+
+def load(pool, rows, *, seed: int, guild_id: int = GUILD):
+    """
+    게임마다 날짜를 붙여 저장. 같은 시각 게임이 여럿이고 id 순서와 날짜 순서가 어긋나게 해서
+    (date, id) 키 비교를 확인. return: 사용된 날짜 목록
+    """
+    rnd = random.Random(seed)
+    gids = sorted({r[0] for r in rows})
+    dates = {gid: T0 + timedelta(hours=rnd.randrange(len(gids) // 3 + 1)) for gid in gids}
+    db = pool.db
+    db.executemany("INSERT INTO game (id, guild_id, date) VALUES (?,?,?)", [(g, guild_id, dates[g]) for g in gids])
+    db.executemany("INSERT INTO game_detail VALUES (?,?,?,?,?)", [(guild_id, *r) for r in rows])
+    db.commit()
+    return sorted(set(dates.values()))
+
+@pytest.fixture
+def pool(sqlite_pool, monkeypatch):
+    monkeypatch.setattr(app, "SNAPSHOT_MIN_GAMES", 97)
+    for sql in SCHEMA:
+        sqlite_pool.db.execute(sql)
+    # 다른 길드 게임이 섞여도 결과에 영향 없어야 함
+    load(sqlite_pool, [(g + 10**6, u, s, p) for g, u, s, p in bench.generate_games(300, seed=9)],
+         seed=9, guild_id=OTHER_GUILD)
+    return sqlite_pool
+
+def windows(dates, rnd, n):
+    """경계가 게임 시각과 정확히 겹치는 기간, 빈 기간, 전체 기간을 포함."""
+    yield dates[0], dates[-1] + timedelta(hours=1)
+    yield dates[0] - timedelta(days=1), dates[0]
+    for _ in range(n):
+        a, b = sorted(rnd.sample(dates, 2))
+        yield a, b
+        yield a - timedelta(minutes=30), b + timedelta(minutes=30)
+
+@pytest.mark.parametrize("rows_fn", [
+    lambda: bench.generate_games(1500, seed=4),
+    lambda: tie_heavy_games(1500, seed=8),
+], ids=["random", "tie_heavy"])
+def test_window_matches_scan(pool, rows_fn):
+    dates = load(pool, rows_fn(), seed=1)
+
+    async def check():
+        for with_snapshots in (False, True):
+            if with_snapshots:
+                assert await app.rebuild_snapshots(pool, GUILD) > 5
+            rnd = random.Random(2)
+            for lo, hi in windows(dates, rnd, 20):
+                expected = await app.scan_window_standings(pool, GUILD, lo, hi)
+                assert await app.fetch_window_standings(pool, GUILD, lo, hi) == expected
+
+    asyncio.run(check())
+
+def test_window_after_edit_keeps_snapshots_consistent(pool):
+    """스냅샷에 포함된 과거 게임을 수정(apply_snapshots)해도 두 경로가 같음."""
+    rows = tie_heavy_games(800, seed=3)
+    dates = load(pool, rows, seed=5)
+    by_game = dict(app.iter_groupby_game(rows))
+
+    async def check():
+        await app.rebuild_snapshots(pool, GUILD)
+        rnd = random.Random(6)
+        for gid in rnd.sample(sorted(by_game), 40):
+            old = by_game[gid]
+            new = [(g, u, s, p) for (g, u, _, p), s in zip(old, rnd.sample([r[2] for r in old], 4))]
+            async with pool.acquire() as conn, conn.cursor() as cur:
+                await cur.executemany(
+                    "UPDATE game_detail SET score=%s WHERE guild_id=%s AND game_id=%s AND user_id=%s",
+                    [(s, GUILD, g, u) for g, u, s, _ in new],
+                )
+                await app.apply_snapshot_deltas(cur, GUILD, gid, app.standings_change(old, new))
+                await conn.commit()
+            by_game[gid] = new
+        for lo, hi in windows(dates, rnd, 20):
+            assert (await app.fetch_window_standings(pool, GUILD, lo, hi)
+                    == await app.scan_window_standings(pool, GUILD, lo, hi))
+
+    asyncio.run(check())